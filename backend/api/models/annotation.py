@@ -4,12 +4,17 @@ from sqlalchemy.ext.hybrid import hybrid_property
 
 
 class Annotation(db.Model):
+    __table_args__ = (
+        db.Index('ix_annotation_status_id', 'status', 'id'),
+        db.Index('ix_annotation_annotator_id_data_id', 'annotator_id', 'data_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     updated = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
     path = db.Column(db.String(255), nullable=False)
     comment = db.Column(db.String, nullable=True)
 
-    data_id = db.Column(db.Integer, db.ForeignKey('data.id', ondelete='CASCADE'), nullable=False)
+    data_id = db.Column(db.Integer, db.ForeignKey('data.id', ondelete='CASCADE'), nullable=False, index=True)
     annotator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
     status = db.Column(db.Integer, nullable=False, default=-1) # -1: unreviewd, 0: failed 1: selected
@@ -27,6 +32,6 @@ class Annotation(db.Model):
             'hashid': self.hashid,
             'data_name': self.data.name,
             'annotator_name': self.annotator.username,
-            'group_hashid': self.data.group.hashid,
+            'group_hashid': hashids.encode(self.data.group_id),
             'status': self.status,
         }
\ No newline at end of file
@@ -3,12 +3,31 @@ from datetime import datetime
 
 
 class Data(db.Model):
+    __table_args__ = (
+        # lookup by name in a group, and keyset pages of a status ordered by id
+        db.Index('ix_data_group_id_name', 'group_id', 'name'),
+        db.Index('ix_data_status_id', 'status', 'id'),
+        # task dispatch order, see api/utils/task_dispatch.py
+        db.Index('ix_data_status_group_id_id', 'status', 'group_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     status = db.Column(db.Integer, nullable=False) # 0: failed, 1: processed, 2: annotated 3: checked
     updated = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
     path = db.Column(db.String(255), nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('data_group.id', ondelete='CASCADE'), nullable=False)
+    # annotation lease, the task is free once lease_expires has passed
+    lease_owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    lease_expires = db.Column(db.DateTime, nullable=True)
+    lease_token = db.Column(db.String(32), nullable=True, index=True)
+    # raw trajectory summary written at ingestion, see api/utils/trajectory.py
+    # like the spatial index it covers the ingested data only, never the re-matches of annotators
+    summary = db.Column(db.JSON(none_as_null=True), nullable=True)
+    min_longitude = db.Column(db.Float, nullable=True)
+    min_latitude = db.Column(db.Float, nullable=True)
+    max_longitude = db.Column(db.Float, nullable=True)
+    max_latitude = db.Column(db.Float, nullable=True)
     annotations = db.relationship('Annotation', backref='data', lazy="dynamic", cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
@@ -0,0 +1,44 @@
+from app import db, hashids
+from datetime import datetime
+from sqlalchemy.ext.hybrid import hybrid_property
+
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.Integer, nullable=False, default=0, index=True) # 0: pending, 1: running, 2: finished, 3: failed
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    phase = db.Column(db.String(40), nullable=True)
+    phases = db.Column(db.JSON, nullable=False, default=dict) # phase name: seconds
+    progress = db.Column(db.JSON, nullable=False, default=dict)
+    error = db.Column(db.String, nullable=True)
+    worker = db.Column(db.String(80), nullable=True)
+
+    created = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    started = db.Column(db.DateTime, nullable=True)
+    finished = db.Column(db.DateTime, nullable=True)
+    updated = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+    group_id = db.Column(db.Integer, db.ForeignKey('data_group.id', ondelete='CASCADE'), nullable=True)
+
+    @hybrid_property
+    def hashid(self):
+        return hashids.encode(self.id)
+
+    def __repr__(self):
+        return '<Job {} {}>'.format(self.id, self.type)
+
+    def to_dict(self):
+        return {
+            'hashid': self.hashid,
+            'type': self.type,
+            'status': self.status,
+            'group_hashid': hashids.encode(self.group_id) if self.group_id else None,
+            'phase': self.phase,
+            'phases': self.phases,
+            'progress': self.progress,
+            'error': self.error,
+            'created': self.created.isoformat() if self.created else None,
+            'started': self.started.isoformat() if self.started else None,
+            'finished': self.finished.isoformat() if self.finished else None,
+        }
@@ -1,18 +1,14 @@
-from api.models.coordinate import Coordinate, TimestampCoordinate
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
 
 
 class SubTrajectory:
-    def __init__(self, trajectory_id):
+    def __init__(self, trajectory_id, trajectory: TrajectoryArray, begin_index: int, end_index: int):
         self.id = trajectory_id
-        self.trajectory: list[Coordinate] = []
-        self.begin_index = -1
-        self.end_index = -1
-
-    def append(self, coordinate, index):
-        self.trajectory.append(coordinate)
-        if self.begin_index == -1:
-            self.begin_index = index
-        self.end_index = index
+        self.begin_index = begin_index
+        self.end_index = end_index
+        # a view on the buffers of the parent trajectory, nothing is copied
+        self.trajectory: TrajectoryArray = trajectory[begin_index:end_index + 1]
 
     def __repr__(self):
         return "< id: %s start: %s end: %s traj: %s >" % (self.id, self.begin_index, self.end_index, self.trajectory)
@@ -22,7 +18,7 @@ class SubTrajectory:
             'id': self.id,
             # 'begin_index': self.begin_index,
             # 'end_index': self.end_index,
-            'trajectory': [coordinate.to_dict() for coordinate in self.trajectory]
+            'trajectory': self.trajectory.to_list()
         }
 
 class MatchingMethod:
@@ -30,7 +26,7 @@ class MatchingMethod:
         self.name: str = name
         self.path: str = path
         self.unmatched_trajs: list[SubTrajectory] = []
-        self.raw_traj: list[Coordinate] = []
+        self.raw_traj: TrajectoryArray = TrajectoryArray.empty(with_timestamp=False)
     
     def __str__(self):
             return "< name: %s >" % (self.name)
@@ -42,7 +38,7 @@ class MatchingMethod:
         return {
             'name': self.name,
             'unmatched_trajs': [failed_traj.to_dict() for failed_traj in self.unmatched_trajs],
-            'raw_traj': [coordinate.to_dict() for coordinate in self.raw_traj]
+            'raw_traj': self.raw_traj.to_list()
         }
 
 
@@ -53,7 +49,7 @@ class Trajectory:
         self.success: bool = False
         self.matching_method_dict: dict[str, MatchingMethod] = {}
         self.common_trajs: list[SubTrajectory] = []
-        self.raw_traj: list[TimestampCoordinate] = []
+        self.raw_traj: TrajectoryArray = TrajectoryArray.empty()
 
     def __eq__(self, other):
         if type(other) != type(self):
@@ -74,16 +70,13 @@ class Trajectory:
         right: float =  -180 
         bottom: float = 90
         top: float =  -90
-        for common_traj in self.common_trajs:
-            for coordinate in common_traj.trajectory:
-                if float(coordinate.longitude) < left:
-                    left = float(coordinate.longitude)
-                if float(coordinate.longitude) > right:
-                    right = float(coordinate.longitude)
-                if float(coordinate.latitude) < bottom:
-                    bottom = float(coordinate.latitude)
-                if float(coordinate.latitude) > top:
-                    top = float(coordinate.latitude)
+        # one min/max over all common trajectories instead of one per trajectory
+        common = [common_traj.trajectory for common_traj in self.common_trajs if len(common_traj.trajectory)]
+        if common:
+            longitude = np.concatenate([trajectory.longitude for trajectory in common])
+            latitude = np.concatenate([trajectory.latitude for trajectory in common])
+            left, right = float(longitude.min()), float(longitude.max())
+            bottom, top = float(latitude.min()), float(latitude.max())
 
         return {
             "name": self.name,
@@ -100,5 +93,5 @@ class Trajectory:
             },
             "matching_methods": [matching_method.to_dict() for matching_method in self.matching_method_dict.values()],
             "common_trajs": [success_traj.to_dict() for success_traj in self.common_trajs],
-            "raw_traj": [coordinate.to_dict() for coordinate in self.raw_traj]
+            "raw_traj": self.raw_traj.to_list()
         }
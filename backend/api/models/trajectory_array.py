@@ -0,0 +1,154 @@
+'''
+Author: MondayCha
+Date: 2022-05-04 10:21:37
+Description: Trajectories stored as contiguous float64/int64 columns
+'''
+import numpy as np
+
+
+class TrajectoryPoint:
+    """
+    Read-only view of one point of a TrajectoryArray.
+    """
+    __slots__ = ('_array', '_index')
+
+    def __init__(self, array, index: int):
+        self._array = array
+        self._index = index
+
+    @property
+    def longitude(self) -> float:
+        return float(self._array.longitude[self._index])
+
+    @property
+    def latitude(self) -> float:
+        return float(self._array.latitude[self._index])
+
+    @property
+    def timestamp(self):
+        if self._array.timestamp is None:
+            return None
+        return int(self._array.timestamp[self._index])
+
+    def key(self):
+        return (self.longitude, self.latitude, self.timestamp)
+
+    def __eq__(self, other):
+        if type(other) != type(self):
+            return False
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "<lon: %s, lat: %s, time: %s>" % self.key()
+
+    def to_dict(self):
+        point = {
+            'longitude': self.longitude,
+            'latitude': self.latitude
+        }
+        if self._array.timestamp is not None:
+            point['timestamp'] = self.timestamp
+        return point
+
+
+class TrajectoryArray:
+    """
+    Longitude and latitude in float64 columns, timestamp in an int64 column
+    (None for matcher outputs, which have no time).
+    Slicing with a step-less slice returns a view on the same buffers.
+    """
+    __slots__ = ('longitude', 'latitude', 'timestamp')
+
+    def __init__(self, longitude, latitude, timestamp=None):
+        self.longitude: np.ndarray = np.asarray(longitude, dtype=np.float64)
+        self.latitude: np.ndarray = np.asarray(latitude, dtype=np.float64)
+        self.timestamp: np.ndarray = None if timestamp is None else np.asarray(timestamp, dtype=np.int64)
+
+    @classmethod
+    def empty(cls, with_timestamp: bool = True):
+        return cls(np.empty(0), np.empty(0), np.empty(0, dtype=np.int64) if with_timestamp else None)
+
+    @classmethod
+    def from_table(cls, table: np.ndarray, with_timestamp: bool = True):
+        """
+        Build from a (n, 2) or (n, 3) float table, float timestamps are truncated.
+        """
+        table = np.asarray(table, dtype=np.float64).reshape(-1, 3 if with_timestamp else 2)
+        timestamp = table[:, 2].astype(np.int64) if with_timestamp else None
+        return cls(np.ascontiguousarray(table[:, 0]), np.ascontiguousarray(table[:, 1]), timestamp)
+
+    @classmethod
+    def concatenate(cls, arrays, with_timestamp: bool = True):
+        if not arrays:
+            return cls.empty(with_timestamp)
+        return cls(
+            np.concatenate([array.longitude for array in arrays]),
+            np.concatenate([array.latitude for array in arrays]),
+            np.concatenate([array.timestamp for array in arrays]) if with_timestamp else None)
+
+    @classmethod
+    def from_points(cls, points: list[dict]):
+        """
+        Build from frontend way points `{coordinates: [lon, lat], timestamp}`.
+        """
+        coordinates = np.array([point['coordinates'][:2] for point in points], dtype=np.float64).reshape(-1, 2)
+        timestamp = np.array([point['timestamp'] for point in points], dtype=np.float64).astype(np.int64)
+        return cls(np.ascontiguousarray(coordinates[:, 0]), np.ascontiguousarray(coordinates[:, 1]), timestamp)
+
+    def __len__(self):
+        return len(self.longitude)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TrajectoryArray(
+                self.longitude[index],
+                self.latitude[index],
+                None if self.timestamp is None else self.timestamp[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('trajectory index out of range')
+        return TrajectoryPoint(self, index)
+
+    def take(self, indexes) -> 'TrajectoryArray':
+        """
+        Copy of the points at `indexes`, e.g. a simplified trajectory.
+        """
+        return TrajectoryArray(
+            self.longitude.take(indexes),
+            self.latitude.take(indexes),
+            None if self.timestamp is None else self.timestamp.take(indexes))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TrajectoryPoint(self, index)
+
+    def __repr__(self):
+        return "<TrajectoryArray points: %s>" % len(self)
+
+    @property
+    def nbytes(self) -> int:
+        return self.longitude.nbytes + self.latitude.nbytes + (0 if self.timestamp is None else self.timestamp.nbytes)
+
+    def keys(self) -> list[tuple]:
+        """
+        Hashable (lon, lat) per point, used as LCS items.
+        """
+        return list(zip(self.longitude.tolist(), self.latitude.tolist()))
+
+    def bounds(self):
+        if len(self) == 0:
+            return None
+        return [[float(self.longitude.min()), float(self.latitude.min())],
+                [float(self.longitude.max()), float(self.latitude.max())]]
+
+    def to_list(self) -> list[dict]:
+        longitude = self.longitude.tolist()
+        latitude = self.latitude.tolist()
+        if self.timestamp is None:
+            return [{'longitude': lon, 'latitude': lat} for lon, lat in zip(longitude, latitude)]
+        return [{'longitude': lon, 'latitude': lat, 'timestamp': time}
+                for lon, lat, time in zip(longitude, latitude, self.timestamp.tolist())]
@@ -15,4 +15,5 @@ from . import (
     annotation,
     task,
     dataset,
+    job,
 )
\ No newline at end of file
@@ -2,6 +2,7 @@ from flask import request, current_app
 from app import db, hashids
 from flasgger import swag_from
 from flask_jwt_extended import jwt_required, current_user
+from sqlalchemy.orm import joinedload
 
 # Model
 from api.models.coordinate import Coordinate, TimestampCoordinate
@@ -11,8 +12,12 @@ from api.models.data import Data
 from api.models.method import Method
 
 # Utils
+from api.utils.dataset_export import schedule_export
 from api.utils.os_helper import *
+from api.utils.pagination import keyset_page, with_next_cursor
 from api.utils.request_handler import *
+from api.utils.serializer import dump
+from api.utils.task_dispatch import release_task
 from api.utils.trajectory import get_bounds
 from api.utils.matching_sdk import matching_for_data
 
@@ -67,8 +72,8 @@ def upload_annotation():
             input_traj_name = 'annotation-%s-%s.json' % (current_user.id, req_data_name)
             data_path = os.path.join(data_annotation_path, input_traj_name)
             user_path = os.path.join(data_annotation_path, 'user-%s.txt' % current_user.id)
-            with open(data_path, 'w') as f:
-                json.dump({
+            with open(data_path, 'wb') as f:
+                dump({
                     'group_hashid': req_group_hashid,
                     'data_name': req_data_name,
                     'trajectory': data_annotation,
@@ -99,6 +104,7 @@ def upload_annotation():
             db.session.commit()
             if current_data.status != 2:
                 current_data.status = 3 if current_user.usertype == 0 else 2
+                release_task(current_data)
                 db.session.add(current_data)
                 db.session.commit()
         elif req_comment is not None:
@@ -109,6 +115,8 @@ def upload_annotation():
                 same_annotation.status = -1
             db.session.add(same_annotation)
             db.session.commit()
+        if current_data.status == 3:
+            schedule_export(group_id)
 
         # Analysis
         for method in data_analysis:
@@ -144,16 +152,32 @@ def get_annotations():
     """
     Get annotations
     ---
+    parameters:
+      - in: query
+        name: size
+        description: page size, all remaining annotations when missing
+        schema:
+            type: integer
+      - in: query
+        name: cursor
+        description: X-Next-Cursor header of the previous page
+        schema:
+            type: string
     tags:
       - annotation
     """
     if request.method == 'GET':
         query_type = request.args.get('type') or -1  # -1: unreviewd, 0: failed 1: selected
+        query_size = request.args.get('size')
+        query_cursor = request.args.get('cursor')
         try:
-            annotations = Annotation.query.filter_by(status=query_type).all()
-            if annotations:
-                return good_request([annotation.to_dict() for annotation in annotations])
-            return good_request(detail=[])
+            query = Annotation.query.filter_by(status=query_type)\
+                .options(joinedload(Annotation.data).load_only(Data.name, Data.group_id), joinedload(Annotation.annotator))
+            annotations, next_cursor = keyset_page(query, Annotation.id, query_cursor, query_size)
+            response = good_request([annotation.to_dict() for annotation in annotations])
+            return with_next_cursor(response, next_cursor)
+        except ValueError:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.BAD_REQUEST, 'illegal params')
         except Exception:
             return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal task id')
     return bad_request()
@@ -237,6 +261,7 @@ def modify_annotation(hashid):
                 current_data.status = 3
                 db.session.add(current_data)
                 db.session.commit()
+                schedule_export(current_data.group_id)
             return good_request()
         except Exception:
             return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal task id')
@@ -1,23 +1,30 @@
 import json
 import os
-from datetime import datetime
-from flask import request, g, current_app
-from werkzeug.utils import secure_filename
-from api.models.coordinate import Coordinate, TimestampCoordinate
+import shutil
+import sqlite3
+from flask import request, current_app
 from api.models.data_group import DataGroup
 from api.models.data import Data
 from api.models.method import Method
-from api.models.trajectory import MatchingMethod, Trajectory
-from api.utils.matching_sdk import matching_for_group
+from api.utils.ingestion import write_data_group_detail
+from api.utils.job_queue import enqueue_job
 from api.utils.os_helper import *
+from api.utils.pagination import keyset_page, with_next_cursor
+from api.utils.pre_annotation import RANKING_FILE
 from api.utils.request_handler import *
-from api.utils.trajectory import get_bounds
+from api.utils.response_cache import cached_file_response
+from api.utils.spatial_index import SpatialIndex, get_spatial_index_path
+from api.utils.trajectory import parse_bbox
+from api.utils.upload import UploadSession, UploadTooLarge, get_upload_pool, receive_upload
 from app import db, hashids
 from flasgger import swag_from
 from flask_jwt_extended import jwt_required
 
 from . import bp
 
+# multipart boundaries and part headers on top of the files
+UPLOAD_OVERHEAD_BYTES = 1024 * 1024
+
 
 @bp.before_app_first_request
 def init_data_group():
@@ -33,136 +40,23 @@ def init_data_group():
         new_group = DataGroup(osm_path=current_app.config.get('IEEE_2015_PATH'))
         db.session.add(new_group)
         db.session.commit()
-        g.group = new_group
         group_hashid = hashids.encode(new_group.id)
         create_data_group_folder(new_group.id)
-        output_path = get_output_path(new_group.id)
 
         trajectory_list = []
         for root, dirs, _ in os.walk(new_group.osm_path):
             for id in dirs:
                 track_path = os.path.join(root, id, '%s.track' % id)
-                trajectory_list.append(Trajectory('%s.track' % id, track_path))
-        ########## call sdk for map-matching
-        # matching_methods = current_app.config.get('MATCHING_METHODS')
-        # for root, dirs, _ in os.walk(new_group.osm_path):
-        #     dirs.sort()
-        #     for id in dirs:
-        #         arcs_path = os.path.join(root, id, '%s.arcs' % id)
-        #         nodes_path = os.path.join(root, id, '%s.nodes' % id)
-        #         track_path = os.path.join(root, id, '%s.track' % id)
-        #         trajectory_list.append(Trajectory('%s.track' % id, track_path))
-        #         loading_cmd = 'java -cp %s com.example.ImportMatchingDataset --graphHopperLocation=/tmp/lowlevel-graph %s %s' % (current_app.config.get('SDK_IEEE_PATH'), nodes_path, arcs_path)
-        #         matching_code, matching_dict = cmd(loading_cmd)
-        #         if matching_code == 1:
-        #             current_app.logger.debug(matching_dict['stderr'])
-        #             continue
-        #         for matching_method in matching_methods:
-        #             id_output_path = os.path.join(output_path, '%s-%s.track' % (matching_method, id))
-        #             running_cmd = 'java -cp %s com.example.RunMatchingDataset --graphHopperLocation=/tmp/lowlevel-graph --matcher %s --output=%s %s' % (current_app.config.get('SDK_IEEE_PATH'), matching_method, id_output_path, track_path)
-        #             matching_code, matching_dict = cmd(running_cmd)
-        #             current_app.logger.debug('[IEEE] %s: %s' % (matching_method, id))
-        #             if matching_code == 1:
-        #                 current_app.logger.debug('[Matching]', matching_dict['stderr'])
-        #                 continue
-        
+                trajectory_list.append(['%s.track' % id, track_path])
         current_app.logger.debug('[IEEE] trajectory_list %s' % trajectory_list)
-        matching_method_names = current_app.config.get('MATCHING_METHODS')
-        success_trajectory_list: list[Trajectory] = []
-        failed_trajectory_list: list[Trajectory] = []
-        for trajectory in trajectory_list:
-            success_matching_time = 0
-            for method_name in matching_method_names:
-                matching_method_path = os.path.join(output_path, "%s-%s" % (method_name, trajectory.name))
-                if os.path.exists(matching_method_path):
-                    trajectory.matching_method_dict[method_name] = MatchingMethod(method_name, matching_method_path)
-                    success_matching_time += 1
-            if success_matching_time >= 2:
-                trajectory.success = True
-                success_trajectory_list.append(trajectory)
-            else:
-                failed_trajectory_list.append(trajectory)
-
-        for trajectory in success_trajectory_list:
-            lcss_method_names: list[str] = []
-            lcss_inputs: list[list[Coordinate]] = []
-            lcss_dicts: list[dict] = []
-
-            # Read raw GPS trajectory
-            # |-------------|-----------|------------|
-            # | longitude   | latitude  | timestamp  |
-            # |-------------|-----------|------------|
-            # | 116.33073   | 39.97568  | 1183524462 |
-            # |-------------|-----------|------------|
-            with open(trajectory.path, 'r') as f:
-                for line in f:
-                    line_list = line.replace('\n', '').strip().split('\t')
-                    if len(line_list) != 3:
-                        current_app.logger.error('[%s] Invalid raw line: %s' % (trajectory.name, line))
-                        continue
-                    trajectory.raw_traj.append(TimestampCoordinate(line_list[0], line_list[1], str(int(float(line_list[2])))))
-                f.close()
-
-            # Read Coordinates for each matching method
-            for matching_method in trajectory.matching_method_dict.values():
-                lcss_input : list[Coordinate] = []
-                try:
-                    with open(matching_method.path, 'r') as f:
-                        for line in f:
-                            line_list = line.replace('\n', '').strip().split(' ')
-                            if len(line_list) != 2:
-                                continue
-                            lcss_input.append(Coordinate(line_list[0], line_list[1]))
-                        f.close()
-                    lcss_method_names.append(matching_method.name)
-                    lcss_inputs.append(lcss_input)
-                    matching_method.raw_traj = lcss_input
-                except Exception:
-                    current_app.logger.error('[LCSS] Unable to read: %s' % matching_method.path)
-                    continue
-            
-            multiple_matching_list = []
-            for i in range(0, len(lcss_method_names)):
-                multiple_matching_list.append({
-                    'method_name': lcss_method_names[i],
-                    'trajectory': [result.to_dict() for result in lcss_inputs[i]]
-                })
-
-            multiple_matching_dict = {
-                'group_id': group_hashid,
-                'traj_name': trajectory.name,
-                'bounds': get_bounds(trajectory.raw_traj),
-                'raw_traj': [result.to_dict() for result in trajectory.raw_traj],
-                'matching_result': multiple_matching_list
-            }
-
-            # Write Coordinates
-            with open(os.path.join(get_matching_path(new_group.id), '%s.json' % trajectory.name), 'w') as f:
-                json.dump(multiple_matching_dict, f)
-                f.close()
-            
-            # Save to database
-            new_success_data = Data(name=trajectory.name, path=trajectory.path, group_id=new_group.id, status=1)
-            db.session.add(new_success_data)
-            db.session.commit()
-
-        for trajectory in failed_trajectory_list:
-            new_failed_data = Data(name=trajectory.name, path=trajectory.path, group_id=new_group.id, status=0)
-            db.session.add(new_failed_data)
-            db.session.commit()
-
-        # Write to disk
-        request_detail = {
-            'group_id': group_hashid,
-            'matching_result': {
-                'success': [ traj.name for traj in success_trajectory_list ],
-                'failed': [ traj.name for traj in failed_trajectory_list ]
-            },
-        }
 
-        with open(os.path.join(get_data_group_path(new_group.id), '%s.json' % new_group.id), 'w') as f:
-            json.dump(request_detail, f)
-            f.close()
+        # matching outputs of the IEEE dataset are prepared offline
+        write_data_group_detail(new_group.id, group_hashid, [], [], False)
+        enqueue_job('data_group', new_group.id, {
+            'trajectories': trajectory_list,
+            'matching': False,
+            'raw_format': 'ieee',
+        })
 
 
 @bp.route('/data_groups', methods=['POST'])
@@ -177,143 +71,53 @@ def init_data_group():
 def data_group():
     """
     Create New Data Group
-    - Save datas to file system
-    - Call matching sdk
+    - Save datas to file system while they are received, `.zip` / `.tar.gz` bundles are extracted
     - Create new data group in database
+    - Queue a job for map-matching, poll it with /api/jobs/<job_id>
     ---
     """
     if request.method == 'POST':
-        # get all params and formdata
-        req_upload_files = request.files.getlist('files')
+        boundary = request.mimetype_params.get('boundary')
+        max_bytes = current_app.config.get('UPLOAD_MAX_BYTES')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.BAD_REQUEST, 'multipart files required')
+        if request.content_length is not None and request.content_length > max_bytes + UPLOAD_OVERHEAD_BYTES:
+            return bad_request(RETStatus.DATA_INVALID, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'upload is larger than %s bytes' % max_bytes)
 
         # create data group folder
         new_group = DataGroup(osm_path=current_app.config.get('OSM_FILE_PATH'))
         db.session.add(new_group)
         db.session.commit()
-        g.group = new_group
         group_hashid = hashids.encode(new_group.id)
         create_data_group_folder(new_group.id)
         input_path = get_input_path(new_group.id)
-        output_path = get_output_path(new_group.id)
-
-        # store input files
-        trajectory_list: list[Trajectory] = []
-        for file in req_upload_files:
-            try:
-                secure_name = secure_filename(file.filename)
-                file_path = os.path.join(input_path, secure_name)
-                file.save(file_path)
-                trajectory_list.append(Trajectory(secure_name, file_path))
-            except Exception:
-                current_app.logger.error('Unable to save: %s' % file.filename)
-                continue
-
-        # call sdk for map-matching
-        time_start_map_matching = datetime.now()
-        matching_sdk_code, matching_sdk_dict = matching_for_group(new_group.osm_path)
-        if matching_sdk_code == 1:
-            return bad_request(status_code=HTTPStatus.INTERNAL_SERVER_ERROR,ret_status_code=RETStatus.SDK_ERR, detail=matching_sdk_dict)
-        
-        matching_method_names = current_app.config.get('MATCHING_METHODS')
-        success_trajectory_list: list[Trajectory] = []
-        failed_trajectory_list: list[Trajectory] = []
-        for trajectory in trajectory_list:
-            success_matching_time = 0
-            for method_name in matching_method_names:
-                matching_method_path = os.path.join(output_path, "%s-%s" % (method_name, trajectory.name))
-                if os.path.exists(matching_method_path):
-                    trajectory.matching_method_dict[method_name] = MatchingMethod(method_name, matching_method_path)
-                    success_matching_time += 1
-            if success_matching_time >= 2:
-                trajectory.success = True
-                success_trajectory_list.append(trajectory)
-            else:
-                failed_trajectory_list.append(trajectory)
-        
-        time_end_map_matching = datetime.now()
-        current_app.logger.info('Map matching time: %s' % (time_end_map_matching - time_start_map_matching).seconds)
-
-        for trajectory in success_trajectory_list:
-            lcss_method_names: list[str] = []
-            lcss_inputs: list[list[Coordinate]] = []
-            lcss_dicts: list[dict] = []
-
-            # Read raw GPS trajectory
-            # |-------------|-----------|------------|
-            # | longitude   | latitude  | timestamp  |
-            # |-------------|-----------|------------|
-            # | 116.33073   | 39.97568  | 1183524462 |
-            # |-------------|-----------|------------|
-            with open(os.path.join(get_input_path(new_group.id), trajectory.name), 'r') as f:
-                for line in f:
-                    line_list = line.replace('\n', '').strip().split(',')
-                    if len(line_list) != 3:
-                        current_app.logger.error('[%s] Invalid raw line: %s' % (trajectory.name, line))
-                        continue
-                    trajectory.raw_traj.append(TimestampCoordinate(line_list[0], line_list[1], line_list[2]))
-                f.close()
-
-            # Read Coordinates for each matching method
-            for matching_method in trajectory.matching_method_dict.values():
-                lcss_input : list[Coordinate] = []
-                try:
-                    with open(matching_method.path, 'r') as f:
-                        for line in f:
-                            line_list = line.replace('\n', '').strip().split(' ')
-                            if len(line_list) != 2:
-                                continue
-                            lcss_input.append(Coordinate(line_list[0], line_list[1]))
-                        f.close()
-                    lcss_method_names.append(matching_method.name)
-                    lcss_inputs.append(lcss_input)
-                    matching_method.raw_traj = lcss_input
-                except Exception:
-                    current_app.logger.error('[LCSS] Unable to read: %s' % matching_method.path)
-                    continue
-            
-            multiple_matching_list = []
-            for i in range(0, len(lcss_method_names)):
-                multiple_matching_list.append({
-                    'method_name': lcss_method_names[i],
-                    'trajectory': [result.to_dict() for result in lcss_inputs[i]]
-                })
-
-            multiple_matching_dict = {
-                'group_id': group_hashid,
-                'traj_name': trajectory.name,
-                'bounds': get_bounds(trajectory.raw_traj),
-                'raw_traj': [result.to_dict() for result in trajectory.raw_traj],
-                'matching_result': multiple_matching_list
-            }
-
-            # Write Coordinates
-            with open(os.path.join(get_matching_path(new_group.id), '%s.json' % trajectory.name), 'w') as f:
-                json.dump(multiple_matching_dict, f)
-                f.close()
-            
-            # Save to database
-            new_success_data = Data(name=trajectory.name, path=trajectory.path, group_id=new_group.id, status=1)
-            db.session.add(new_success_data)
-            db.session.commit()
 
-        for trajectory in failed_trajectory_list:
-            new_failed_data = Data(name=trajectory.name, path=trajectory.path, group_id=new_group.id, status=0)
-            db.session.add(new_failed_data)
+        # store input files while they arrive, validate each one in the upload pool
+        session = UploadSession(input_path, 'csv', current_app.config.get('UPLOAD_FILE_MAX_BYTES'), max_bytes,
+                                get_upload_pool(current_app.config.get('UPLOAD_WORKERS')))
+        try:
+            receive_upload(request.stream, boundary.encode('latin-1'), session,
+                           os.path.join(get_data_group_path(new_group.id), 'bundle'))
+            trajectory_list = session.results()
+        except Exception as e:
+            session.discard()
+            shutil.rmtree(get_data_group_path(new_group.id), ignore_errors=True)
+            db.session.delete(new_group)
             db.session.commit()
-
-        # Write to disk
-        request_detail = {
-            'group_id': group_hashid,
-            'matching_result': {
-                'success': [ traj.name for traj in success_trajectory_list ],
-                'failed': [ traj.name for traj in failed_trajectory_list ]
-            },
-        }
-
-        with open(os.path.join(get_data_group_path(new_group.id), '%s.json' % new_group.id), 'w') as f:
-            json.dump(request_detail, f)
-            f.close()
-
+            if isinstance(e, UploadTooLarge):
+                return bad_request(RETStatus.DATA_INVALID, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, str(e))
+            current_app.logger.error('Unable to save upload: %s' % e)
+            return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.BAD_REQUEST, 'unable to save upload')
+        for name, reason in session.rejected.items():
+            current_app.logger.error('Rejected %s: %s' % (name, reason))
+
+        request_detail = write_data_group_detail(new_group.id, group_hashid, [], [], False)
+        job = enqueue_job('data_group', new_group.id, {
+            'trajectories': trajectory_list,
+            'raw_format': 'csv',
+        })
+        request_detail['job_id'] = job.hashid
+        request_detail['rejected'] = session.rejected
         return good_request(detail=request_detail)
 
 
@@ -354,8 +158,187 @@ def get_data_group(group_hashid):
         if not os.path.exists(json_file_path):
             return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.NOT_FOUND, 'tarj not found')
         
-        data_group_info = json.load(open(json_file_path, 'r'))
         current_app.logger.debug('[api/data_groups/%s]: %s' % (group_hashid, group_id))
 
-        return good_request(data_group_info)
-    return bad_request()
\ No newline at end of file
+        def build():
+            # the file is already the json detail, wrap it like good_request()
+            with open(json_file_path, 'r') as f:
+                return '{"status_code": %d, "detail": %s}' % (RETStatus.SUCCESS, f.read())
+
+        return cached_file_response(json_file_path, build)
+    return bad_request()
+
+@bp.route('/data_groups/<group_hashid>/pre_annotation', methods=['GET'])
+@swag_from({
+    'responses': {
+        HTTPStatus.OK.value: {
+            'description': 'trajectories of the group ranked by mismatch',
+        }
+    }
+})
+@jwt_required()
+def get_data_group_pre_annotation(group_hashid):
+    """
+    Get the pre-annotation ranking of a data group, most mismatched first
+    ---
+    parameters:
+      - in: path
+        name: group_hashid
+        required: true
+        description: group hash id
+        schema:
+            type: string
+    tags:
+      - api
+    """
+    try:
+        group_id = hashids.decode(group_hashid)[0]
+    except Exception:
+        return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal group id')
+
+    ranking_path = os.path.join(get_data_group_path(group_id), RANKING_FILE)
+    if not os.path.exists(ranking_path):
+        return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.NOT_FOUND, 'pre-annotation not found')
+
+    def build():
+        with open(ranking_path, 'r') as f:
+            return '{"status_code": %d, "detail": %s}' % (RETStatus.SUCCESS, f.read())
+
+    return cached_file_response(ranking_path, build)
+
+
+@bp.route('/data_groups/<group_hashid>/datas', methods=['GET'])
+@swag_from({
+    'responses': {
+        HTTPStatus.OK.value: {
+            'description': 'datas of the group with their summaries',
+        }
+    }
+})
+@jwt_required()
+def get_data_group_datas(group_hashid):
+    """
+    List the datas of a group with the summary stored at ingestion, no trajectory is loaded
+    - Summaries describe the raw trajectory as ingested, re-matches of annotators do not change them
+    - The bbox filter compares bounding boxes of the raw trajectory, /search tests the segments of
+      the raw trajectory and of the matcher outputs, so it can find fewer or more datas
+    ---
+    parameters:
+      - in: path
+        name: group_hashid
+        required: true
+        description: group hash id
+        schema:
+            type: string
+      - in: query
+        name: status
+        description: only datas of this status
+        schema:
+            type: integer
+      - in: query
+        name: bbox
+        description: min_lon,min_lat,max_lon,max_lat, only datas whose raw trajectory bbox intersects it
+        schema:
+            type: string
+      - in: query
+        name: size
+        description: page size, all remaining datas when missing
+        schema:
+            type: integer
+      - in: query
+        name: cursor
+        description: X-Next-Cursor header of the previous page
+        schema:
+            type: string
+    tags:
+      - api
+    """
+    try:
+        group_id = hashids.decode(group_hashid)[0]
+    except Exception:
+        return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal group id')
+
+    try:
+        query = db.session.query(Data.id, Data.name, Data.status, Data.summary).filter(Data.group_id == group_id)
+        if request.args.get('status') is not None:
+            query = query.filter(Data.status == int(request.args.get('status')))
+        if request.args.get('bbox'):
+            min_lon, min_lat, max_lon, max_lat = parse_bbox(request.args.get('bbox'))
+            query = query.filter(Data.min_longitude <= max_lon, Data.max_longitude >= min_lon,
+                                 Data.min_latitude <= max_lat, Data.max_latitude >= min_lat)
+        datas, next_cursor = keyset_page(query, Data.id, request.args.get('cursor'), request.args.get('size'))
+    except ValueError:
+        return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.BAD_REQUEST, 'illegal params')
+    response = good_request([{'name': data.name, 'status': data.status, 'summary': data.summary} for data in datas])
+    return with_next_cursor(response, next_cursor)
+
+
+@bp.route('/data_groups/<group_hashid>/search', methods=['GET'])
+@swag_from({
+    'responses': {
+        HTTPStatus.OK.value: {
+            'description': 'trajectories of the group in a bbox or near a point',
+        }
+    }
+})
+@jwt_required()
+def search_data_group(group_hashid):
+    """
+    Search the trajectories of a group with its spatial index
+    ---
+    parameters:
+      - in: path
+        name: group_hashid
+        required: true
+        description: group hash id
+        schema:
+            type: string
+      - in: query
+        name: bbox
+        description: min_lon,min_lat,max_lon,max_lat, trajectories crossing it
+        schema:
+            type: string
+      - in: query
+        name: point
+        description: lon,lat, trajectories passing within radius of it
+        schema:
+            type: string
+      - in: query
+        name: radius
+        description: meters around point (default 50)
+        schema:
+            type: number
+      - in: query
+        name: source
+        description: comma separated sources, raw and/or matching methods (all by default)
+        schema:
+            type: string
+    tags:
+      - api
+    """
+    try:
+        group_id = hashids.decode(group_hashid)[0]
+    except Exception:
+        return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal group id')
+
+    index_path = get_spatial_index_path(group_id)
+    if not os.path.exists(index_path):
+        return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.NOT_FOUND, 'spatial index not found')
+
+    sources = [source for source in (request.args.get('source') or '').split(',') if source]
+    try:
+        with SpatialIndex(index_path) as spatial_index:
+            if request.args.get('bbox'):
+                results = spatial_index.search_bbox(parse_bbox(request.args.get('bbox')), sources)
+            elif request.args.get('point'):
+                longitude, latitude = [float(part) for part in request.args.get('point').split(',')]
+                results = spatial_index.search_point(longitude, latitude, float(request.args.get('radius') or 50), sources)
+            else:
+                return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.BAD_REQUEST, 'missing bbox or point')
+    except ValueError:
+        return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.BAD_REQUEST, 'illegal params')
+    except sqlite3.DatabaseError as e:
+        # OperationalError when locked past the timeout, DatabaseError when the file is damaged
+        current_app.logger.error('[SpatialIndex] group %s: %s' % (group_id, e))
+        return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.SERVICE_UNAVAILABLE, 'spatial index unavailable')
+    return good_request(results)
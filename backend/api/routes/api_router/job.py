@@ -0,0 +1,61 @@
+from flask import request, current_app
+from app import hashids
+from flasgger import swag_from
+from flask_jwt_extended import jwt_required
+
+# Model
+from api.models.job import Job
+
+# Utils
+from api.utils.request_handler import *
+from api.utils.job_queue import start_job_workers
+
+from . import bp
+
+
+@bp.before_app_first_request
+def init_job_workers():
+    """
+    Start background job workers next to a single-process web server, see JOB_WORKERS_IN_WEB.
+    """
+    if current_app.config.get('JOB_WORKERS_IN_WEB'):
+        start_job_workers(current_app._get_current_object())
+
+
+@bp.route('/jobs/<hashid>', methods=['GET'])
+@swag_from({
+    'responses': {
+        HTTPStatus.OK.value: {
+            'description': 'get job progress',
+        }
+    }
+})
+@jwt_required()
+def get_job(hashid):
+    """
+    Get job status, phase timings and per-trajectory progress
+    ---
+    parameters:
+      - in: path
+        name: hashid
+        required: true
+        description: job hash id
+        schema:
+            type: string
+    tags:
+      - api
+    """
+    if request.method == 'GET':
+        if hashid is None:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'missing params')
+
+        try:
+            job_id = hashids.decode(hashid)[0]
+        except Exception:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal job id')
+
+        job = Job.query.get(job_id)
+        if job is None:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'job not found')
+        return good_request(job.to_dict())
+    return bad_request()
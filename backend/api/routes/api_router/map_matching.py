@@ -4,7 +4,7 @@ Date: 2022-04-30 22:53:59
 Description: Get Map-Matching SDK Result
 '''
 from flask import request, current_app
-from api.models.coordinate import Coordinate, TimestampCoordinate
+from api.models.trajectory_array import TrajectoryArray
 from api.models.data_group import DataGroup
 from api.utils.matching_sdk import matching_for_data
 from app import db, hashids
@@ -14,7 +14,11 @@ from flask_jwt_extended import jwt_required, current_user
 # Utils
 from api.utils.os_helper import *
 from api.utils.request_handler import *
+from api.utils.response_cache import cached_file_response
 from api.utils.trajectory import get_bounds
+from api.utils.track_reader import read_track
+from api.utils.matching_store import MatchingSidecar, get_json_path, get_sidecar_path, sidecar_from_json, write_sidecar
+from api.utils.simplification import simplify_matching_result
 
 # System
 import os
@@ -45,17 +49,39 @@ def get_data_map_matching(group_hashid, data_name):
         except Exception:
             return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal task id')
 
-        json_file_path = os.path.join(get_matching_path(group_id), '%s.json' % data_name)
-        if not os.path.exists(json_file_path):
-            return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.NOT_FOUND, 'matching for data not found')
-        
-        matching_detail = json.load(open(json_file_path, 'r'))
-        current_app.logger.debug('[api/trajs]: %s' % matching_detail['traj_name'])
+        sidecar_path = get_sidecar_path(get_matching_path(group_id), data_name)
+        if not os.path.exists(sidecar_path):
+            # groups ingested before the sidecar only have the json
+            json_file_path = get_json_path(get_matching_path(group_id), data_name)
+            if not os.path.exists(json_file_path):
+                return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.NOT_FOUND, 'matching for data not found')
+            try:
+                sidecar_from_json(json_file_path, sidecar_path)
+            except Exception as e:
+                # serve the json as it is, the conversion is tried again on the next request
+                current_app.logger.warning('[api/trajs]: unable to convert %s: %s' % (json_file_path, e))
+                return serve_matching_json(json_file_path)
+
+        current_app.logger.debug('[api/trajs]: %s' % data_name)
 
-        return good_request(matching_detail)
+        try:
+            return cached_file_response(sidecar_path, lambda: MatchingSidecar(sidecar_path).iter_json(RETStatus.SUCCESS))
+        except Exception:
+            return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.INTERNAL_SERVER_ERROR, 'broken matching for data')
     return bad_request()
 
 
+def serve_matching_json(json_file_path: str):
+    def build():
+        with open(json_file_path, 'r') as f:
+            return '{"status_code": %d, "detail": %s}' % (RETStatus.SUCCESS, f.read())
+
+    try:
+        return cached_file_response(json_file_path, build)
+    except Exception:
+        return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.INTERNAL_SERVER_ERROR, 'broken matching for data')
+
+
 @bp.route('/matching', methods=['POST'])
 @swag_from({
     'responses': {
@@ -124,22 +150,13 @@ def map_matching():
         matching_method_names = current_app.config.get('MATCHING_METHODS')
         success_matching_time = 0
         multiple_matching_list = []
+        matching_results = []
         for method_name in matching_method_names:
             matching_method_path = os.path.join(output_path, "%s-%s" % (method_name, input_traj_name))
             if os.path.exists(matching_method_path):
                 try:
-                    matching_result: list[Coordinate] = []
-                    with open(matching_method_path, 'r') as f:
-                        for line in f:
-                            line_list = line.replace('\n', '').strip().split(' ')
-                            if len(line_list) != 2:
-                                continue
-                            matching_result.append(Coordinate(line_list[0], line_list[1]))
-                        f.close()
-                    multiple_matching_list.append({
-                        'method_name': method_name,
-                        'trajectory': [result.to_dict() for result in matching_result]
-                    })
+                    matching_result = read_track(matching_method_path, 'matching')
+                    matching_results.append((method_name, matching_result))
                 except Exception:
                     current_app.logger.error('[Matching] Unable to read: %s' % matching_method_path)
                     continue
@@ -148,21 +165,28 @@ def map_matching():
         if success_matching_time < 2:
             return bad_request(status_code=HTTPStatus.INTERNAL_SERVER_ERROR,ret_status_code=RETStatus.SDK_ERR, detail='matching failed')
         
-        modify_traj = [TimestampCoordinate(way_point['coordinates'][0], way_point['coordinates'][1], way_point['timestamp'])\
-            for way_point in way_points]
+        # serve the simplified outputs, the sidecar keeps the original points
+        simplified = simplify_matching_result(matching_results, current_app.config.get('MATCHING_SIMPLIFY_MODE'),
+                                              current_app.config.get('MATCHING_SIMPLIFY_TOLERANCE'))
+        for (method_name, matching_result), indexes in zip(matching_results, simplified):
+            multiple_matching_list.append({
+                'method_name': method_name,
+                'trajectory': matching_result if indexes is None else matching_result.take(indexes)
+            })
+
+        modify_traj = TrajectoryArray.from_points(way_points)
 
         multiple_matching_dict = {
             'group_id': req_group_hashid,
             'traj_name': input_traj_name,
             'bounds': get_bounds(modify_traj),
-            'raw_traj': [result.to_dict() for result in modify_traj],
+            'raw_traj': modify_traj,
             'matching_result': multiple_matching_list
         }
 
         # Write Coordinates
-        with open(os.path.join(matching_path, '%s.json' % input_traj_name), 'w') as f:
-            json.dump(multiple_matching_dict, f)
-            f.close()
+        write_sidecar(get_sidecar_path(matching_path, input_traj_name), req_group_hashid, input_traj_name,
+                      modify_traj, matching_results, multiple_matching_dict['bounds'], simplified)
 
         return good_request(multiple_matching_dict)
     return bad_request()
\ No newline at end of file
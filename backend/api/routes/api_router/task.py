@@ -9,11 +9,13 @@ from api.models.data import Data
 from api.models.trajectory import MatchingMethod, Trajectory
 from api.utils.matching_sdk import matching_for_group
 from api.utils.os_helper import *
+from api.utils.pagination import keyset_page, with_next_cursor
 from api.utils.request_handler import *
+from api.utils.task_dispatch import TASK_STATUS, claim_tasks, visible_to
 from api.utils.trajectory import get_bounds
 from app import db, hashids
 from flasgger import swag_from
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import jwt_required, current_user
 
 from . import bp
 
@@ -31,21 +33,72 @@ def get_tasks():
     """
     Get tasks for unannotated data.
     ---
+    parameters:
+      - in: query
+        name: size
+        description: page size, all remaining tasks when missing
+        schema:
+            type: integer
+      - in: query
+        name: cursor
+        description: X-Next-Cursor header of the previous page
+        schema:
+            type: string
     tags:
       - api
     """
     if request.method == 'GET':
         query_type = request.args.get('type') or 1
         query_size = request.args.get('size')
+        query_cursor = request.args.get('cursor')
         try:
-            if query_type:
-                unmatched_datas = Data.query.filter_by(status=query_type).limit(query_size).all()
-            else:
-                unmatched_datas = Data.query.filter_by(status=query_type).all()
-            if unmatched_datas:
-                return good_request([{'hashid': data.group.hashid, 'name': data.name} for data in unmatched_datas])
-            else:
-                return good_request(detail=[])
+            query = db.session.query(Data.id, Data.group_id, Data.name, Data.summary).filter(Data.status == query_type)
+            if int(query_type) == TASK_STATUS:
+                # hide tasks leased to other annotators
+                query = query.filter(visible_to(current_user.id, datetime.now()))
+            unmatched_datas, next_cursor = keyset_page(query, Data.id, query_cursor, query_size)
+            # the group hashid only needs group_id, no group is loaded, the summary was stored at ingestion
+            response = good_request([{'hashid': hashids.encode(data.group_id), 'name': data.name, 'summary': data.summary}
+                                     for data in unmatched_datas])
+            return with_next_cursor(response, next_cursor)
+        except ValueError:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.BAD_REQUEST, 'illegal params')
         except Exception:
             return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal task id')
-    return bad_request()
\ No newline at end of file
+    return bad_request()
+
+
+@bp.route('/tasks/claim', methods=['POST'])
+@swag_from({
+    'responses': {
+        HTTPStatus.OK.value: {
+            'description': 'claim tasks',
+        }
+    }
+})
+@jwt_required()
+def claim_task():
+    """
+    Lease unannotated data to the current user.
+    ---
+    parameters:
+      - in: query
+        name: size
+        description: number of tasks, TASK_CLAIM_SIZE when missing
+        schema:
+            type: integer
+    tags:
+      - api
+    """
+    if request.method == 'POST':
+        try:
+            query_size = int(request.values.get('size') or current_app.config.get('TASK_CLAIM_SIZE'))
+        except ValueError:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.BAD_REQUEST, 'illegal size')
+        leased_datas = claim_tasks(current_user.id, query_size)
+        return good_request([{
+            'hashid': hashids.encode(data.group_id),
+            'name': data.name,
+            'lease_expires': data.lease_expires.isoformat(),
+        } for data in leased_datas])
+    return bad_request()
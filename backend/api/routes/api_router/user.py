@@ -1,4 +1,4 @@
-from flask import request
+from flask import request, jsonify
 from app import db, jwt
 from flasgger import swag_from
 from flask_jwt_extended import (
@@ -5,4 +5,5 @@ bp = Blueprint('media', __name__, url_prefix='/media')
 
 from . import (
     dataset,
+    matching,
 )
\ No newline at end of file
@@ -1,10 +1,6 @@
-import os
-import json
-import zipfile
-from flask import request, send_file
+from flask import Response, request
 from api.models.data_group import DataGroup
-from api.models.annotation import Annotation
-from api.utils.os_helper import *
+from api.utils.dataset_export import EXPORT_TYPES, DatasetExport
 from api.utils.request_handler import *
 from app import hashids
 from flasgger import swag_from
@@ -31,7 +27,7 @@ def export_dataset(hashid, export_type):
     """
     if request.method == 'GET':
 
-        if hashid is None:
+        if hashid is None or export_type not in EXPORT_TYPES:
             return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'missing params')
 
         try:
@@ -41,34 +37,26 @@ def export_dataset(hashid, export_type):
 
         try:
             dataset = DataGroup.query.filter_by(id=data_group_id).first()
-            checked_datas = dataset.datas.filter_by(status=3)
             total_size = dataset.datas.count()
-            archive_name = '%s-%s(%s-%s).zip' % (hashid, export_type, str(checked_datas.count()), str(total_size))
-            archive_path = os.path.join(get_data_group_path(data_group_id), archive_name)
-            if not os.path.exists(archive_path):
-                try:
-                    zip_file = zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED)
-                    for checked_data in checked_datas:
-                        annotation = Annotation.query.filter_by(data_id=checked_data.id).first()
-                        if export_type == 'json':
-                            zip_file.write(annotation.path, '%s.json' % checked_data.name)
-                        elif export_type == 'txt':
-                            txt_file_path = os.path.join(get_output_path(dataset.id), 'MMDGMatching-%s' % checked_data.name)
-                            if not os.path.exists(txt_file_path):
-                                json_file_path = annotation.path
-                                if not os.path.exists(json_file_path):
-                                    return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal dataset')
-                                detail = json.load(open(json_file_path, 'r'))
-                                with open(txt_file_path, 'w') as f:
-                                    traject_list = detail['trajectory']
-                                    for traject in traject_list:
-                                        f.write('%s %s\n' % (traject['longitude'], traject['latitude']))
-                                    f.close()
-                            zip_file.write(txt_file_path, '%s.txt' % checked_data.name)
-                    zip_file.close()
-                except Exception:
-                    return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.INTERNAL_SERVER_ERROR)
-            return send_file(archive_path, mimetype='zip', as_attachment=True, attachment_filename=archive_name)
+            try:
+                # only members changed since the last build are read and compressed again
+                export = DatasetExport(dataset.id, export_type).build()
+                size, chunks = export.archive()
+            except FileNotFoundError:
+                return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal dataset')
+            except Exception:
+                return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+            archive_name = '%s-%s(%s-%s).zip' % (hashid, export_type, str(len(export.members)), str(total_size))
+            if request.if_none_match.contains(export.etag):
+                response = Response(status=304)
+            else:
+                response = Response(chunks, mimetype='application/zip')
+                response.content_length = size
+            response.set_etag(export.etag)
+            response.headers.set('Content-Disposition', 'attachment', filename=archive_name)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
         except Exception:
             return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND)
-    return bad_request()
\ No newline at end of file
+    return bad_request()
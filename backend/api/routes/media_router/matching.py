@@ -0,0 +1,76 @@
+import os
+from flask import request, send_file
+from api.utils.matching_store import export_json, get_json_path, get_sidecar_path
+from api.utils.os_helper import *
+from api.utils.pre_annotation import get_pre_annotation_path
+from api.utils.request_handler import *
+from app import hashids
+from flasgger import swag_from
+from flask_jwt_extended import jwt_required
+
+
+from . import bp
+
+@bp.route('/matchings/<group_hashid>/<data_name>', methods=['GET'])
+@swag_from({
+    'responses': {
+        HTTPStatus.OK.value: {
+            'description': 'get matching json file',
+        }
+    }
+})
+@jwt_required()
+def export_matching(group_hashid, data_name):
+    """
+    Get map-matching result as json file
+    ---
+    tags:
+      - matching
+    """
+    if request.method == 'GET':
+        try:
+            group_id = hashids.decode(group_hashid)[0]
+        except Exception:
+            return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal group id')
+
+        matching_path = get_matching_path(group_id)
+        sidecar_path = get_sidecar_path(matching_path, data_name)
+        json_file_path = get_json_path(matching_path, data_name)
+        if os.path.exists(sidecar_path):
+            try:
+                export_json(sidecar_path, json_file_path)
+            except Exception:
+                return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.INTERNAL_SERVER_ERROR)
+        if not os.path.exists(json_file_path):
+            return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.NOT_FOUND, 'matching for data not found')
+        return send_file(json_file_path, mimetype='application/json', as_attachment=True,
+                         attachment_filename='%s.json' % data_name)
+    return bad_request()
+
+
+
+@bp.route('/matchings/<group_hashid>/<data_name>/pre_annotation', methods=['GET'])
+@swag_from({
+    'responses': {
+        HTTPStatus.OK.value: {
+            'description': 'get pre-annotation json file',
+        }
+    }
+})
+@jwt_required()
+def export_pre_annotation(group_hashid, data_name):
+    """
+    Get the areas pre-annotated at ingestion, same fields as the WASM pre_annotate()
+    ---
+    tags:
+      - matching
+    """
+    try:
+        group_id = hashids.decode(group_hashid)[0]
+    except Exception:
+        return bad_request(RETStatus.PARAM_INVALID, HTTPStatus.NOT_FOUND, 'illegal group id')
+
+    pre_annotation_path = get_pre_annotation_path(get_matching_path(group_id), data_name)
+    if not os.path.exists(pre_annotation_path):
+        return bad_request(RETStatus.FILE_SYSTEM_ERR, HTTPStatus.NOT_FOUND, 'pre-annotation for data not found')
+    return send_file(pre_annotation_path, mimetype='application/json')
@@ -6,6 +6,7 @@ from api.models.data_group import DataGroup
 from api.models.data import Data
 from api.models.annotation import Annotation
 from api.models.method import Method
+from api.models.job import Job
 
 class UserView(ModelView):
     form_columns = ("username", "password", "usertype")
@@ -15,4 +16,5 @@ admin.add_view(UserView(User, db.session))
 admin.add_view(ModelView(DataGroup, db.session))
 admin.add_view(ModelView(Data, db.session))
 admin.add_view(ModelView(Annotation, db.session))
-admin.add_view(ModelView(Method, db.session))
\ No newline at end of file
+admin.add_view(ModelView(Method, db.session))
+admin.add_view(ModelView(Job, db.session))
\ No newline at end of file
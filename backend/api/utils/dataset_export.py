@@ -0,0 +1,248 @@
+'''
+Author: MondayCha
+Date: 2022-05-06 20:12:09
+Description: Incremental export of the checked data of a group
+
+- Every member of an export is compressed once into a blob named by the
+  sha256 of its content, `manifest.json` maps member names to their blob
+  and to the stat of the annotation file it came from.
+- A rebuild only reads annotations whose file changed and only compresses
+  members whose content changed.
+- The zip is assembled from the blobs while it is sent, nothing is written
+  to disk at download time.
+'''
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from api.models.annotation import Annotation
+from api.models.data import Data
+from api.models.job import Job
+from api.utils.job_queue import JOB_PENDING, enqueue_job, job_handler
+from api.utils.os_helper import get_data_group_path, temporary_path
+
+EXPORT_TYPES = ('json', 'txt')
+EXPORT_JOB = 'dataset_export'
+EXPORT_STATUS = 3
+
+# rows fetched per round trip when listing the members
+EXPORT_BATCH = 500
+# bytes read per chunk of the streamed archive
+STREAM_CHUNK = 1024 * 1024
+# unreferenced blobs are kept this long, a download may still be reading them
+BLOB_GRACE_SECONDS = 3600
+
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+END_RECORD = struct.Struct('<4s4H2LH')
+UTF8_FLAG = 0x800
+ZIP_DEFLATED = 8
+ZIP_VERSION = 20
+ZIP_LIMIT = 0xFFFFFFFF
+
+
+def get_export_path(group_id, export_type: str):
+    return os.path.join(get_data_group_path(group_id), 'export', export_type)
+
+
+def iter_members(group_id):
+    """
+    (data id, data name, annotation path) of the checked data, in data order.
+    The first annotation of each data is exported, as before.
+    """
+    first_annotations = db.session.query(func.min(Annotation.id))\
+        .join(Data, Data.id == Annotation.data_id)\
+        .filter(Data.group_id == group_id, Data.status == EXPORT_STATUS)\
+        .group_by(Annotation.data_id)
+    query = db.session.query(Data.id, Data.name, Annotation.path)\
+        .join(Annotation, Annotation.data_id == Data.id)\
+        .filter(Annotation.id.in_(first_annotations))\
+        .order_by(Data.id)\
+        .yield_per(EXPORT_BATCH)
+    yield from query
+
+
+def member_content(annotation_path: str, export_type: str) -> bytes:
+    with open(annotation_path, 'rb') as f:
+        content = f.read()
+        f.close()
+    if export_type == 'json':
+        return content
+    detail = json.loads(content)
+    return ''.join('%s %s\n' % (point['longitude'], point['latitude']) for point in detail['trajectory']).encode('utf-8')
+
+
+def dos_date_time(timestamp: float):
+    moment = datetime.fromtimestamp(max(timestamp, 315532800))
+    return ((moment.year - 1980) << 9 | moment.month << 5 | moment.day,
+            moment.hour << 11 | moment.minute << 5 | moment.second // 2)
+
+
+class DatasetExport:
+    """
+    The manifest of one export type of a group.
+    """
+    def __init__(self, group_id, export_type: str):
+        if export_type not in EXPORT_TYPES:
+            raise ValueError('unknown export type %s' % export_type)
+        self.group_id = group_id
+        self.export_type: str = export_type
+        self.path: str = get_export_path(group_id, export_type)
+        self.blob_path: str = os.path.join(self.path, 'blobs')
+        self.manifest_path: str = os.path.join(self.path, 'manifest.json')
+        self.members: list = []
+        self.reused: int = 0
+        self.compressed: int = 0
+
+    def load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return {member['name']: member for member in json.load(f)['members']}
+        except (FileNotFoundError, ValueError, KeyError):
+            return {}
+
+    def blob(self, digest: str):
+        return os.path.join(self.blob_path, '%s.deflate' % digest)
+
+    def build(self):
+        """
+        Bring the manifest up to date with the checked data.
+        Raises FileNotFoundError when an annotation file is missing.
+        """
+        os.makedirs(self.blob_path, exist_ok=True)
+        previous = self.load_manifest()
+        members = []
+        for _, data_name, annotation_path in iter_members(self.group_id):
+            name = '%s.%s' % (data_name, self.export_type)
+            stat = os.stat(annotation_path)
+            member = previous.get(name)
+            if member is not None and member['source'] == annotation_path and member['mtime_ns'] == stat.st_mtime_ns \
+                    and member['source_size'] == stat.st_size and os.path.exists(self.blob(member['sha256'])):
+                self.reused += 1
+                members.append(member)
+                continue
+            content = member_content(annotation_path, self.export_type)
+            digest = hashlib.sha256(content).hexdigest()
+            if member is None or member['sha256'] != digest or not os.path.exists(self.blob(digest)):
+                member = self.compress(name, content, digest, stat.st_mtime)
+                self.compressed += 1
+            else:
+                self.reused += 1
+            members.append(dict(member, source=annotation_path, mtime_ns=stat.st_mtime_ns, source_size=stat.st_size))
+
+        self.members = members
+        # the download route and the prebuild job may build the same export at once
+        manifest_tmp_path = temporary_path(self.manifest_path)
+        with open(manifest_tmp_path, 'w') as f:
+            json.dump({'group_id': self.group_id, 'export_type': self.export_type, 'members': members}, f)
+            f.close()
+        os.replace(manifest_tmp_path, self.manifest_path)
+        return self
+
+    def compress(self, name: str, content: bytes, digest: str, timestamp: float):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(content) + compressor.flush()
+        blob = self.blob(digest)
+        # the same content always gives the same blob, concurrent writers are harmless
+        blob_tmp_path = temporary_path(blob)
+        with open(blob_tmp_path, 'wb') as f:
+            f.write(compressed)
+            f.close()
+        os.replace(blob_tmp_path, blob)
+        date, time_of_day = dos_date_time(timestamp)
+        return {
+            'name': name,
+            'sha256': digest,
+            'crc32': zlib.crc32(content),
+            'file_size': len(content),
+            'compress_size': len(compressed),
+            'date': date,
+            'time': time_of_day,
+        }
+
+    def prune(self):
+        """
+        Remove blobs no member refers to any more.
+        """
+        referenced = set(self.blob(member['sha256']) for member in self.members)
+        deadline = time.time() - BLOB_GRACE_SECONDS
+        for entry in os.scandir(self.blob_path):
+            if entry.path not in referenced and entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+
+    @property
+    def etag(self):
+        digest = hashlib.sha256()
+        for member in self.members:
+            digest.update(('%s\0%s\0%s\0%s\n' % (member['name'], member['sha256'], member['date'], member['time'])).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _headers(self):
+        offset, entries = 0, []
+        for member in self.members:
+            name = member['name'].encode('utf-8')
+            if offset > ZIP_LIMIT or member['file_size'] > ZIP_LIMIT:
+                raise ValueError('export of group %s needs zip64' % self.group_id)
+            local = LOCAL_HEADER.pack(b'PK\x03\x04', ZIP_VERSION, UTF8_FLAG, ZIP_DEFLATED, member['time'], member['date'],
+                                      member['crc32'], member['compress_size'], member['file_size'], len(name), 0) + name
+            central = CENTRAL_HEADER.pack(b'PK\x01\x02', ZIP_VERSION, ZIP_VERSION, UTF8_FLAG, ZIP_DEFLATED, member['time'],
+                                          member['date'], member['crc32'], member['compress_size'], member['file_size'],
+                                          len(name), 0, 0, 0, 0, 0o644 << 16, offset) + name
+            entries.append((member, local, central))
+            offset += len(local) + member['compress_size']
+        central_size = sum(len(central) for _, _, central in entries)
+        if offset + central_size > ZIP_LIMIT or len(entries) > 0xFFFF:
+            raise ValueError('export of group %s needs zip64' % self.group_id)
+        end = END_RECORD.pack(b'PK\x05\x06', 0, 0, len(entries), len(entries), central_size, offset, 0)
+        return entries, end, offset + central_size + len(end)
+
+    def archive(self):
+        """
+        (size, chunks) of the zip archive, the size is known before the first byte.
+        """
+        entries, end, size = self._headers()
+
+        def chunks():
+            for member, local, _ in entries:
+                yield local
+                with open(self.blob(member['sha256']), 'rb') as f:
+                    while True:
+                        chunk = f.read(STREAM_CHUNK)
+                        if not chunk:
+                            break
+                        yield chunk
+                    f.close()
+            for _, _, central in entries:
+                yield central
+            yield end
+
+        return size, chunks()
+
+
+def schedule_export(group_id):
+    """
+    Pre-build the exports of a group in the background, at most one pending job per group.
+    """
+    pending = Job.query.filter_by(type=EXPORT_JOB, group_id=group_id, status=JOB_PENDING).first()
+    if pending is None:
+        enqueue_job(EXPORT_JOB, group_id)
+
+
+@job_handler(EXPORT_JOB)
+def prebuild_export(job, reporter):
+    for export_type in EXPORT_TYPES:
+        with reporter.phase(export_type):
+            export = DatasetExport(job.group_id, export_type).build()
+            export.prune()
+        reporter.progress[export_type] = {
+            'members': len(export.members),
+            'reused': export.reused,
+            'compressed': export.compressed,
+        }
+    current_app.logger.info('[Export] group %s %s' % (job.group_id, reporter.progress))
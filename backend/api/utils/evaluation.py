@@ -0,0 +1,249 @@
+'''
+Author: MondayCha
+Date: 2022-05-08 14:22:50
+Description: Evaluation of map-matching outputs against the IEEE 2015 ground truth
+
+- Points are quantized once to int64 keys (1e-6 degree, what the old
+  `Coordinate.__eq__` compared with round(x, 6)), the LCS only compares ints.
+  With `--epsilon` points are snapped by api.utils.snapping instead, so points
+  within epsilon across a rounding boundary match too.
+- The LCS is the bit-parallel api.utils.lcs, trajectory ids run in a process pool.
+- hit rate: matched ground truth points / ground truth points
+- strip hit rate: like hit rate, the unmatched head and tail of the ground truth count as hits
+- the total rates only count the ground truth of tracks with at least one hit, as
+  scripts/ieee_test.py did, the per-track statistics include every track
+- Per-track results are written as JSON and CSV, `report` summarizes a run
+  (this replaces the hardcoded list of scripts/ieee_plot_box.py).
+
+    python -m api.utils.evaluation run <output folder> <ieee folder> --ids 0-99 --json report.json --csv report.csv
+    python -m api.utils.evaluation report report.json --plot box.png
+'''
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from api.utils.ieee_convert import parse_ids
+from api.utils.lcs import lcs
+from api.utils.snapping import SnapGrid
+from api.utils.track_reader import read_track
+
+KEY_DECIMALS = 6
+CSV_FIELDS = ('id', 'points', 'ground_truth_points', 'hits', 'hit_rate', 'strip_hits', 'strip_hit_rate', 'seconds')
+
+
+def coordinate_keys(longitude, latitude, decimals: int = KEY_DECIMALS) -> np.ndarray:
+    """
+    One int64 per point, equal iff both coordinates are equal at `decimals` places.
+    """
+    scale = 10 ** decimals
+    lon = np.rint(np.asarray(longitude, dtype=np.float64) * scale).astype(np.int64) + 180 * scale
+    lat = np.rint(np.asarray(latitude, dtype=np.float64) * scale).astype(np.int64) + 90 * scale
+    return lon * (180 * scale + 1) + lat
+
+
+def track_keys(path: str, decimals: int = KEY_DECIMALS, grid: SnapGrid = None) -> list[int]:
+    """
+    Keys of a `lon lat` per line file, the MMDG output and `<id>.out.txt` format.
+    Snapped with `grid` if given, rounded to `decimals` otherwise.
+    """
+    trajectory = read_track(path, 'matching')
+    if grid is not None:
+        return grid.keys(trajectory.longitude, trajectory.latitude).tolist()
+    return coordinate_keys(trajectory.longitude, trajectory.latitude, decimals).tolist()
+
+
+def hit_rates(output_keys: list, truth_keys: list):
+    """
+    (hits, strip hits) of an output against the ground truth.
+    """
+    _, _, truth_index = lcs(output_keys, truth_keys)
+    if not truth_index:
+        return 0, 0
+    return len(truth_index), len(truth_index) + truth_index[0] + len(truth_keys) - 1 - truth_index[-1]
+
+
+def evaluate_track(trajectory_id: str, output_path: str, truth_path: str, epsilon: float = None):
+    start = time.perf_counter()
+    grid = SnapGrid(epsilon) if epsilon else None
+    output_keys, truth_keys = track_keys(output_path, grid=grid), track_keys(truth_path, grid=grid)
+    hits, strip_hits = hit_rates(output_keys, truth_keys)
+    return {
+        'id': trajectory_id,
+        'points': len(output_keys),
+        'ground_truth_points': len(truth_keys),
+        'hits': hits,
+        'hit_rate': hits / len(truth_keys) if truth_keys else 0,
+        'strip_hits': strip_hits,
+        'strip_hit_rate': strip_hits / len(truth_keys) if truth_keys else 0,
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+
+
+def find_tracks(output_folder: str, truth_folder: str, ranges=None):
+    """
+    ([(id, output path, truth path)], [ids without ground truth]) sorted by id.
+    Outputs are named `<prefix>-<id>.<extension>`, ground truth `<id>.out.txt`.
+    """
+    pairs, missing = [], []
+    for name in sorted(os.listdir(output_folder)):
+        trajectory_id = name.split('.')[0].split('-')[-1]
+        if not trajectory_id.isdigit():
+            continue
+        if ranges is not None and not any(first <= int(trajectory_id) <= last for first, last in ranges):
+            continue
+        truth_path = os.path.join(truth_folder, '%s.out.txt' % trajectory_id)
+        if os.path.exists(truth_path):
+            pairs.append((trajectory_id, os.path.join(output_folder, name), truth_path))
+        else:
+            missing.append(trajectory_id)
+    return pairs, missing
+
+
+def evaluate(output_folder: str, truth_folder: str, ranges=None, workers=None, epsilon: float = None):
+    """
+    Evaluate every output with a ground truth in the pool (inline with 0 workers).
+    """
+    start = time.perf_counter()
+    pairs, missing = find_tracks(output_folder, truth_folder, ranges)
+    arguments = [pair + (epsilon,) for pair in pairs]
+    if workers == 0 or not pairs:
+        tracks = [evaluate_track(*argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            tracks = list(pool.map(evaluate_track, *zip(*arguments), chunksize=4))
+    return {
+        'output_folder': os.path.abspath(output_folder),
+        'truth_folder': os.path.abspath(truth_folder),
+        'epsilon': epsilon,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seconds': round(time.perf_counter() - start, 3),
+        'missing': missing,
+        'summary': summarize(tracks),
+        'tracks': tracks,
+    }
+
+
+def describe(values):
+    """
+    Same statistics as pandas.DataFrame.describe().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {'count': 0}
+    quartiles = np.percentile(values, [25, 50, 75])
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'std': float(values.std(ddof=1)) if len(values) > 1 else None,
+        'min': float(values.min()),
+        '25%': float(quartiles[0]),
+        '50%': float(quartiles[1]),
+        '75%': float(quartiles[2]),
+        'max': float(values.max()),
+    }
+
+
+def summarize(tracks: list[dict]):
+    # tracks without any hit stay out of the denominator, like in scripts/ieee_test.py
+    total = sum(track['ground_truth_points'] for track in tracks if track['hits'])
+    return {
+        'tracks': len(tracks),
+        'tracks_without_hits': sum(1 for track in tracks if not track['hits']),
+        'hit_rate': sum(track['hits'] for track in tracks) / total if total else 0,
+        'strip_hit_rate': sum(track['strip_hits'] for track in tracks) / total if total else 0,
+        'per_track_hit_rate': describe([track['hit_rate'] for track in tracks]),
+        'per_track_strip_hit_rate': describe([track['strip_hit_rate'] for track in tracks]),
+    }
+
+
+def write_json(report: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.close()
+
+
+def write_csv(report: dict, path: str):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(report['tracks'])
+        f.close()
+
+
+def read_report(path: str):
+    """
+    A report written by write_json, or per-track rows written by write_csv.
+    """
+    if path.endswith('.csv'):
+        with open(path, 'r', newline='') as f:
+            tracks = [{field: (row[field] if field == 'id' else float(row[field])) for field in CSV_FIELDS}
+                      for row in csv.DictReader(f)]
+        return {'tracks': tracks, 'summary': summarize(tracks)}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def plot_box(report: dict, path: str = None):
+    import matplotlib
+    if path:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.boxplot([[track['hit_rate'] for track in report['tracks']],
+                 [track['strip_hit_rate'] for track in report['tracks']]], labels=['hit rate', 'strip hit rate'])
+    plt.title('Box Chart')
+    plt.grid(linestyle='--', alpha=0.3)
+    if path:
+        plt.savefig(path)
+    else:
+        plt.show()
+
+
+def print_summary(summary: dict):
+    print('tracks: %s, without hits: %s' % (summary['tracks'], summary['tracks_without_hits']))
+    print('total hit rate: %s' % summary['hit_rate'])
+    print('total hit rate strip: %s' % summary['strip_hit_rate'])
+    for name in ('per_track_hit_rate', 'per_track_strip_hit_rate'):
+        print('%s: %s' % (name, ', '.join('%s %.4g' % (key, value) for key, value in summary[name].items() if value is not None)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate map-matching outputs against the IEEE 2015 ground truth.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='evaluate a folder of outputs')
+    run.add_argument('outputs', help='folder of `<prefix>-<id>.txt` outputs')
+    run.add_argument('ground_truth', help='folder of `<id>.out.txt` routes (api.utils.ieee_convert --steps route)')
+    run.add_argument('--ids', help='id ranges, e.g. 0-9,15,20-')
+    run.add_argument('--workers', type=int, default=None, help='pool size, 0 evaluates inline (cpu count by default)')
+    run.add_argument('--epsilon', type=float, help='snap points within EPSILON degrees instead of rounding to 6 decimals')
+    run.add_argument('--json', help='write the report as JSON')
+    run.add_argument('--csv', help='write the per-track results as CSV')
+    report = commands.add_parser('report', help='summarize a JSON or CSV report')
+    report.add_argument('report')
+    report.add_argument('--plot', nargs='?', const='', help='box plot of the hit rates, saved to PLOT if given (needs matplotlib)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        result = evaluate(args.outputs, args.ground_truth, parse_ids(args.ids) if args.ids else None, args.workers, args.epsilon)
+        if args.json:
+            write_json(result, args.json)
+        if args.csv:
+            write_csv(result, args.csv)
+        for track in result['tracks']:
+            print('%s: %s, %s' % (track['id'], track['hit_rate'], track['strip_hit_rate']))
+        for trajectory_id in result['missing']:
+            print('%s not exists' % trajectory_id)
+        print('%s tracks in %.2fs' % (len(result['tracks']), result['seconds']))
+        print_summary(result['summary'])
+    else:
+        result = read_report(args.report)
+        print_summary(result['summary'])
+        if args.plot is not None:
+            plot_box(result, args.plot or None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+'''
+Author: MondayCha
+Date: 2022-05-08 09:37:14
+Description: Batch conversion of the IEEE 2015 trajectories
+
+For every trajectory id `<id>/` of the dataset:
+- osm: `<id>.nodes` + `<id>.arcs` -> `<output>/<id>.osm[.gz|.pbf]`
+- track: `<id>.track` -> `<output>/<id>.txt`, `lon,lat,timestamp` for the csv upload format
+- route: `<id>.route` -> `<output>/<id>.out.txt`, node coordinates along the ground truth
+Outputs newer than their inputs are skipped, ids are converted in a process pool
+and `<output>/manifest.json` records the status and timing of every item, and how
+many malformed lines of the network and route files were skipped.
+
+    python -m api.utils.ieee_convert /path/to/map-matching-dataset --ids 0-99,120 --workers 8
+'''
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from api.utils.osm_writer import OSM_FORMATS, write_ieee_osm
+from api.utils.road_network import load_ieee_network, read_route
+
+CONVERT_STEPS = ('osm', 'track', 'route')
+# timestamps of the dataset start at 0, shift them to a plausible epoch as before
+TIMESTAMP_OFFSET = 1600000000
+
+
+def parse_ids(text: str):
+    """
+    '0-9,15,20-' -> [(0, 9), (15, 15), (20, inf)]
+    """
+    ranges = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition('-')
+        first = int(first) if first else 0
+        last = (int(last) if last else math.inf) if dash else first
+        if last < first:
+            raise ValueError('empty id range %s' % part)
+        ranges.append((first, last))
+    return ranges
+
+
+def list_ids(dataset: str, ranges=None):
+    """
+    Trajectory folders of the dataset whose numeric id is in one of the ranges, sorted by id.
+    """
+    ids = []
+    for name in os.listdir(dataset):
+        if name.isdigit() and os.path.isdir(os.path.join(dataset, name)):
+            if ranges is None or any(first <= int(name) <= last for first, last in ranges):
+                ids.append(name)
+    return sorted(ids, key=int)
+
+
+def is_up_to_date(output_path: str, input_paths):
+    if not os.path.exists(output_path):
+        return False
+    return os.path.getmtime(output_path) >= max(os.path.getmtime(path) for path in input_paths)
+
+
+def convert_track(track_path: str, output_path: str):
+    with open(track_path, 'r') as f, open(output_path + '.tmp', 'w') as f_out:
+        for line in f:
+            line = line.strip().split('\t')
+            if len(line) < 3:
+                continue
+            f_out.write('%s,%s,%s\n' % (line[0], line[1], math.floor(float(line[2])) + TIMESTAMP_OFFSET))
+        f_out.close()
+    os.replace(output_path + '.tmp', output_path)
+
+
+def convert_route(folder: str, trajectory_id: str, route_path: str, output_path: str, on_error=None):
+    network = load_ieee_network(folder, trajectory_id, on_error=on_error)
+    trajectory = network.route_trajectory(read_route(route_path, on_error))
+    with open(output_path + '.tmp', 'w') as f_out:
+        f_out.writelines('%r %r\n' % point for point in zip(trajectory.longitude.tolist(), trajectory.latitude.tolist()))
+        f_out.close()
+    os.replace(output_path + '.tmp', output_path)
+
+
+def convert_item(dataset: str, trajectory_id: str, output: str, steps=CONVERT_STEPS, osm_format='osm', force=False):
+    """
+    Convert one trajectory id, run in the pool. Returns its manifest entry.
+    """
+    folder = os.path.join(dataset, trajectory_id)
+    source = lambda extension: os.path.join(folder, '%s.%s' % (trajectory_id, extension))
+    skipped = []
+    on_error = lambda path, line_number, line: skipped.append(line_number)
+    jobs = {
+        'osm': ([source('nodes'), source('arcs')], os.path.join(output, trajectory_id + OSM_FORMATS[osm_format]),
+                lambda inputs, path: write_ieee_osm(inputs[0], inputs[1], path, on_error)),
+        'track': ([source('track')], os.path.join(output, '%s.txt' % trajectory_id),
+                  lambda inputs, path: convert_track(inputs[0], path)),
+        'route': ([source('route'), source('nodes'), source('arcs')], os.path.join(output, '%s.out.txt' % trajectory_id),
+                  lambda inputs, path: convert_route(folder, trajectory_id, inputs[0], path, on_error)),
+    }
+    item_start = time.perf_counter()
+    entry = {'id': trajectory_id, 'steps': {}}
+    for step in steps:
+        inputs, output_path, convert = jobs[step]
+        start = time.perf_counter()
+        result = {'output': output_path}
+        del skipped[:]
+        if not all(os.path.exists(path) for path in inputs):
+            result['status'] = 'missing input'
+        elif not force and is_up_to_date(output_path, inputs):
+            result['status'] = 'skipped'
+        else:
+            try:
+                convert(inputs, output_path)
+                result['status'] = 'converted'
+            except Exception:
+                result['status'] = 'failed'
+                result['error'] = traceback.format_exc(limit=3)
+        if skipped:
+            result['skipped_lines'] = len(skipped)
+        result['seconds'] = round(time.perf_counter() - start, 4)
+        entry['steps'][step] = result
+    entry['seconds'] = round(time.perf_counter() - item_start, 4)
+    return entry
+
+
+def convert_dataset(dataset: str, output: str, ids=None, steps=CONVERT_STEPS, osm_format='osm', workers=None, force=False):
+    """
+    Convert the ids in the pool (inline with 0 workers) and write `<output>/manifest.json`.
+    """
+    os.makedirs(output, exist_ok=True)
+    trajectory_ids = list_ids(dataset, ids)
+    start = time.perf_counter()
+    arguments = [(dataset, trajectory_id, output, steps, osm_format, force) for trajectory_id in trajectory_ids]
+    if workers == 0:
+        items = [convert_item(*argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            items = list(pool.map(convert_item, *zip(*arguments))) if arguments else []
+    summary = {}
+    for item in items:
+        for result in item['steps'].values():
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+    manifest = {
+        'dataset': os.path.abspath(dataset),
+        'steps': list(steps),
+        'osm_format': osm_format,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seconds': round(time.perf_counter() - start, 3),
+        'summary': summary,
+        'items': items,
+    }
+    with open(os.path.join(output, 'manifest.json.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.close()
+    os.replace(os.path.join(output, 'manifest.json.tmp'), os.path.join(output, 'manifest.json'))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert IEEE 2015 trajectories to OSM networks, csv tracks and routes.')
+    parser.add_argument('dataset', help='folder with one sub folder per trajectory id')
+    parser.add_argument('--ids', help='id ranges, e.g. 0-9,15,20- (all ids by default)')
+    parser.add_argument('--output', help='output folder, <dataset>/osm by default')
+    parser.add_argument('--steps', default=','.join(CONVERT_STEPS), help='comma separated, any of %s' % ', '.join(CONVERT_STEPS))
+    parser.add_argument('--format', choices=sorted(OSM_FORMATS), default='osm', help='osm output format')
+    parser.add_argument('--workers', type=int, default=None, help='pool size, 0 converts inline (cpu count by default)')
+    parser.add_argument('--force', action='store_true', help='convert even if the outputs are up to date')
+    args = parser.parse_args()
+    steps = tuple(step.strip() for step in args.steps.split(',') if step.strip())
+    if not set(steps) <= set(CONVERT_STEPS):
+        parser.error('unknown step in %s' % args.steps)
+    manifest = convert_dataset(args.dataset, args.output or os.path.join(args.dataset, 'osm'),
+                               parse_ids(args.ids) if args.ids else None, steps, args.format, args.workers, args.force)
+    print('%s ids in %.2fs: %s' % (len(manifest['items']), manifest['seconds'], manifest['summary']))
+    if manifest['summary'].get('failed'):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+'''
+Author: MondayCha
+Date: 2022-05-03 21:40:12
+Description: Data group ingestion, run by the background job workers
+'''
+import json
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from api.models.data_group import DataGroup
+from api.models.data import Data
+from api.models.trajectory import MatchingMethod, Trajectory
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.job_queue import job_handler
+from api.utils.matching_sdk import matching_for_data
+from api.utils.matching_store import MatchingSidecar, get_sidecar_path, write_sidecar
+from api.utils.os_helper import *
+from api.utils.pre_annotation import RANKING_FILE, get_pre_annotation_path, get_pre_annotation_pool, pre_annotate_sidecar, write_ranking
+from api.utils.serializer import dump
+from api.utils.simplification import simplify_matching_result
+from api.utils.spatial_index import RAW_SOURCE, SpatialIndex, get_spatial_index_path
+from api.utils.track_reader import read_track
+from api.utils.trajectory import get_bounds, trajectory_summary
+from app import db
+
+
+def write_data_group_detail(group_id, group_hashid, success_names, failed_names, finished, failed=False):
+    request_detail = {
+        'group_id': group_hashid,
+        'finished': finished,
+        'failed': failed,
+        'matching_result': {
+            'success': success_names,
+            'failed': failed_names
+        },
+    }
+    # replace atomically, the web process reads this file while the job runs
+    json_file_path = os.path.join(get_data_group_path(group_id), '%s.json' % group_id)
+    with open(json_file_path + '.tmp', 'wb') as f:
+        dump(request_detail, f)
+        f.close()
+    os.replace(json_file_path + '.tmp', json_file_path)
+    return request_detail
+
+
+def classify_trajectories(trajectory_list: list[Trajectory], output_path: str):
+    """
+    A trajectory succeeds if at least two matching methods produced an output.
+    """
+    matching_method_names = current_app.config.get('MATCHING_METHODS')
+    success_trajectory_list: list[Trajectory] = []
+    failed_trajectory_list: list[Trajectory] = []
+    for trajectory in trajectory_list:
+        success_matching_time = 0
+        for method_name in matching_method_names:
+            matching_method_path = os.path.join(output_path, "%s-%s" % (method_name, trajectory.name))
+            if os.path.exists(matching_method_path):
+                trajectory.matching_method_dict[method_name] = MatchingMethod(method_name, matching_method_path)
+                success_matching_time += 1
+        if success_matching_time >= 2:
+            trajectory.success = True
+            success_trajectory_list.append(trajectory)
+        else:
+            failed_trajectory_list.append(trajectory)
+    return success_trajectory_list, failed_trajectory_list
+
+
+def read_raw_trajectory(trajectory: Trajectory, raw_format: str):
+    """
+    Read raw GPS trajectory, raw_format is a format of api.utils.track_reader
+    """
+    def on_error(line_number, line):
+        current_app.logger.error('[%s] Invalid raw line %s: %s' % (trajectory.name, line_number, line))
+
+    trajectory.raw_traj = read_track(trajectory.path, raw_format, on_error=on_error)
+
+
+def read_matching_results(trajectory: Trajectory):
+    """
+    Read Coordinates for each matching method, [(method_name, TrajectoryArray), ...]
+    """
+    matching_result: list[tuple[str, TrajectoryArray]] = []
+    for matching_method in trajectory.matching_method_dict.values():
+        try:
+            lcss_input = read_track(matching_method.path, 'matching')
+            matching_result.append((matching_method.name, lcss_input))
+            matching_method.raw_traj = lcss_input
+        except Exception:
+            current_app.logger.error('[LCSS] Unable to read: %s' % matching_method.path)
+            continue
+    return matching_result
+
+
+def write_matching_detail(group_id, group_hashid: str, trajectory: Trajectory, spatial_index: SpatialIndex = None):
+    matching_result = read_matching_results(trajectory)
+    if spatial_index is not None:
+        spatial_index.replace(trajectory.name, [(RAW_SOURCE, trajectory.raw_traj)] + matching_result)
+    simplified = simplify_matching_result(matching_result, current_app.config.get('MATCHING_SIMPLIFY_MODE'),
+                                          current_app.config.get('MATCHING_SIMPLIFY_TOLERANCE'))
+    sidecar_path = get_sidecar_path(get_matching_path(group_id), trajectory.name)
+    write_sidecar(sidecar_path, group_hashid, trajectory.name, trajectory.raw_traj, matching_result,
+                  get_bounds(trajectory.raw_traj), simplified)
+    return sidecar_path
+
+
+class PreAnnotationRunner:
+    """
+    Pre-annotate the sidecars while the next trajectories are parsed, inline with 0 workers.
+    """
+    def __init__(self, group_id, workers: int, config: dict):
+        self.group_id = group_id
+        self.config: dict = config
+        self.pool = get_pre_annotation_pool(workers)
+        self.pending: list = []
+        self.summaries: list[dict] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def submit(self, name: str, sidecar_path: str):
+        output_path = get_pre_annotation_path(get_matching_path(self.group_id), name)
+        if self.pool is None:
+            self._collect(name, lambda: pre_annotate_sidecar(sidecar_path, output_path, self.config))
+        else:
+            self.pending.append((name, self.pool.submit(pre_annotate_sidecar, sidecar_path, output_path, self.config)))
+
+    def _collect(self, name: str, result):
+        try:
+            self.summaries.append(result())
+        except Exception as e:
+            current_app.logger.error('[PreAnnotation] %s failed: %s' % (name, e))
+
+    def finish(self):
+        """
+        Wait for the pool and write the mismatch ranking of the data group.
+        """
+        for name, future in self.pending:
+            self._collect(name, future.result)
+        return write_ranking(os.path.join(get_data_group_path(self.group_id), RANKING_FILE), self.summaries, self.config)
+
+
+def summary_fields(summary: dict = None):
+    """
+    Data columns of a trajectory summary, the bbox is also stored in columns for filters.
+    """
+    bbox = summary['bbox'] if summary else None
+    return {
+        'summary': summary,
+        'min_longitude': bbox[0][0] if bbox else None,
+        'min_latitude': bbox[0][1] if bbox else None,
+        'max_longitude': bbox[1][0] if bbox else None,
+        'max_latitude': bbox[1][1] if bbox else None,
+    }
+
+
+class DataRowWriter:
+    """
+    Insert Data rows with executemany, one transaction per `batch_size` rows.
+    Rows already in the group (a requeued job) are updated in place, they keep
+    their id, annotations and any status past processed.
+    """
+    def __init__(self, group_id, batch_size: int):
+        self.group_id = group_id
+        self.batch_size: int = max(1, batch_size or 1)
+        self.existing: dict[str, tuple[int, int]] = {
+            name: (data_id, status) for data_id, name, status in
+            db.session.query(Data.id, Data.name, Data.status).filter(Data.group_id == group_id)}
+        self.rows: list[dict] = []
+        self.success_names: list[str] = []
+        self.total: int = 0
+        self.elapsed: float = 0
+
+    def add(self, trajectory: Trajectory, status: int, summary: dict = None):
+        """
+        Queue a row, returns True if a chunk was committed.
+        """
+        row = dict({'name': trajectory.name, 'path': trajectory.path, 'group_id': self.group_id, 'status': status},
+                   **summary_fields(summary))
+        if trajectory.name in self.existing:
+            data_id, existing_status = self.existing[trajectory.name]
+            row['id'] = data_id
+            if status > 0 and existing_status > 1:
+                row['status'] = existing_status
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.rows:
+            return
+        start = time.perf_counter()
+        db.session.bulk_insert_mappings(Data, [row for row in self.rows if 'id' not in row])
+        db.session.bulk_update_mappings(Data, [row for row in self.rows if 'id' in row])
+        db.session.commit()
+        self.elapsed += time.perf_counter() - start
+        self.total += len(self.rows)
+        self.success_names.extend(row['name'] for row in self.rows if row['status'] > 0)
+        self.rows = []
+
+    def log(self, trajectory_count: int, parsing_time: float):
+        current_app.logger.info('[Ingest] group %s: %s rows in %.3fs (%.0f rows/s), %s trajectories in %.3fs (%.0f trajectories/s)' % (
+            self.group_id, self.total, self.elapsed, self.total / self.elapsed if self.elapsed else 0,
+            trajectory_count, parsing_time or 0, trajectory_count / parsing_time if parsing_time else 0))
+
+
+@job_handler('data_group')
+def ingest_data_group(job, reporter):
+    """
+    Ingest the trajectories of a data group
+    - payload.trajectories: [[name, path], ...]
+    - payload.matching: call sdk for map-matching first (default True)
+    - payload.raw_format: csv or ieee
+    A requeued job runs again over the rows and files of the first attempt.
+    """
+    group = DataGroup.query.get(job.group_id)
+    group_id, group_hashid = group.id, group.hashid
+    try:
+        ingest_trajectories(group, job.payload, reporter)
+    except Exception:
+        # leave a terminal state for the pages polling the data group
+        db.session.rollback()
+        rows = db.session.query(Data.name, Data.status).filter(Data.group_id == group_id).all()
+        write_data_group_detail(group_id, group_hashid, [name for name, status in rows if status > 0],
+                                [name for name, status in rows if status == 0], True, failed=True)
+        raise
+
+
+def ingest_trajectories(group: DataGroup, payload: dict, reporter):
+    group_id, group_hashid = group.id, group.hashid
+    raw_format = payload.get('raw_format', 'csv')
+    output_path = get_output_path(group_id)
+    trajectory_list = [Trajectory(name, path) for name, path in payload.get('trajectories', [])]
+    reporter.set_trajectories([trajectory.name for trajectory in trajectory_list])
+
+    # call sdk for map-matching
+    if payload.get('matching', True):
+        with reporter.phase('matching'):
+            matching_sdk_code, matching_sdk_dict = matching_for_data(group.osm_path, get_input_path(group_id), output_path)
+            if matching_sdk_code == 1:
+                raise RuntimeError('map matching failed: %s' % json.dumps(matching_sdk_dict))
+
+    success_trajectory_list, failed_trajectory_list = classify_trajectories(trajectory_list, output_path)
+    failed_names: list[str] = [trajectory.name for trajectory in failed_trajectory_list]
+    writer = DataRowWriter(group_id, current_app.config.get('INGEST_BATCH_SIZE'))
+    pre_annotation_config = current_app.config.get('PRE_ANNOTATION')
+    geohash_precision = current_app.config.get('DATA_SUMMARY_GEOHASH_PRECISION')
+    last_write = time.monotonic()
+    write_interval = current_app.config.get('JOB_FLUSH_INTERVAL')
+
+    with PreAnnotationRunner(group_id, current_app.config.get('PRE_ANNOTATION_WORKERS'), pre_annotation_config) as pre_annotation, \
+            SpatialIndex(get_spatial_index_path(group_id)) as spatial_index:
+        with reporter.phase('parsing'):
+            for trajectory in failed_trajectory_list:
+                writer.add(trajectory, 0)
+                reporter.trajectory_done(trajectory.name, False)
+
+            for trajectory in success_trajectory_list:
+                read_raw_trajectory(trajectory, raw_format)
+                # Write Coordinates, pre-annotated in the pool meanwhile
+                pre_annotation.submit(trajectory.name, write_matching_detail(group_id, group_hashid, trajectory, spatial_index))
+
+                # Save to database, results become visible in the data group while the job runs
+                summary = trajectory_summary(trajectory.raw_traj, geohash_precision)
+                if writer.add(trajectory, 1, summary) and time.monotonic() - last_write >= write_interval:
+                    write_data_group_detail(group_id, group_hashid, writer.success_names, failed_names, False)
+                    last_write = time.monotonic()
+                reporter.trajectory_done(trajectory.name, True)
+            writer.flush()
+
+        with reporter.phase('pre_annotation'):
+            pre_annotation.finish()
+
+    writer.log(len(trajectory_list), reporter.phases.get('parsing'))
+    write_data_group_detail(group_id, group_hashid, writer.success_names, failed_names, True)
+
+
+def backfill_summaries(group_id=None, force=False, batch_size=500):
+    """
+    Summaries of Data rows ingested before they existed, read from the matching sidecars.
+    Returns (updated, missing sidecar).
+    """
+    precision = current_app.config.get('DATA_SUMMARY_GEOHASH_PRECISION')
+    query = db.session.query(Data.id, Data.group_id, Data.name).filter(Data.status > 0)
+    if group_id is not None:
+        query = query.filter(Data.group_id == group_id)
+    if not force:
+        query = query.filter(Data.summary.is_(None))
+    updated, missing = 0, 0
+    rows = []
+    for data_id, data_group_id, name in query.order_by(Data.id).all():
+        sidecar_path = get_sidecar_path(get_matching_path(data_group_id), name)
+        if not os.path.exists(sidecar_path):
+            missing += 1
+            continue
+        rows.append(dict({'id': data_id}, **summary_fields(trajectory_summary(MatchingSidecar(sidecar_path).raw_traj, precision))))
+        if len(rows) >= batch_size:
+            db.session.bulk_update_mappings(Data, rows)
+            db.session.commit()
+            updated, rows = updated + len(rows), []
+    if rows:
+        db.session.bulk_update_mappings(Data, rows)
+        db.session.commit()
+        updated += len(rows)
+    return updated, missing
+
+
+@click.command('summarize-data')
+@click.option('--group', 'group_id', type=int, default=None, help='Only this data group id.')
+@click.option('--force', is_flag=True, help='Recompute existing summaries.')
+@with_appcontext
+def summarize_data_command(group_id, force):
+    """Store the trajectory summary of Data rows ingested without one."""
+    updated, missing = backfill_summaries(group_id, force)
+    click.echo('%s summaries written, %s without sidecar' % (updated, missing))
@@ -0,0 +1,224 @@
+'''
+Author: MondayCha
+Date: 2022-05-03 21:05:47
+Description: Background jobs stored in the app database
+
+- The web process only enqueues jobs and returns their hashid.
+- Worker processes claim pending jobs one at a time, run the handler
+  registered for the job type and report phase timings and progress.
+'''
+import atexit
+import os
+import socket
+import time
+import traceback
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.orm.attributes import flag_modified
+from app import db
+from api.models.job import Job
+
+JOB_PENDING, JOB_RUNNING, JOB_FINISHED, JOB_FAILED = 0, 1, 2, 3
+
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type: str):
+    """
+    Register `handler(job, reporter)` for a job type.
+    """
+    def decorator(handler):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return decorator
+
+
+def enqueue_job(job_type: str, group_id=None, payload=None):
+    job = Job(type=job_type, group_id=group_id, payload=payload or {}, status=JOB_PENDING,
+              progress={}, phases={})
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def claim_job(worker: str):
+    """
+    Atomically move the oldest pending job to running, None if the queue is empty.
+    """
+    while True:
+        candidate = db.session.query(Job.id).filter_by(status=JOB_PENDING).order_by(Job.id).first()
+        if candidate is None:
+            return None
+        claimed = Job.query.filter_by(id=candidate.id, status=JOB_PENDING).update({
+            'status': JOB_RUNNING,
+            'worker': worker,
+            'started': datetime.now(),
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return Job.query.get(candidate.id)
+
+
+class JobReporter:
+    """
+    Progress of a running job, written back to the database at most
+    once per `flush_interval` seconds unless forced.
+    """
+    def __init__(self, job: Job, flush_interval: float = 1.0):
+        self.job: Job = job
+        self.flush_interval: float = flush_interval
+        self._last_flush: float = 0
+        self.progress: dict = {'total': 0, 'done': 0, 'success': 0, 'failed': 0, 'trajectories': {}}
+        self.phases: dict = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        self.job.phase = name
+        self.flush(force=True)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(self.phases.get(name, 0) + time.perf_counter() - start, 3)
+            self.flush(force=True)
+
+    def set_trajectories(self, names):
+        self.progress['total'] = len(names)
+        self.progress['trajectories'] = {name: 'pending' for name in names}
+        self.flush(force=True)
+
+    def trajectory_done(self, name: str, success: bool):
+        self.progress['trajectories'][name] = 'success' if success else 'failed'
+        self.progress['done'] += 1
+        self.progress['success' if success else 'failed'] += 1
+        self.flush()
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        self.job.progress = self.progress
+        self.job.phases = self.phases
+        flag_modified(self.job, 'progress')
+        flag_modified(self.job, 'phases')
+        db.session.add(self.job)
+        db.session.commit()
+
+
+def run_job(job: Job):
+    handler = JOB_HANDLERS.get(job.type)
+    reporter = JobReporter(job, current_app.config.get('JOB_FLUSH_INTERVAL'))
+    try:
+        if handler is None:
+            raise ValueError('no handler for job type %s' % job.type)
+        handler(job, reporter)
+        job.status = JOB_FINISHED
+    except Exception:
+        db.session.rollback()
+        job.status = JOB_FAILED
+        job.error = traceback.format_exc()
+        current_app.logger.error('[Job %s] %s' % (job.id, job.error))
+    job.phase = None
+    job.finished = datetime.now()
+    reporter.flush(force=True)
+
+
+def requeue_orphan_jobs():
+    """
+    Put back jobs whose worker process on this host is gone.
+    """
+    hostname = socket.gethostname()
+    for job in Job.query.filter_by(status=JOB_RUNNING).all():
+        host, _, pid = (job.worker or '').rpartition(':')
+        if host != hostname or not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            current_app.logger.info('[Job %s] requeue, worker %s is gone' % (job.id, job.worker))
+            job.status = JOB_PENDING
+            job.worker = None
+    db.session.commit()
+
+
+def run_worker(once=False):
+    """
+    Claim and run jobs until the queue is empty (once) or forever.
+    """
+    # handlers register themselves on import
+    import api.utils.ingestion
+    import api.utils.dataset_export
+
+    from api.utils.task_dispatch import reclaim_expired_leases
+
+    worker = '%s:%s' % (socket.gethostname(), os.getpid())
+    poll_interval = current_app.config.get('JOB_POLL_INTERVAL')
+    reclaim_interval = current_app.config.get('TASK_RECLAIM_INTERVAL')
+    last_reclaim = 0
+    requeue_orphan_jobs()
+    current_app.logger.info('[Job] worker %s started' % worker)
+    while True:
+        # sweep expired annotation leases between jobs
+        if time.monotonic() - last_reclaim >= reclaim_interval:
+            reclaim_expired_leases()
+            last_reclaim = time.monotonic()
+        job = claim_job(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        current_app.logger.info('[Job %s] %s claimed by %s' % (job.id, job.type, worker))
+        run_job(job)
+
+
+def _worker_process():
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        run_worker()
+
+
+def start_job_workers(app):
+    """
+    Spawn JOB_WORKERS worker processes next to the web server.
+    They are not daemonic so that they can start process pools of their own,
+    stop_job_workers() ends them when the web server exits.
+    """
+    processes = []
+    context = multiprocessing.get_context('spawn')
+    for _ in range(app.config.get('JOB_WORKERS') or 0):
+        process = context.Process(target=_worker_process, daemon=False)
+        process.start()
+        processes.append(process)
+    if processes:
+        # registered after multiprocessing's own exit handler, so it runs before it joins the children
+        atexit.register(stop_job_workers, processes)
+    return processes
+
+
+def stop_job_workers(processes, timeout: float = 10):
+    """
+    Terminate the workers, a job they were running is requeued by the next worker.
+    """
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+@click.command('worker')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty.')
+@with_appcontext
+def worker_command(once):
+    """Run a background job worker."""
+    run_worker(once)
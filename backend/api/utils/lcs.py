@@ -1,33 +1,79 @@
 # https://rosettacode.org/wiki/Longest_common_subsequence#Python
+# Bit-parallel rows: H. Hyyrö, "Bit-Parallel LCS-length Computation Revisited", 2004
 # from api.models.coordinate import Coordinate
+from math import isqrt
 
 
 def lcs(a, b):
-    # generate matrix of length of longest common subsequence for substrings of both words
+    """
+    Longest common subsequence of two sequences of hashable items.
+    - Items are interned to integer ids once, so `__eq__` is not called in the O(n*m) part.
+    - Row i of the length table is kept as one integer `V` whose bit j is 0 iff
+      lengths[i][j+1] > lengths[i][j], so a row costs m bits instead of m Python ints.
+    - Only every sqrt(n)-th row is stored, the rows of a block are recomputed during traceback.
+    Returns the same (result, index_a, index_b) as the classic DP, ties included.
+    """
     len_a, len_b = len(a), len(b)
-    lengths = [[0] * (len_b+1) for _ in range(len_a+1)]
-    for i, x in enumerate(a):
-        for j, y in enumerate(b):
-            if x == y:
-                lengths[i+1][j+1] = lengths[i][j] + 1
-            else:
-                lengths[i+1][j+1] = max(lengths[i+1][j], lengths[i][j+1])
+    if len_a == 0 or len_b == 0:
+        return [], [], []
+
+    # intern items of a to ids, match_masks[id] has bit j set if b[j] is that item
+    ids = {}
+    ids_a = [ids.setdefault(x, len(ids)) for x in a]
+    positions = {}
+    for j, y in enumerate(b):
+        id_b = ids.get(y)
+        if id_b is not None:
+            positions.setdefault(id_b, []).append(j)
+    match_masks = [0] * len(ids)
+    for id_b, js in positions.items():
+        mask = 0
+        for j in js:
+            mask |= 1 << j
+        match_masks[id_b] = mask
+
+    full = (1 << len_b) - 1
+    step = max(1, isqrt(len_a))
+
+    def next_row(v, i):
+        u = v & match_masks[ids_a[i]]
+        return ((v + u) | (v - u)) & full
+
+    # generate matrix of length of longest common subsequence, keep checkpoints only
+    checkpoints = [full]
+    v = full
+    for i in range(len_a):
+        v = next_row(v, i)
+        if (i + 1) % step == 0:
+            checkpoints.append(v)
+    last_row = v
+
+    def block(base):
+        rows = [checkpoints[base // step]]
+        for i in range(base, min(base + step, len_a)):
+            rows.append(next_row(rows[-1], i))
+        return rows
+
+    def length(row, j):
+        # number of zero bits below bit j
+        return j - (row & ((1 << j) - 1)).bit_count()
 
-    # read a substring from the matrix
-    # for i in range(0, len_a + 1):
-    #     for j in range(0, len_b +1):
-    #         print('%s ' % lengths[i][j], end='')
-    #     print()
-    
     # read a substring from the matrix
     result = []
     index_a = []
     index_b = []
     i, j = len_a, len_b
+    current = length(last_row, j)
+    base, rows = -1, None
     while i > 0 and j > 0:
-        if lengths[i][j] == lengths[i][j-1]:
+        if (i - 1) // step * step != base:
+            base = (i - 1) // step * step
+            rows = block(base)
+        if (rows[i - base] >> (j - 1)) & 1:
+            # lengths[i][j] == lengths[i][j-1]
             j -= 1
-        elif lengths[i][j] == lengths[i-1][j]:
+        elif length(rows[i - 1 - base], j) == current:
+            # lengths[i][j] == lengths[i-1][j]
             i -= 1
         else:
             result.append(a[i-1])
@@ -35,6 +81,6 @@ def lcs(a, b):
             index_b.append(j-1)
             i -= 1
             j -= 1
+            current -= 1
 
     return list(reversed(result)), list(reversed(index_a)), list(reversed(index_b))
-
@@ -0,0 +1,243 @@
+'''
+Author: MondayCha
+Date: 2022-05-02 10:12:31
+Description: Long-lived Map-Matching SDK workers
+
+Starting `java -cp ... MatchingMain` for every matcher reloads the GraphHopper
+graph each time. A worker is started once per road network, keeps the graph
+loaded and answers jobs over a line-delimited JSON protocol on stdin/stdout:
+
+    -> {"id": 1, "op": "ping"}
+    <- {"id": 1, "code": 0}
+    -> {"id": 2, "op": "match", "matcher": "STMatching", "input": "...", "output": "..."}
+    <- {"id": 2, "code": 0, "stdout": "...", "stderr": "..."}
+'''
+import atexit
+import itertools
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from flask import current_app
+
+
+class MatchingWorkerError(Exception):
+    """Worker could not be started or did not answer in time."""
+
+
+class MatchingWorker:
+    def __init__(self, args: list[str], startup_timeout: float):
+        self.args: list[str] = args
+        self.startup_timeout: float = startup_timeout
+        self.process: subprocess.Popen = None
+        self._replies: queue.Queue = None
+        self._ids = itertools.count(1)
+        self.stderr_tail: list[str] = []
+
+    def __repr__(self):
+        return "< worker pid: %s alive: %s >" % (self.process.pid if self.process else None, self.alive())
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """
+        Start the SDK process and wait until the graph is loaded (warm-up).
+        """
+        self.stop()
+        try:
+            self.process = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE, text=True, bufsize=1)
+        except OSError as e:
+            raise MatchingWorkerError('unable to start worker: %s' % e)
+        self._replies = queue.Queue()
+        self.stderr_tail = []
+        threading.Thread(target=self._read_stdout, args=(self.process, self._replies), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.process,), daemon=True).start()
+        self.request({'op': 'ping'}, self.startup_timeout)
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def request(self, payload: dict, timeout: float):
+        """
+        Send one job and block until its reply arrives.
+        """
+        if not self.alive():
+            raise MatchingWorkerError('worker is not running')
+        job_id = next(self._ids)
+        try:
+            self.process.stdin.write(json.dumps(dict(payload, id=job_id)) + '\n')
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise MatchingWorkerError('worker pipe closed: %s' % e)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stop()
+                raise MatchingWorkerError('worker timeout after %ss' % timeout)
+            try:
+                reply = self._replies.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if reply is None:
+                stderr = ''.join(self.stderr_tail[-20:])
+                self.stop()
+                raise MatchingWorkerError('worker exited: %s' % stderr)
+            if reply.get('id') == job_id:
+                return reply
+
+    @staticmethod
+    def _read_stdout(process, replies):
+        for line in process.stdout:
+            try:
+                replies.put(json.loads(line))
+            except ValueError:
+                # SDK log output, not a reply.
+                continue
+        replies.put(None)
+
+    def _read_stderr(self, process):
+        for line in process.stderr:
+            self.stderr_tail.append(line)
+            if len(self.stderr_tail) > 100:
+                del self.stderr_tail[:50]
+
+
+class MatchingWorkerPool:
+    """
+    A fixed number of workers sharing one road network.
+    - Workers are warmed up in the background when the pool is created.
+    - Crashed or timed-out workers are restarted on their next job.
+    """
+    def __init__(self, args: list[str], size: int, startup_timeout: float):
+        self.size: int = size
+        self.workers: list[MatchingWorker] = [MatchingWorker(args, startup_timeout) for _ in range(size)]
+        self._idle: queue.Queue = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def __repr__(self):
+        return "< pool size: %s workers: %s >" % (self.size, self.workers)
+
+    def run(self, matcher: str, input_path: str, output_path: str, timeout: float):
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker.start()
+            return worker.request({
+                'op': 'match',
+                'matcher': matcher,
+                'input': input_path,
+                'output': output_path,
+            }, timeout)
+        finally:
+            self._idle.put(worker)
+
+    def warm_up(self, timeout: float):
+        """
+        Start every worker in the background so the first jobs do not pay for graph loading.
+        """
+        threading.Thread(target=self.health_check, args=(timeout,), daemon=True).start()
+
+    def health_check(self, timeout: float):
+        """
+        Ping every idle worker, (re)starting those that are not running.
+        Busy workers are skipped, they are checked by the job they run.
+        """
+        for _ in range(self.size):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if worker.alive():
+                    worker.request({'op': 'ping'}, timeout)
+                else:
+                    worker.start()
+            except MatchingWorkerError:
+                worker.stop()
+            finally:
+                self._idle.put(worker)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+_pools: dict[str, MatchingWorkerPool] = {}
+_pools_lock = threading.Lock()
+_unavailable_until: dict[str, float] = {}
+_health_check_thread: threading.Thread = None
+
+
+def get_matching_pool(osm_path: str):
+    """
+    Get the worker pool for a road network, None if workers are disabled
+    or failed to start recently.
+    """
+    config = current_app.config
+    size = config.get('MATCHING_WORKERS') or 0
+    if size <= 0 or time.monotonic() < _unavailable_until.get(osm_path, 0):
+        return None
+    with _pools_lock:
+        pool = _pools.get(osm_path)
+        if pool is None:
+            args = [
+                'java', '-cp', os.path.expanduser(config.get('SDK_ENTRYPONIT_PATH')), config.get('SDK_WORKER_CLASS'),
+                '--graphHopperLocation', config.get('GRAPHHOPPER_LOCATION_PATH'),
+                '--osmFile', os.path.expanduser(osm_path),
+            ]
+            pool = MatchingWorkerPool(args, size, config.get('MATCHING_WORKER_STARTUP_TIMEOUT'))
+            pool.warm_up(config.get('MATCHING_WORKER_STARTUP_TIMEOUT'))
+            _pools[osm_path] = pool
+            _start_health_check(config.get('MATCHING_WORKER_HEALTH_INTERVAL'), config.get('MATCHING_WORKER_STARTUP_TIMEOUT'))
+        return pool
+
+
+def mark_pool_unavailable(osm_path: str, seconds: float):
+    """
+    Fall back to one-shot processes for a while, e.g. when the SDK jar has no worker entrypoint.
+    """
+    _unavailable_until[osm_path] = time.monotonic() + seconds
+    with _pools_lock:
+        pool = _pools.pop(osm_path, None)
+    if pool is not None:
+        pool.shutdown()
+
+
+def _start_health_check(interval: float, timeout: float):
+    global _health_check_thread
+    if _health_check_thread is not None:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            with _pools_lock:
+                pools = list(_pools.values())
+            for pool in pools:
+                pool.health_check(timeout)
+    _health_check_thread = threading.Thread(target=loop, name='matching-health-check', daemon=True)
+    _health_check_thread.start()
+
+
+@atexit.register
+def shutdown_matching_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
@@ -1,40 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app, g
 from api.utils.os_helper import *
 from api.utils.request_handler import *
+from api.utils.matching_pool import MatchingWorkerError, get_matching_pool, mark_pool_unavailable
+
 
 def matching_for_group(osm_path: str):
     """
     Map matching
     ---
     """
-    matching_methods = current_app.config.get('MATCHING_METHODS') or ['GHMapMatching', 'SimpleMapMatching', 'STMatching']
     current_group_id = g.group.id
     input_path = get_input_path(current_group_id)
     output_path = get_output_path(current_group_id)
-
-    # call sdk to matching
-    for matching_method in matching_methods:
-        matching_cmd = 'java -cp %s com.example.MatchingMain --graphHopperLocation %s --osmFile %s --output %s --matcher %s %s' % (
-            current_app.config.get('SDK_ENTRYPONIT_PATH'), current_app.config.get('GRAPHHOPPER_LOCATION_PATH'), 
-            osm_path, output_path, matching_method, input_path)
-        current_app.logger.debug(matching_cmd)
-        matching_code, matching_dict = cmd(matching_cmd)
-        if matching_code == 1:
-            current_app.logger.debug(matching_dict['stderr'])
-            return 1, matching_dict['stderr']
-    return 0, matching_dict['stdout']
+    return matching_for_data(osm_path, input_path, output_path)
 
 
 def matching_for_data(osm_path: str, input_path: str, output_path: str):
-    matching_methods = current_app.config.get('MATCHING_METHODS') or ['GHMapMatching', 'SimpleMapMatching', 'STMatching']
-    # call sdk to matching
-    for matching_method in matching_methods:
-        matching_cmd = 'java -cp %s com.example.MatchingMain --graphHopperLocation %s --osmFile %s --output %s --matcher %s %s' % (
-            current_app.config.get('SDK_ENTRYPONIT_PATH'), current_app.config.get('GRAPHHOPPER_LOCATION_PATH'), 
-            osm_path, output_path, matching_method, input_path)
-        current_app.logger.debug(matching_cmd)
-        matching_code, matching_dict = cmd(matching_cmd)
-        if matching_code == 1:
-            current_app.logger.debug(matching_dict['stderr'])
-            return 1, matching_dict['stderr']
-    return 0, matching_dict['stdout']
+    """
+    Run every configured matcher, up to MATCHING_PARALLELISM at the same time.
+    A failed matcher does not stop the others, its stderr is kept in the result.
+    ---
+    return: 0 if at least one matcher succeeded else 1,
+            {method_name: {'code': int, 'stdout': str, 'stderr': str}}
+    """
+    app = current_app._get_current_object()
+    matching_methods = app.config.get('MATCHING_METHODS') or ['GHMapMatching', 'SimpleMapMatching', 'STMatching']
+    parallelism = max(1, app.config.get('MATCHING_PARALLELISM') or 1)
+
+    def run(matching_method):
+        with app.app_context():
+            return run_matching_method(osm_path, matching_method, input_path, output_path)
+
+    matching_results = {}
+    pending_methods = list(matching_methods)
+    # the first matcher imports the graph, concurrent imports would fight over the same folder
+    if parallelism > 1 and not os.path.exists(app.config.get('GRAPHHOPPER_LOCATION_PATH')):
+        matching_results[pending_methods[0]] = run(pending_methods.pop(0))
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for matching_method, result in zip(pending_methods, executor.map(run, pending_methods)):
+            matching_results[matching_method] = result
+
+    matching_detail = {}
+    for matching_method, (matching_code, matching_dict) in matching_results.items():
+        if matching_code != 0:
+            current_app.logger.debug('[Matching] %s: %s' % (matching_method, matching_dict['stderr']))
+        matching_detail[matching_method] = dict(matching_dict, code=matching_code)
+    success = any(detail['code'] == 0 for detail in matching_detail.values())
+    return (0 if success else 1), matching_detail
+
+
+def run_matching_method(osm_path: str, matching_method: str, input_path: str, output_path: str):
+    """
+    Run one matcher, on a warm worker if possible, else in a new JVM.
+    """
+    timeout = current_app.config.get('MATCHING_TIMEOUT')
+    pool = get_matching_pool(osm_path)
+    if pool is not None:
+        try:
+            reply = pool.run(matching_method, input_path, output_path, timeout)
+            return reply.get('code', 1), {'stdout': reply.get('stdout', ''), 'stderr': reply.get('stderr', '')}
+        except MatchingWorkerError as e:
+            current_app.logger.warning('[Matching] worker unavailable, fallback to cmd: %s' % e)
+            mark_pool_unavailable(osm_path, current_app.config.get('MATCHING_WORKER_RETRY_INTERVAL'))
+
+    matching_cmd = 'java -cp %s com.example.MatchingMain --graphHopperLocation %s --osmFile %s --output %s --matcher %s %s' % (
+        current_app.config.get('SDK_ENTRYPONIT_PATH'), current_app.config.get('GRAPHHOPPER_LOCATION_PATH'),
+        osm_path, output_path, matching_method, input_path)
+    current_app.logger.debug(matching_cmd)
+    return cmd(matching_cmd, timeout)
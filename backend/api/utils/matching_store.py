@@ -0,0 +1,217 @@
+'''
+Author: MondayCha
+Date: 2022-05-05 09:47:03
+Description: Binary sidecar of the per-trajectory matching detail
+
+Layout of `<name>.mmd`, little endian:
+|-------|---------|------------|-------------|---------------------------------|
+| magic | version | header len | header json | columns, 8-byte aligned         |
+|-------|---------|------------|-------------|---------------------------------|
+| MMDC  | uint32  | uint32     | utf-8       | lon f8[n], lat f8[n], (ts i8[n]) |
+|-------|---------|------------|-------------|---------------------------------|
+The raw trajectory comes first, followed by one block per matching method.
+A simplified method has an index column `i8[k]` after all blocks, its header
+entry has a `simplified` block. Readers serve the simplified outputs, the
+original points stay in the file (`original_matching_result`, JSON export).
+Columns are memory-mapped on read, `<name>.json` is only written for export.
+'''
+import json
+import os
+import struct
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.os_helper import temporary_path
+from api.utils.serializer import points_json
+
+SIDECAR_MAGIC = b'MMDC'
+SIDECAR_VERSION = 1
+SIDECAR_PREFIX = struct.Struct('<4sII')
+SIDECAR_EXTENSION = '.mmd'
+
+# points serialized per chunk of the streamed response
+STREAM_BATCH = 4096
+
+
+def get_sidecar_path(matching_path: str, data_name: str):
+    return os.path.join(matching_path, '%s%s' % (data_name, SIDECAR_EXTENSION))
+
+
+def get_json_path(matching_path: str, data_name: str):
+    return os.path.join(matching_path, '%s.json' % data_name)
+
+
+def write_sidecar(path: str, group_hashid: str, traj_name: str, raw_traj: TrajectoryArray,
+                  matching_result: list[tuple[str, TrajectoryArray]], bounds=None, simplified=None):
+    """
+    Write the sidecar atomically, readers may have the previous version mapped.
+    - simplified: per method the indexes of the points to serve, or None for all of them.
+    """
+    blocks = [raw_traj] + [trajectory for _, trajectory in matching_result]
+    simplified = simplified or [None] * len(matching_result)
+    offset = 0
+    layout = []
+    for trajectory in blocks:
+        layout.append({'offset': offset, 'count': len(trajectory), 'timestamp': trajectory.timestamp is not None})
+        offset += trajectory.nbytes
+    methods = []
+    for (name, _), block, indexes in zip(matching_result, layout[1:], simplified):
+        method = dict(method_name=name, **block)
+        if indexes is not None:
+            method['simplified'] = {'offset': offset, 'count': len(indexes)}
+            offset += 8 * len(indexes)
+        methods.append(method)
+    header = {
+        'group_id': group_hashid,
+        'traj_name': traj_name,
+        'bounds': bounds if bounds is not None else raw_traj.bounds(),
+        'raw_traj': layout[0],
+        'matching_result': methods,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(SIDECAR_PREFIX.size + len(header_bytes)) % 8)
+
+    # concurrent requests may convert the same legacy json at once
+    tmp_path = temporary_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(SIDECAR_PREFIX.pack(SIDECAR_MAGIC, SIDECAR_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for trajectory in blocks:
+            f.write(trajectory.longitude.astype('<f8').tobytes())
+            f.write(trajectory.latitude.astype('<f8').tobytes())
+            if trajectory.timestamp is not None:
+                f.write(trajectory.timestamp.astype('<i8').tobytes())
+        for indexes in simplified:
+            if indexes is not None:
+                f.write(np.asarray(indexes).astype('<i8').tobytes())
+        f.close()
+    os.replace(tmp_path, path)
+
+
+class MatchingSidecar:
+    """
+    Read-only, memory-mapped view of a sidecar file.
+    """
+    def __init__(self, path: str):
+        self.path: str = path
+        self._buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, header_length = SIDECAR_PREFIX.unpack_from(self._buffer, 0)
+        if magic != SIDECAR_MAGIC or version != SIDECAR_VERSION:
+            raise ValueError('%s is not a matching sidecar' % path)
+        self._data_offset = SIDECAR_PREFIX.size + header_length
+        self.header: dict = json.loads(bytes(self._buffer[SIDECAR_PREFIX.size:self._data_offset]))
+
+    def _trajectory(self, block: dict) -> TrajectoryArray:
+        count, offset = block['count'], self._data_offset + block['offset']
+        longitude = np.frombuffer(self._buffer, dtype='<f8', count=count, offset=offset)
+        latitude = np.frombuffer(self._buffer, dtype='<f8', count=count, offset=offset + 8 * count)
+        timestamp = None
+        if block['timestamp']:
+            timestamp = np.frombuffer(self._buffer, dtype='<i8', count=count, offset=offset + 16 * count)
+        return TrajectoryArray(longitude, latitude, timestamp)
+
+    @property
+    def raw_traj(self) -> TrajectoryArray:
+        return self._trajectory(self.header['raw_traj'])
+
+    def simplified_indexes(self, block: dict):
+        """
+        Indexes of the original points kept by the simplification, None if all are.
+        """
+        simplified = block.get('simplified')
+        if simplified is None:
+            return None
+        return np.frombuffer(self._buffer, dtype='<i8', count=simplified['count'],
+                             offset=self._data_offset + simplified['offset'])
+
+    @property
+    def matching_result(self) -> list[tuple[str, TrajectoryArray]]:
+        """
+        Simplified matcher outputs.
+        """
+        result = []
+        for block in self.header['matching_result']:
+            trajectory, indexes = self._trajectory(block), self.simplified_indexes(block)
+            result.append((block['method_name'], trajectory if indexes is None else trajectory.take(indexes)))
+        return result
+
+    @property
+    def original_matching_result(self) -> list[tuple[str, TrajectoryArray]]:
+        return [(block['method_name'], self._trajectory(block)) for block in self.header['matching_result']]
+
+    def to_dict(self, original=False):
+        """
+        Same document as iter_json().
+        """
+        return {
+            'group_id': self.header['group_id'],
+            'traj_name': self.header['traj_name'],
+            'bounds': self.header['bounds'],
+            'raw_traj': self.raw_traj.to_list(),
+            'matching_result': [{
+                'method_name': name,
+                'trajectory': trajectory.to_list()
+            } for name, trajectory in (self.original_matching_result if original else self.matching_result)]
+        }
+
+    def iter_json(self, status_code=None, original=False):
+        """
+        Yield the detail as JSON text chunks, at most STREAM_BATCH points at a time.
+        With status_code the detail is wrapped like good_request(), with original
+        the matcher outputs are not simplified (the `<name>.json` export).
+        """
+        dumps = json.dumps
+        if status_code is not None:
+            yield '{"status_code": %d, "detail": ' % status_code
+        yield '{"group_id": %s, "traj_name": %s, "bounds": %s, "raw_traj": ' % (
+            dumps(self.header['group_id']), dumps(self.header['traj_name']), dumps(self.header['bounds']))
+        yield from _iter_points(self.raw_traj)
+        yield ', "matching_result": ['
+        matching_result = self.original_matching_result if original else self.matching_result
+        for index, (name, trajectory) in enumerate(matching_result):
+            yield '%s{"method_name": %s, "trajectory": ' % (', ' if index else '', dumps(name))
+            yield from _iter_points(trajectory)
+            yield '}'
+        yield ']}'
+        if status_code is not None:
+            yield '}'
+
+
+def _iter_points(trajectory: TrajectoryArray):
+    yield '['
+    for start in range(0, len(trajectory), STREAM_BATCH):
+        # the batch is written from its columns, see api/utils/serializer.py
+        batch = points_json(trajectory[start:start + STREAM_BATCH], spaced=True)
+        yield (', ' if start else '') + batch.decode('ascii')[1:-1]
+    yield ']'
+
+
+def sidecar_from_json(json_path: str, sidecar_path: str):
+    """
+    Convert a `<name>.json` written before the sidecar existed.
+    """
+    with open(json_path, 'r') as f:
+        detail = json.load(f)
+        f.close()
+    raw_traj = TrajectoryArray.from_points([{
+        'coordinates': [point['longitude'], point['latitude']],
+        'timestamp': point['timestamp']
+    } for point in detail['raw_traj']])
+    matching_result = [(matching['method_name'], TrajectoryArray(
+        [point['longitude'] for point in matching['trajectory']],
+        [point['latitude'] for point in matching['trajectory']])) for matching in detail['matching_result']]
+    write_sidecar(sidecar_path, detail['group_id'], detail['traj_name'], raw_traj, matching_result, detail['bounds'])
+
+
+def export_json(sidecar_path: str, json_path: str):
+    """
+    Write the JSON export of a sidecar unless it is up to date, with the original matcher outputs.
+    """
+    if os.path.exists(json_path) and os.path.getmtime(json_path) >= os.path.getmtime(sidecar_path):
+        return json_path
+    tmp_path = temporary_path(json_path)
+    with open(tmp_path, 'w') as f:
+        for chunk in MatchingSidecar(sidecar_path).iter_json(original=True):
+            f.write(chunk)
+        f.close()
+    os.replace(tmp_path, json_path)
+    return json_path
@@ -1,93 +1,214 @@
-"""
-https://codereview.stackexchange.com/questions/90194/multiple-longest-common-subsequence-another-algorithm
-"""
-import bisect
-from api.models.coordinate import Coordinate
-
-
-def mlcs(arrays):
-    """
-    Return a long common subsequence of the strings.
-    Uses a greedy algorithm, so the result is not necessarily the
-    longest common subsequence.
-    """
-    if not arrays:
-        raise ValueError("mlcs() argument is an empty sequence")
-    alphabet = set.intersection(*(set(array) for array in arrays))
-    print(alphabet)
-
-    # indexes[letter][i] is list of indexes of letter in arrays[i].
-    indexes = {coordinate: [[] for _ in arrays] for coordinate in alphabet}
-    for i, array in enumerate(arrays):
-        for j, coordinate in enumerate(array):
-            if coordinate in alphabet:
-                indexes[coordinate][i].append(j)
-
-    print(indexes)
-    # pos[i] is current position of search in strings[i].
-    pos = [len(array) for array in arrays]
-
-    # Generate candidate positions for next step in search.
-    def candidates():
-        for letter, letter_indexes in indexes.items():
-            # print("letter: %s, letter_indexes: %s" % (letter, letter_indexes))
-            distance, candidate = 0, []
-            for ind, p in zip(letter_indexes, pos):
-                i = bisect.bisect_right(ind, p - 1) - 1
-                q = ind[i]
-                if i < 0 or q > p - 1:
-                    break
-                candidate.append(q)
-                distance += (p - q)**2
-            else:
-                print("distance: %s, letter: %s, candidate: %s" %
-                      (distance, letter, candidate))
-                yield distance, letter, candidate
-
-    result = []
-    while True:
-        try:
-            # Choose the closest candidate position, if any.
-            _, letter, pos = min(candidates())
-        except ValueError:
-            return list(reversed(result))
-        result.append('(%s %s)' % (letter, pos))
-
-
-if __name__ == "__main__":
-    print(
-        mlcs([
-            [
-                Coordinate('1', '2'),
-                Coordinate('1', '3'),
-                Coordinate('1', '4'),
-                Coordinate('1', '3'),
-                Coordinate('1', '3'),
-                Coordinate('2', '2')],
-            [
-                Coordinate('1', '2'),
-                Coordinate('2', '2'),
-                Coordinate('1', '3'),
-                Coordinate('1', '3'),
-                Coordinate('1', '3')],
-            [
-                Coordinate('2', '4'),
-                Coordinate('1', '2'),
-                Coordinate('1', '3'),
-                Coordinate('1', '3'),
-                Coordinate('1', '3'),
-                Coordinate('2', '2')],
-            [
-                Coordinate('2', '2'),
-                Coordinate('1', '2'),
-                Coordinate('1', '4'),
-                Coordinate('2', '2'),
-                Coordinate('1', '3'),
-                Coordinate('1', '3'),
-                Coordinate('2', '2'),
-                Coordinate('1', '2'),
-                Coordinate('1', '3'),
-                Coordinate('2', '2'),
-                Coordinate('1', '3')]
-        ])
-    )
+"""
+Multiple longest common subsequence of N matcher outputs.
+- mlcs(): dominant-point search, layer d holds the non-dominated index tuples of
+  common subsequences of length d. With a beam width only the most promising
+  tuples of each layer are expanded, which bounds time and memory.
+- items only need to be hashable, api.utils.snapping.snap_sequences() turns
+  coordinates into int keys that also match across float formatting.
+- greedy_mlcs(): the previous greedy algorithm, kept for comparison.
+  https://codereview.stackexchange.com/questions/90194/multiple-longest-common-subsequence-another-algorithm
+"""
+import bisect
+import heapq
+from api.models.coordinate import Coordinate
+
+BEAM_WIDTH = 16
+WINDOW = 16
+
+
+def _intern(arrays):
+    """
+    Map items to integer ids, items missing from any array become -1.
+    """
+    ids = {}
+    for x in arrays[0]:
+        ids.setdefault(x, len(ids))
+    common = set(ids.values())
+    for array in arrays[1:]:
+        common &= {ids[x] for x in array if x in ids}
+    seqs = []
+    for array in arrays:
+        seq = [ids.get(x, -1) for x in array]
+        seqs.append([c if c in common else -1 for c in seq])
+    # occurrences[k][id] is the sorted list of positions of id in seqs[k]
+    occurrences = []
+    for seq in seqs:
+        occurrence = {}
+        for j, c in enumerate(seq):
+            if c >= 0:
+                occurrence.setdefault(c, []).append(j)
+        occurrences.append(occurrence)
+    return seqs, occurrences
+
+
+def _prune_dominated(states):
+    """
+    Keep states that no other state precedes in every array.
+    """
+    kept = []
+    for state in sorted(states, key=sum):
+        for other in kept:
+            if all(q <= p for q, p in zip(other, state)):
+                break
+        else:
+            kept.append(state)
+    return kept
+
+
+def mlcs(arrays, beam_width=BEAM_WIDTH, window=WINDOW):
+    """
+    Return a long common subsequence of the arrays and its indexes in every array.
+    - beam_width: states expanded per layer, None for no limit.
+    - window: successors are searched among the next `window` items of every array,
+      None to consider the whole alphabet.
+    With beam_width=None and window=None the result is an exact MLCS.
+    ---
+    return: result, [index_0, index_1, ...] with arrays[k][index_k[t]] == result[t]
+    """
+    if not arrays:
+        raise ValueError("mlcs() argument is an empty sequence")
+    seqs, occurrences = _intern(arrays)
+    lengths = [len(seq) for seq in seqs]
+    if min(lengths) == 0:
+        return [], [[] for _ in arrays]
+    alphabet = list(occurrences[0].keys())
+
+    def successors(state):
+        if window is None:
+            candidates = alphabet
+        else:
+            candidates = set()
+            for seq, p in zip(seqs, state):
+                candidates.update(seq[p + 1:p + 1 + window])
+            candidates.discard(-1)
+        found = []
+        for c in candidates:
+            q = []
+            for occurrence, p in zip(occurrences, state):
+                positions = occurrence[c]
+                i = bisect.bisect_right(positions, p)
+                if i == len(positions):
+                    break
+                q.append(positions[i])
+            else:
+                found.append(tuple(q))
+        return found
+
+    def remaining(state):
+        # upper bound of the items still to be matched after state
+        return min(n - 1 - p for n, p in zip(lengths, state))
+
+    start = tuple(-1 for _ in seqs)
+    # parents[d][state] is the state of layer d-1 it was reached from
+    parents = [{start: None}]
+    layer = [start]
+    while True:
+        next_parents = {}
+        for state in layer:
+            for successor in successors(state):
+                if successor not in next_parents:
+                    next_parents[successor] = state
+        if not next_parents:
+            break
+        candidates = next_parents.keys()
+        if beam_width is not None and len(next_parents) > beam_width:
+            candidates = heapq.nsmallest(beam_width, candidates, key=lambda s: (-remaining(s), sum(s)))
+        layer = _prune_dominated(candidates)
+        parents.append({state: next_parents[state] for state in layer})
+
+    # read the subsequence back from the last layer
+    path = []
+    state = layer[0]
+    for d in range(len(parents) - 1, 0, -1):
+        path.append(state)
+        state = parents[d][state]
+    path.reverse()
+    result = [arrays[0][state[0]] for state in path]
+    indexes = [[state[k] for state in path] for k in range(len(arrays))]
+    return result, indexes
+
+
+def greedy_mlcs(arrays):
+    """
+    Return a long common subsequence of the strings.
+    Uses a greedy algorithm, so the result is not necessarily the
+    longest common subsequence.
+    """
+    if not arrays:
+        raise ValueError("mlcs() argument is an empty sequence")
+    alphabet = set.intersection(*(set(array) for array in arrays))
+
+    # indexes[letter][i] is list of indexes of letter in arrays[i].
+    indexes = {coordinate: [[] for _ in arrays] for coordinate in alphabet}
+    for i, array in enumerate(arrays):
+        for j, coordinate in enumerate(array):
+            if coordinate in alphabet:
+                indexes[coordinate][i].append(j)
+
+    # pos[i] is current position of search in strings[i].
+    pos = [len(array) for array in arrays]
+
+    # Generate candidate positions for next step in search.
+    def candidates():
+        for letter, letter_indexes in indexes.items():
+            distance, candidate = 0, []
+            for ind, p in zip(letter_indexes, pos):
+                i = bisect.bisect_right(ind, p - 1) - 1
+                q = ind[i]
+                if i < 0 or q > p - 1:
+                    break
+                candidate.append(q)
+                distance += (p - q)**2
+            else:
+                yield distance, candidate
+
+    path = []
+    while True:
+        try:
+            # Choose the closest candidate position, if any.
+            _, pos = min(candidates())
+        except ValueError:
+            break
+        path.append(pos)
+    path.reverse()
+    result = [arrays[0][state[0]] for state in path]
+    return result, [[state[k] for state in path] for k in range(len(arrays))]
+
+
+if __name__ == "__main__":
+    print(
+        mlcs([
+            [
+                Coordinate('1', '2'),
+                Coordinate('1', '3'),
+                Coordinate('1', '4'),
+                Coordinate('1', '3'),
+                Coordinate('1', '3'),
+                Coordinate('2', '2')],
+            [
+                Coordinate('1', '2'),
+                Coordinate('2', '2'),
+                Coordinate('1', '3'),
+                Coordinate('1', '3'),
+                Coordinate('1', '3')],
+            [
+                Coordinate('2', '4'),
+                Coordinate('1', '2'),
+                Coordinate('1', '3'),
+                Coordinate('1', '3'),
+                Coordinate('1', '3'),
+                Coordinate('2', '2')],
+            [
+                Coordinate('2', '2'),
+                Coordinate('1', '2'),
+                Coordinate('1', '4'),
+                Coordinate('2', '2'),
+                Coordinate('1', '3'),
+                Coordinate('1', '3'),
+                Coordinate('2', '2'),
+                Coordinate('1', '2'),
+                Coordinate('1', '3'),
+                Coordinate('2', '2'),
+                Coordinate('1', '3')]
+        ], beam_width=None, window=None)
+    )
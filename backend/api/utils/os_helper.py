@@ -4,8 +4,10 @@ Date: 2022-04-06 15:44:42
 Description: OS Helper Functions
 '''
 import shutil
+import signal
 import subprocess
 import os
+import uuid
 from flask import current_app
 
 
@@ -56,11 +58,24 @@ def create_user_modify_folder(user_id):
     return input_path, output_path, matching_path
 
 
-def cmd(command):
+def temporary_path(path: str):
+    """
+    Unique sibling of path to write before os.replace(), per process and per thread.
+    """
+    return '%s.%s-%s.tmp' % (path, os.getpid(), uuid.uuid4().hex)
+
+
+def cmd(command, timeout=None):
     result = {}
     p = subprocess.Popen(command, stdin=subprocess.PIPE,
-                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-    (out, err) = p.communicate()
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, start_new_session=True)
+    try:
+        (out, err) = p.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # kill the whole session, the shell would leave the JVM running
+        os.killpg(p.pid, signal.SIGKILL)
+        (out, err) = p.communicate()
+        err += ('\ntimeout after %ss' % timeout).encode('utf-8')
     result['stdout'] = out.decode('utf-8')
     result['stderr'] = err.decode('utf-8')
     return p.returncode, result
\ No newline at end of file
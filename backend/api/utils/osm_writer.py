@@ -0,0 +1,186 @@
+'''
+Author: MondayCha
+Date: 2022-05-07 21:05:33
+Description: Streaming OSM writer for the IEEE 2015 road networks
+
+- The bounds are computed first, chunk by chunk with numpy.
+- Nodes and ways are then written while `.nodes` and `.arcs` are read,
+  memory does not grow with the size of the network. Elements are formatted
+  from templates, XMLGenerator spends most of the time escaping numbers.
+- `.osm` is plain XML, `.osm.gz` is gzip (what OSM_FILE_PATH expects),
+  `.osm.pbf` needs the optional `osmium` package.
+
+    python -m api.utils.osm_writer /path/to/map-matching-dataset --format gz
+'''
+import argparse
+import gzip
+import os
+import sys
+import time
+from xml.sax.saxutils import quoteattr
+from api.utils.track_reader import iter_track
+
+OSM_FORMATS = {
+    'osm': '.osm',
+    'gz': '.osm.gz',
+    'pbf': '.osm.pbf',
+}
+GENERATOR = 'buaa_mdc'
+# attributes every node and way gets, as written before
+META = {'version': '0', 'timestamp': '2000-01-01T00:00:00Z', 'changeset': '1', 'uid': '1', 'user': GENERATOR}
+GZIP_LEVEL = 6
+WRITE_BATCH = 4096
+
+
+def way_tags(way_id: str):
+    return (('highway', 'tertiary'), ('name', way_id), ('oneway', 'yes'))
+
+
+def network_bounds(nodes_path: str):
+    """
+    (min_lon, min_lat, max_lon, max_lat) of a `.nodes` file, None if it is empty.
+    """
+    bounds = None
+    for chunk in iter_track(nodes_path, 'ieee', with_timestamp=False):
+        if not len(chunk):
+            continue
+        chunk_bounds = (chunk.longitude.min(), chunk.latitude.min(), chunk.longitude.max(), chunk.latitude.max())
+        if bounds is None:
+            bounds = chunk_bounds
+        else:
+            bounds = (min(bounds[0], chunk_bounds[0]), min(bounds[1], chunk_bounds[1]),
+                      max(bounds[2], chunk_bounds[2]), max(bounds[3], chunk_bounds[3]))
+    return None if bounds is None else tuple(float(value) for value in bounds)
+
+
+def iter_pairs(path: str, parse, on_error=None):
+    """
+    (id, first, second), the two tab separated columns of each line as text, checked with `parse`.
+    The id is the position of the line among the non-empty lines. Malformed lines are skipped
+    and reported through `on_error(path, line_number, line)`, they keep their id so the ids after
+    them do not shift (the same policy as api.utils.road_network).
+    """
+    with open(path, 'r') as f:
+        index = 0
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            index += 1
+            fields = line.split('\t')
+            try:
+                if len(fields) != 2:
+                    raise ValueError('expected 2 columns')
+                # only numbers reach the XML, nothing needs escaping
+                parse(fields[0]), parse(fields[1])
+            except ValueError:
+                if on_error is not None:
+                    on_error(path, line_number, line)
+                continue
+            yield index - 1, fields[0], fields[1]
+        f.close()
+
+
+def write_osm_xml(stream, nodes_path: str, arcs_path: str, bounds=None, on_error=None):
+    """
+    Write the XML document to a text stream, lines are joined and written WRITE_BATCH at a time.
+    """
+    meta = ' '.join('%s=%s' % (key, quoteattr(value)) for key, value in META.items())
+    node_line = '<node id="%d" lat="%s" lon="%s" ' + meta + ' />\n'
+    way_line = '<way id="%d" ' + meta + '><nd ref="%s" /><nd ref="%s" />' \
+        '<tag k="highway" v="tertiary" /><tag k="name" v="%d" /><tag k="oneway" v="yes" /></way>\n'
+    stream.write('<?xml version="1.0" encoding="utf-8"?>\n<osm version="0.6" generator="%s">\n' % GENERATOR)
+    if bounds is not None:
+        stream.write('<bounds minlat="%r" minlon="%r" maxlat="%r" maxlon="%r" />\n' % (bounds[1], bounds[0], bounds[3], bounds[2]))
+    node_count = 0
+    batch = []
+    for node_count, (node_id, lon, lat) in enumerate(iter_pairs(nodes_path, float, on_error), 1):
+        batch.append(node_line % (node_id, lat, lon))
+        if len(batch) >= WRITE_BATCH:
+            stream.write(''.join(batch))
+            batch = []
+    way_count = 0
+    for way_count, (way_id, start_node, end_node) in enumerate(iter_pairs(arcs_path, int, on_error), 1):
+        batch.append(way_line % (way_id, start_node, end_node, way_id))
+        if len(batch) >= WRITE_BATCH:
+            stream.write(''.join(batch))
+            batch = []
+    stream.write(''.join(batch))
+    stream.write('</osm>\n')
+    return node_count, way_count
+
+
+def write_osm_pbf(output_path: str, nodes_path: str, arcs_path: str, bounds=None, on_error=None):
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError('writing .osm.pbf needs the osmium package (pip install osmium)')
+    header = osmium.io.Header()
+    header.set('generator', GENERATOR)
+    if bounds is not None:
+        header.add_box(osmium.osm.Box(osmium.osm.Location(bounds[0], bounds[1]), osmium.osm.Location(bounds[2], bounds[3])))
+    attributes = dict(version=0, timestamp=META['timestamp'], changeset=1, uid=1, user=GENERATOR)
+    writer = osmium.SimpleWriter(output_path, 0, header)
+    try:
+        node_count = 0
+        for node_count, (node_id, lon, lat) in enumerate(iter_pairs(nodes_path, float, on_error), 1):
+            writer.add_node(osmium.osm.mutable.Node(id=node_id, location=(float(lon), float(lat)), **attributes))
+        way_count = 0
+        for way_count, (way_id, start_node, end_node) in enumerate(iter_pairs(arcs_path, int, on_error), 1):
+            writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=[int(start_node), int(end_node)],
+                                                  tags=dict(way_tags(str(way_id))), **attributes))
+    finally:
+        writer.close()
+    return node_count, way_count
+
+
+def write_ieee_osm(nodes_path: str, arcs_path: str, output_path: str, on_error=None):
+    """
+    Write the network as `.osm`, `.osm.gz` or `.osm.pbf`, picked by the suffix of output_path.
+    Returns (node count, way count, bounds), malformed lines are skipped and not counted.
+    """
+    bounds = network_bounds(nodes_path)
+    if output_path.endswith(OSM_FORMATS['pbf']):
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return write_osm_pbf(output_path, nodes_path, arcs_path, bounds, on_error) + (bounds,)
+    if output_path.endswith(OSM_FORMATS['gz']):
+        stream = gzip.open(output_path + '.tmp', 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8')
+    else:
+        stream = open(output_path + '.tmp', 'w', encoding='utf-8')
+    with stream:
+        counts = write_osm_xml(stream, nodes_path, arcs_path, bounds, on_error)
+    os.replace(output_path + '.tmp', output_path)
+    return counts + (bounds,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the road network of every IEEE trajectory folder as OSM.')
+    parser.add_argument('dataset', help='folder with one sub folder per trajectory id')
+    parser.add_argument('--format', choices=sorted(OSM_FORMATS), default='osm')
+    parser.add_argument('--output', help='output folder, <dataset>/osm by default')
+    args = parser.parse_args()
+    output_folder = args.output or os.path.join(args.dataset, 'osm')
+    os.makedirs(output_folder, exist_ok=True)
+
+    skipped = []
+
+    def on_error(path, line_number, line):
+        skipped.append(line_number)
+        print('%s:%s: skipped malformed line %r' % (path, line_number, line), file=sys.stderr)
+
+    for network_id in sorted(os.listdir(args.dataset)):
+        nodes_path = os.path.join(args.dataset, network_id, '%s.nodes' % network_id)
+        arcs_path = os.path.join(args.dataset, network_id, '%s.arcs' % network_id)
+        if not (os.path.exists(nodes_path) and os.path.exists(arcs_path)):
+            continue
+        del skipped[:]
+        start = time.perf_counter()
+        output_path = os.path.join(output_folder, network_id + OSM_FORMATS[args.format])
+        node_count, way_count, _ = write_ieee_osm(nodes_path, arcs_path, output_path, on_error)
+        print('%s: %s nodes, %s ways, %s lines skipped in %.2fs -> %s' % (
+            network_id, node_count, way_count, len(skipped), time.perf_counter() - start, output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+'''
+Author: MondayCha
+Date: 2022-05-06 11:08:25
+Description: Keyset pagination over integer primary keys
+
+Pages are `WHERE id > :after ORDER BY id LIMIT :size`, so the cost of a page
+does not grow with its position. The cursor is the hashid of the last id.
+'''
+from app import hashids
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def decode_cursor(cursor):
+    """
+    Id after which the page starts, 0 for the first page.
+    ValueError for a cursor that was not issued by keyset_page().
+    """
+    if not cursor:
+        return 0
+    decoded = hashids.decode(cursor)
+    if not decoded:
+        raise ValueError('illegal cursor: %s' % cursor)
+    return decoded[0]
+
+
+def keyset_page(query, id_column, cursor=None, size=None):
+    """
+    Return (items, next_cursor), next_cursor is None on the last page.
+    Without size all remaining rows are returned.
+    ValueError for an illegal cursor or a size below 1, routes answer 400.
+    """
+    query = query.filter(id_column > decode_cursor(cursor)).order_by(id_column)
+    if size is None:
+        return query.all(), None
+    size = int(size)
+    if size < 1:
+        raise ValueError('illegal page size: %s' % size)
+    # one extra row tells whether another page exists
+    items = query.limit(size + 1).all()
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    return items, hashids.encode(items[-1].id)
+
+
+def with_next_cursor(response, next_cursor):
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
@@ -0,0 +1,364 @@
+'''
+Author: MondayCha
+Date: 2022-05-09 15:26:48
+Description: Server-side pre-annotation, a port of frontend/src/wasm/pre-annotation
+
+The first enabled matching method is the baseline, the LCS of the baseline with
+every other method gives the common indexes. Runs of common indexes that are
+continuous in the methods become matched areas. The sub-trajectories between
+two matched areas are merged with a union-find when their (simplified)
+trajectories agree: one group is a prematched area, several groups are a
+mismatched area. The document has the same fields as the WASM `pre_annotate()`.
+
+The matcher outputs are the simplified ones the annotation page receives.
+Points are snapped once with api.utils.snapping, the LCS is the bit-parallel
+api.utils.lcs, so ties between equally long subsequences can resolve to other
+indexes than the DP table of the WASM crate.
+At ingestion `<name>.pre.json` is written next to the matching sidecar and
+`pre_annotation.json` of the data group ranks the trajectories by mismatch.
+
+    python -m api.utils.pre_annotation <matching folder> --workers 4
+'''
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from api.models.trajectory import MatchingMethod, SubTrajectory
+from api.utils.lcs import lcs
+from api.utils.matching_store import SIDECAR_EXTENSION, MatchingSidecar
+from api.utils.simplification import collinear_indexes
+from api.utils.serializer import dump
+from api.utils.snapping import SnapGrid
+
+# MatchingMethod names known to the annotator, any other name is an `Annotator`
+ANNOTATOR_TYPES = ('STMatching', 'SimpleMapMatching', 'GHMapMatching')
+PRE_ANNOTATION_EXTENSION = '.pre.json'
+RANKING_FILE = 'pre_annotation.json'
+# the options of the annotation page, see Annotation.tsx
+DEFAULT_CONFIG = {
+    'auto_merge_circle': True,
+    'simplify_threshold': 1e-16,
+    'disabled_annotators': [],
+    # points closer than this are the same vertex, far below the output precision
+    'epsilon': 1e-9,
+}
+# simplified sub-trajectories of very different length are never merged
+MERGE_LENGTH_RATIO = 4.1
+
+
+def get_annotator_type(method_name: str) -> str:
+    return method_name if method_name in ANNOTATOR_TYPES else 'Annotator'
+
+
+def lcs_length(a: list, b: list) -> int:
+    return len(lcs(a, b)[0])
+
+
+class UnionFind:
+    def __init__(self, nodes):
+        self.parents = {node: node for node in nodes}
+
+    def union(self, i, j):
+        self.parents[self.find(j)] = self.find(i)
+
+    def find(self, i):
+        root = i
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while i != root:
+            self.parents[i], i = root, self.parents[i]
+        return root
+
+
+class SubAnnotation:
+    """
+    A sub-trajectory of one method between two matched areas.
+    """
+    def __init__(self, owner_type: str, keys: list[int], sub_trajectory: SubTrajectory, threshold: float):
+        self.owner_type: str = owner_type
+        self.sub_trajectory: SubTrajectory = sub_trajectory
+        self.keys: list[int] = keys[sub_trajectory.begin_index:sub_trajectory.end_index + 1]
+        trajectory = sub_trajectory.trajectory
+        self.simplified_keys: list[int] = [self.keys[index] for index in
+                                           collinear_indexes(trajectory.longitude, trajectory.latitude, threshold).tolist()]
+        self.has_circle: bool = len(set(self.keys)) < len(self.keys)
+
+    def owner(self, has_error: bool = False):
+        return {
+            'owner_type': self.owner_type,
+            'has_error': has_error,
+            'start_index': self.sub_trajectory.begin_index,
+            'end_index': self.sub_trajectory.end_index,
+        }
+
+
+class PreAnnotator:
+    def __init__(self, methods: list[MatchingMethod], config: dict = None):
+        """
+        methods: matching methods with their raw_traj, the first one is the baseline.
+        """
+        self.config: dict = dict(DEFAULT_CONFIG, **(config or {}))
+        grid = SnapGrid(self.config['epsilon'])
+        self.methods: dict[str, MatchingMethod] = {}
+        self.keys: dict[str, list[int]] = {}
+        for method in methods:
+            annotator_type = get_annotator_type(method.name)
+            self.methods[annotator_type] = method
+            self.keys[annotator_type] = grid.keys(method.raw_traj.longitude, method.raw_traj.latitude).tolist()
+        self.baseline_type: str = get_annotator_type(methods[0].name)
+        # index_maps[type][baseline index] is the index of the same point in that method
+        self.index_maps: dict[str, dict[int, int]] = {self.baseline_type: _IdentityMap()}
+        self.common_indexes: list[int] = []
+        self.metric_u_turns_count = 0
+        self.metric_single_lcs_count = 0
+        self.metric_simplified_traj_count = 0
+        for annotator_type in list(self.methods)[1:]:
+            self.add_sub_annotator(annotator_type)
+
+    def add_sub_annotator(self, annotator_type: str):
+        _, index_base, index_method = lcs(self.keys[self.baseline_type], self.keys[annotator_type])
+        self.index_maps[annotator_type] = dict(zip(index_base, index_method))
+        if len(self.index_maps) == 2:
+            self.common_indexes = index_base
+        else:
+            common = set(self.common_indexes)
+            self.common_indexes = [index for index in index_base if index in common]
+
+    def is_continuous(self, last_index: int, current_index: int) -> bool:
+        steps = (index_map[last_index] + 1 == index_map[current_index] for index_map in self.index_maps.values())
+        return any(steps) if self.config['auto_merge_circle'] else all(steps)
+
+    def sub_annotation(self, annotator_type: str, start: int, end: int) -> SubAnnotation:
+        sub_trajectory = SubTrajectory(annotator_type, self.methods[annotator_type].raw_traj, start, end)
+        return SubAnnotation(annotator_type, self.keys[annotator_type], sub_trajectory, self.config['simplify_threshold'])
+
+    def merge_sub_annotations(self, area_id: int, subs: list[SubAnnotation]):
+        """
+        ('mismatched' | 'prematched', area) of the sub-trajectories between two matched areas.
+        """
+        auto_merge_circle = self.config['auto_merge_circle']
+        union_find = UnionFind(sub.owner_type for sub in subs)
+        failed_types = set()
+        for i, sub_i in enumerate(subs):
+            for j in range(i + 1, len(subs)):
+                sub_j = subs[j]
+                raw_lcs_length = lcs_length(sub_i.keys, sub_j.keys)
+                sim_i, sim_j = len(sub_i.simplified_keys), len(sub_j.simplified_keys)
+                can_union = False
+                if raw_lcs_length in (len(sub_i.keys), len(sub_j.keys)):
+                    can_union = sim_i / sim_j < MERGE_LENGTH_RATIO and sim_j / sim_i < MERGE_LENGTH_RATIO
+                else:
+                    sim_lcs_length = lcs_length(sub_i.simplified_keys, sub_j.simplified_keys)
+                    if auto_merge_circle:
+                        can_union = sim_lcs_length in (sim_i, sim_j)
+                    else:
+                        can_union = sim_i == sim_j == sim_lcs_length
+                if not can_union:
+                    continue
+                self.metric_simplified_traj_count += 1
+                father, son = (sub_i, sub_j) if raw_lcs_length == len(sub_i.keys) else (sub_j, sub_i)
+                if father.has_circle != son.has_circle:
+                    if not auto_merge_circle:
+                        continue
+                    failed_types.add(son.owner_type)
+                union_find.union(father.owner_type, son.owner_type)
+
+        groups: dict[str, list[SubAnnotation]] = {}
+        for sub in subs:
+            groups.setdefault(union_find.find(sub.owner_type), []).append(sub)
+        by_type = {sub.owner_type: sub for sub in subs}
+        merged = [{
+            'owners': [sub.owner(sub.owner_type in failed_types) for sub in group],
+            'base_owner_type': parent_type,
+            'traj': by_type[parent_type].sub_trajectory.trajectory.to_list(),
+        } for parent_type, group in groups.items()]
+        self.metric_u_turns_count += len(failed_types)
+        if len(merged) > 1:
+            return 'mismatched', {'id': area_id, 'sub_trajs': merged}
+        return 'prematched', {'id': area_id, 'sub_traj': merged[0]}
+
+    def add_area_between(self, areas: dict, area_id: int, starts: dict, ends: dict):
+        subs = [self.sub_annotation(annotator_type, starts[annotator_type], ends[annotator_type])
+                for annotator_type in self.methods if ends[annotator_type] > starts[annotator_type]]
+        if subs:
+            kind, area = self.merge_sub_annotations(area_id, subs)
+            areas['%s_areas' % kind].append(area)
+
+    def generate_matched_areas(self) -> dict:
+        areas = {'matched_areas': [], 'prematched_areas': [], 'mismatched_areas': []}
+        common_indexes = self.common_indexes
+        baseline_traj = self.methods[self.baseline_type].raw_traj
+        if common_indexes:
+            area_id = 1
+            area_start = common_indexes[0]
+            for i in range(1, len(common_indexes)):
+                last_index, current_index = common_indexes[i - 1], common_indexes[i]
+                continuous = self.is_continuous(last_index, current_index)
+                is_end = i == len(common_indexes) - 1
+                if not is_end and continuous:
+                    continue
+                area_end = current_index if is_end and continuous else last_index
+                # do not add single-point common area
+                if area_end > area_start:
+                    areas['matched_areas'].append({'id': area_id, 'sub_traj': {
+                        'owner': {'owner_type': self.baseline_type, 'has_error': False,
+                                  'start_index': area_start, 'end_index': area_end},
+                        'traj': baseline_traj[area_start:area_end + 1].to_list(),
+                        'has_circle': False,
+                    }})
+                    area_id += 2
+                else:
+                    self.metric_single_lcs_count += 1
+                area_start = current_index
+
+            # the areas before, between and after the matched areas
+            area_start, area_id = 0, 0
+            for matched_area in list(areas['matched_areas']):
+                owner = matched_area['sub_traj']['owner']
+                starts = {annotator_type: index_map[area_start] if area_start else 0
+                          for annotator_type, index_map in self.index_maps.items()}
+                ends = {annotator_type: index_map[owner['start_index']] for annotator_type, index_map in self.index_maps.items()}
+                self.add_area_between(areas, area_id, starts, ends)
+                area_start, area_id = owner['end_index'], matched_area['id'] + 1
+            starts = {annotator_type: index_map[area_start] if area_start else 0
+                      for annotator_type, index_map in self.index_maps.items()}
+            ends = {annotator_type: len(self.methods[annotator_type].raw_traj) - 1 for annotator_type in self.methods}
+            self.add_area_between(areas, area_id, starts, ends)
+
+        areas.update({
+            'metric_u_turns_count': self.metric_u_turns_count,
+            'metric_single_lcs_count': self.metric_single_lcs_count,
+            'metric_simplified_traj_count': self.metric_simplified_traj_count,
+        })
+        return areas
+
+
+class _IdentityMap:
+    """
+    index map of the baseline onto itself.
+    """
+    def __getitem__(self, index):
+        return index
+
+
+def pre_annotate(methods: list[MatchingMethod], config: dict = None):
+    """
+    The areas of `pre_annotate()`, None with less than two enabled methods.
+    """
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    methods = [method for method in methods if method.name not in config['disabled_annotators']]
+    if len(methods) < 2:
+        return None
+    return PreAnnotator(methods, config).generate_matched_areas()
+
+
+def summarize(areas: dict, baseline_length: int) -> dict:
+    """
+    Mismatch of one trajectory, the ranking key of the data group.
+    """
+    if areas is None:
+        return {'mismatched_areas': 0, 'prematched_areas': 0, 'matched_areas': 0, 'matched_ratio': 0}
+    matched_points = sum(area['sub_traj']['owner']['end_index'] - area['sub_traj']['owner']['start_index'] + 1
+                         for area in areas['matched_areas'])
+    return {
+        'mismatched_areas': len(areas['mismatched_areas']),
+        'prematched_areas': len(areas['prematched_areas']),
+        'matched_areas': len(areas['matched_areas']),
+        'matched_ratio': matched_points / baseline_length if baseline_length else 0,
+    }
+
+
+def get_pre_annotation_path(matching_path: str, data_name: str):
+    return os.path.join(matching_path, '%s%s' % (data_name, PRE_ANNOTATION_EXTENSION))
+
+
+def pre_annotate_sidecar(sidecar_path: str, output_path: str, config: dict = None):
+    """
+    Pre-annotate a matching sidecar and write the document atomically, run in the pool.
+    Returns the summary of the trajectory.
+    """
+    start = time.perf_counter()
+    sidecar = MatchingSidecar(sidecar_path)
+    methods = []
+    for name, trajectory in sidecar.matching_result:
+        method = MatchingMethod(name, sidecar_path)
+        method.raw_traj = trajectory
+        methods.append(method)
+    areas = pre_annotate(methods, config)
+    disabled = (config or {}).get('disabled_annotators', [])
+    enabled = [method for method in methods if method.name not in disabled]
+    summary = summarize(areas, len(enabled[0].raw_traj) if enabled else 0)
+    summary['name'] = sidecar.header['traj_name']
+    summary['seconds'] = round(time.perf_counter() - start, 4)
+    with open(output_path + '.tmp', 'wb') as f:
+        dump({'traj_name': summary['name'], 'summary': summary, 'pre_annotation': areas}, f)
+        f.close()
+    os.replace(output_path + '.tmp', output_path)
+    return summary
+
+
+def rank(summaries: list[dict]) -> list[dict]:
+    """
+    Most mismatched first: more mismatched areas, then fewer matched points.
+    """
+    return sorted(summaries, key=lambda summary: (-summary['mismatched_areas'], summary['matched_ratio'], summary['name']))
+
+
+def write_ranking(path: str, summaries: list[dict], config: dict = None):
+    ranking = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': dict(DEFAULT_CONFIG, **(config or {})),
+        'ranking': rank(summaries),
+    }
+    with open(path + '.tmp', 'wb') as f:
+        dump(ranking, f)
+        f.close()
+    os.replace(path + '.tmp', path)
+    return ranking
+
+
+def get_pre_annotation_pool(workers: int):
+    """
+    None with 0 workers, pre-annotation then runs inline. A daemonic process
+    cannot start a pool and runs inline too, job workers are not daemonic.
+    """
+    if not workers or multiprocessing.current_process().daemon:
+        return None
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def pre_annotate_folder(matching_path: str, config: dict = None, workers=None):
+    """
+    Pre-annotate every sidecar of a matching folder, returns the summaries.
+    """
+    sidecars = sorted(name for name in os.listdir(matching_path) if name.endswith(SIDECAR_EXTENSION))
+    arguments = [(os.path.join(matching_path, name),
+                  get_pre_annotation_path(matching_path, name[:-len(SIDECAR_EXTENSION)]), config) for name in sidecars]
+    if workers == 0 or not arguments:
+        return [pre_annotate_sidecar(*argument) for argument in arguments]
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(pre_annotate_sidecar, *zip(*arguments)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-annotate the matching sidecars of a data group.')
+    parser.add_argument('matching', help='matching folder of the data group, media/group/<id>/matching')
+    parser.add_argument('--workers', type=int, default=None, help='pool size, 0 runs inline (cpu count by default)')
+    parser.add_argument('--no-merge-circle', action='store_true', help='do not merge sub-trajectories with u-turns')
+    parser.add_argument('--disable', default='', help='comma separated matching methods to leave out')
+    args = parser.parse_args()
+    config = {
+        'auto_merge_circle': not args.no_merge_circle,
+        'disabled_annotators': [name.strip() for name in args.disable.split(',') if name.strip()],
+    }
+    start = time.perf_counter()
+    summaries = pre_annotate_folder(args.matching, config, args.workers)
+    ranking = write_ranking(os.path.join(os.path.dirname(os.path.abspath(args.matching)), RANKING_FILE), summaries, config)
+    for summary in ranking['ranking'][:20]:
+        print('%s: %s mismatched areas, %.3f matched' % (summary['name'], summary['mismatched_areas'], summary['matched_ratio']))
+    print('%s trajectories in %.2fs' % (len(summaries), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
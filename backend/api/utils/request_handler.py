@@ -1,6 +1,7 @@
-from flask import jsonify
+from flask import current_app
 from http import HTTPStatus
 from enum import IntEnum
+from api.utils.serializer import dumps
 
 
 class RETStatus(IntEnum):
@@ -26,20 +27,23 @@ class RETStatus(IntEnum):
     FILE_SYSTEM_ERR = 50002, 'File system error'
 
 
+def json_response(data, status_code):
+    """
+    jsonify() through the configured serializer, see api/utils/serializer.py.
+    """
+    return current_app.response_class(dumps(data), status=status_code, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
 def good_request(detail=None):
     data = {
             'status_code': RETStatus.SUCCESS,
             'detail': detail if detail is not None else RETStatus.SUCCESS.description,
         }
-    response = jsonify(data)
-    response.status_code = HTTPStatus.OK
-    return response
+    return json_response(data, HTTPStatus.OK)
 
 def bad_request(ret_status_code=RETStatus.GENERAL_OTHER_ERR, status_code=HTTPStatus.BAD_REQUEST, detail=None):
     data = {
             'status_code': ret_status_code,
             'detail': detail or RETStatus(ret_status_code).description or HTTPStatus.BAD_REQUEST.description,
         }
-    response = jsonify(data)
-    response.status_code = status_code
-    return response
+    return json_response(data, status_code)
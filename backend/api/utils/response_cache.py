@@ -0,0 +1,144 @@
+'''
+Author: MondayCha
+Date: 2022-05-05 16:20:44
+Description: In-process LRU cache of responses built from files
+
+- Entries are keyed by file path, mtime, size and inode, so a rewritten
+  file is a miss and its old entry ages out of the LRU.
+- ETag and Last-Modified are derived from the same stat, requests with a
+  matching If-None-Match / If-Modified-Since get a 304 without reading the file.
+'''
+import os
+import threading
+from collections import OrderedDict
+from flask import Response, current_app, request
+from werkzeug.http import http_date
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes: int = max_bytes
+        self.max_entry_bytes: int = max_entry_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.not_modified: int = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body: bytes):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def collect(self, key, chunks):
+        """
+        Pass the chunks of a streamed body through and keep the body
+        once the stream is complete, unless it outgrows an entry.
+        """
+        parts, size = [], 0
+        for chunk in chunks:
+            data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+            if parts is not None:
+                size += len(data)
+                if size <= self.max_entry_bytes:
+                    parts.append(data)
+                else:
+                    parts = None
+            yield data
+        if parts is not None:
+            self.put(key, b''.join(parts))
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'not_modified': self.not_modified,
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                current_app.config.get('RESPONSE_CACHE_BYTES'),
+                current_app.config.get('RESPONSE_CACHE_ENTRY_BYTES'))
+        return _response_cache
+
+
+def cached_file_response(path: str, build, mimetype='application/json'):
+    """
+    Response for a body derived only from the file at `path`.
+    - build(): returns the body as bytes/str or an iterable of chunks, only called on a miss.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    etag = '%x-%x-%x' % (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    cache = get_response_cache()
+
+    def conditional(response):
+        response.set_etag(etag)
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        # revalidate every time, the file may be replaced while a job runs
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    # If-Modified-Since only counts without If-None-Match, seconds precision
+    if request.if_none_match:
+        modified = not request.if_none_match.contains(etag)
+    else:
+        modified = request.if_modified_since is None or int(stat.st_mtime) > request.if_modified_since.timestamp()
+    if not modified:
+        cache.count_not_modified()
+        return conditional(Response(status=304))
+
+    body = cache.get(key)
+    if body is not None:
+        response = Response(body, mimetype=mimetype)
+        response.headers['X-Cache'] = 'HIT'
+        return conditional(response)
+
+    current_app.logger.debug('[Cache] miss %s %s' % (path, cache.stats()))
+    body = build()
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if isinstance(body, bytes):
+        cache.put(key, body)
+    else:
+        body = cache.collect(key, body)
+    response = Response(body, mimetype=mimetype)
+    response.headers['X-Cache'] = 'MISS'
+    return conditional(response)
@@ -0,0 +1,367 @@
+'''
+Author: MondayCha
+Date: 2022-05-07 16:48:21
+Description: Road network of the IEEE 2015 dataset as flat arrays
+
+- `<id>.nodes`: `lon\tlat` per line, the node id is the line number
+- `<id>.arcs`: `source\ttarget` per line, the arc id is the line number
+- Malformed lines are skipped like api.utils.osm_writer skips them, their id
+  stays reserved: a skipped node has NaN coordinates and is not in the grid,
+  a skipped arc has source and target MISSING and is not in the adjacency.
+- Nodes are stored as contiguous float64 columns, outgoing arcs as CSR
+  (indptr per node, arc ids sorted by source), nearest-node lookups go
+  through a uniform grid over the bounds.
+- The store is built once per network and saved as `<id>.network.npz`,
+  loading it memory-maps the arrays in place.
+
+    python -m api.utils.road_network /path/to/map-matching-dataset
+'''
+import argparse
+import math
+import os
+import struct
+import sys
+import time
+import warnings
+import zipfile
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
+
+NETWORK_VERSION = 1
+NETWORK_EXTENSION = '.network.npz'
+# nodes per grid cell on average
+NODES_PER_CELL = 4
+METERS_PER_DEGREE = 111319.49079327357
+# node id of both ends of a skipped arc
+MISSING = -1
+
+
+def _read_table(path: str, dtype, columns: int, missing, on_error=None):
+    """
+    Row i is the i-th non-empty line of a whitespace separated file. If the bulk pass fails,
+    lines are parsed one by one: a malformed line is reported through
+    `on_error(path, line_number, line)` and its row is filled with `missing`.
+    """
+    try:
+        with warnings.catch_warnings():
+            # an empty file is an empty table
+            warnings.simplefilter('ignore')
+            table = np.loadtxt(path, dtype=dtype, ndmin=2, comments=None)
+        if table.size == 0:
+            return np.empty((0, columns), dtype=dtype)
+        if table.shape[1] == columns:
+            return table
+    except ValueError:
+        pass
+    parse = float if np.issubdtype(dtype, np.floating) else int
+    rows = []
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            fields = line.split()
+            try:
+                if len(fields) != columns:
+                    raise ValueError
+                rows.append([parse(field) for field in fields])
+            except ValueError:
+                if on_error is not None:
+                    on_error(path, line_number, line)
+                rows.append([missing] * columns)
+        f.close()
+    return np.array(rows, dtype=dtype).reshape(-1, columns)
+
+
+class RoadNetwork:
+    __slots__ = ('longitude', 'latitude', 'arc_source', 'arc_target', 'arc_indptr', 'arc_order',
+                 'cell_size', 'grid_origin', 'grid_shape', 'cell_indptr', 'cell_nodes')
+
+    def __init__(self, longitude, latitude, arc_source, arc_target, cell_size: float = None):
+        self.longitude: np.ndarray = np.ascontiguousarray(longitude, dtype=np.float64)
+        self.latitude: np.ndarray = np.ascontiguousarray(latitude, dtype=np.float64)
+        self.arc_source: np.ndarray = np.ascontiguousarray(arc_source, dtype=np.int32)
+        self.arc_target: np.ndarray = np.ascontiguousarray(arc_target, dtype=np.int32)
+        present = self.arc_source != MISSING
+        if present.any() and (min(self.arc_source[present].min(), self.arc_target[present].min()) < 0
+                              or max(self.arc_source[present].max(), self.arc_target[present].max()) >= len(self.longitude)):
+            raise ValueError('arc refers to a missing node')
+        self._build_adjacency()
+        self._build_grid(cell_size)
+
+    @classmethod
+    def from_ieee(cls, nodes_path: str, arcs_path: str, cell_size: float = None, on_error=None):
+        """
+        Skipped lines are reported through `on_error(path, line_number, line)`.
+        """
+        nodes = _read_table(nodes_path, np.float64, 2, math.nan, on_error)
+        arcs = _read_table(arcs_path, np.int64, 2, MISSING, on_error)
+        return cls(nodes[:, 0], nodes[:, 1], arcs[:, 0], arcs[:, 1], cell_size)
+
+    def _build_adjacency(self):
+        present = np.flatnonzero(self.arc_source != MISSING)
+        counts = np.bincount(self.arc_source[present], minlength=len(self.longitude))
+        self.arc_indptr = np.zeros(len(self.longitude) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.arc_indptr[1:])
+        self.arc_order = present[np.argsort(self.arc_source[present], kind='stable')].astype(np.int32)
+
+    def _build_grid(self, cell_size: float = None):
+        present = np.flatnonzero(~np.isnan(self.longitude) & ~np.isnan(self.latitude))
+        if len(present) == 0:
+            self.cell_size, self.grid_origin, self.grid_shape = 1.0, np.zeros(2), np.ones(2, dtype=np.int64)
+            self.cell_indptr, self.cell_nodes = np.zeros(2, dtype=np.int64), np.empty(0, dtype=np.int32)
+            return
+        longitude, latitude = self.longitude[present], self.latitude[present]
+        min_lon, min_lat = longitude.min(), latitude.min()
+        width, height = longitude.max() - min_lon, latitude.max() - min_lat
+        if cell_size is None:
+            cell_size = math.sqrt(max(width * height, 1e-12) * NODES_PER_CELL / len(present))
+            cell_size = max(cell_size, width / 4096, height / 4096, 1e-6)
+        self.cell_size = float(cell_size)
+        self.grid_origin = np.array([min_lon, min_lat])
+        self.grid_shape = np.array([int(width // cell_size) + 1, int(height // cell_size) + 1], dtype=np.int64)
+        cells = self._cells(longitude, latitude)
+        self.cell_nodes = present[np.argsort(cells, kind='stable')].astype(np.int32)
+        self.cell_indptr = np.zeros(int(self.grid_shape.prod()) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=int(self.grid_shape.prod())), out=self.cell_indptr[1:])
+
+    def _cell_xy(self, longitude, latitude):
+        x = np.floor((np.asarray(longitude) - self.grid_origin[0]) / self.cell_size).astype(np.int64)
+        y = np.floor((np.asarray(latitude) - self.grid_origin[1]) / self.cell_size).astype(np.int64)
+        return x, y
+
+    def _cells(self, longitude, latitude):
+        x, y = self._cell_xy(longitude, latitude)
+        return np.clip(y, 0, self.grid_shape[1] - 1) * self.grid_shape[0] + np.clip(x, 0, self.grid_shape[0] - 1)
+
+    def __len__(self):
+        return len(self.longitude)
+
+    @property
+    def arc_count(self) -> int:
+        return len(self.arc_source)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ('longitude', 'latitude', 'arc_source', 'arc_target',
+                                                         'arc_indptr', 'arc_order', 'cell_indptr', 'cell_nodes'))
+
+    def bounds(self):
+        if not len(self.cell_nodes):
+            return None
+        return {
+            'min_lon': float(np.nanmin(self.longitude)),
+            'max_lon': float(np.nanmax(self.longitude)),
+            'min_lat': float(np.nanmin(self.latitude)),
+            'max_lat': float(np.nanmax(self.latitude)),
+        }
+
+    def out_arcs(self, node: int) -> np.ndarray:
+        """
+        Ids of the arcs leaving a node.
+        """
+        return self.arc_order[self.arc_indptr[node]:self.arc_indptr[node + 1]]
+
+    def neighbors(self, node: int) -> np.ndarray:
+        return self.arc_target[self.out_arcs(node)]
+
+    def arc(self, arc_id: int):
+        return int(self.arc_source[arc_id]), int(self.arc_target[arc_id])
+
+    def find_arc(self, source: int, target: int):
+        """
+        Id of an arc from source to target, None if there is none.
+        """
+        arcs = self.out_arcs(source)
+        found = arcs[self.arc_target[arcs] == target]
+        return int(found[0]) if len(found) else None
+
+    def nodes_within(self, min_lon, min_lat, max_lon, max_lat) -> np.ndarray:
+        """
+        Ids of the nodes inside the box, sorted.
+        """
+        (x0, x1), (y0, y1) = self._cell_xy([min_lon, max_lon], [min_lat, max_lat])
+        x0, x1 = max(x0, 0), min(x1, self.grid_shape[0] - 1)
+        y0, y1 = max(y0, 0), min(y1, self.grid_shape[1] - 1)
+        if x0 > x1 or y0 > y1:
+            return np.empty(0, dtype=np.int32)
+        candidates = np.concatenate([self.cell_nodes[self.cell_indptr[y * self.grid_shape[0] + x0]:
+                                                     self.cell_indptr[y * self.grid_shape[0] + x1 + 1]]
+                                     for y in range(y0, y1 + 1)])
+        inside = (self.longitude[candidates] >= min_lon) & (self.longitude[candidates] <= max_lon) \
+            & (self.latitude[candidates] >= min_lat) & (self.latitude[candidates] <= max_lat)
+        return np.sort(candidates[inside])
+
+    def nearest_node(self, longitude: float, latitude: float):
+        """
+        (node id, distance in meters) of the node closest to the point, equirectangular distance.
+        Cells are searched ring by ring until no closer node can exist.
+        """
+        if not len(self.cell_nodes):
+            return None, math.inf
+        scale = math.cos(math.radians(latitude))
+        x, y = (int(value) for value in self._cell_xy(longitude, latitude))
+        x = min(max(x, 0), self.grid_shape[0] - 1)
+        y = min(max(y, 0), self.grid_shape[1] - 1)
+        best, best_distance = None, math.inf
+        max_ring = int(max(self.grid_shape)) + 1
+        for ring in range(max_ring + 1):
+            # nodes beyond this ring are at least this far away
+            if best is not None and (ring - 1) * self.cell_size * min(scale, 1) > best_distance:
+                break
+            candidates = self._ring_nodes(x, y, ring)
+            if not len(candidates):
+                continue
+            dx = (self.longitude[candidates] - longitude) * scale
+            dy = self.latitude[candidates] - latitude
+            distances = dx * dx + dy * dy
+            index = int(np.argmin(distances))
+            distance = math.sqrt(distances[index])
+            if distance < best_distance:
+                best, best_distance = int(candidates[index]), distance
+        return best, best_distance * METERS_PER_DEGREE
+
+    def _ring_nodes(self, x: int, y: int, ring: int):
+        width, height = int(self.grid_shape[0]), int(self.grid_shape[1])
+        x0, x1, y0, y1 = x - ring, x + ring, y - ring, y + ring
+        ranges = []
+        for row in (y0, y1) if ring else (y0,):
+            if 0 <= row < height:
+                ranges.append((row * width + max(x0, 0), row * width + min(x1, width - 1)))
+        if ring:
+            for column in (x0, x1):
+                if 0 <= column < width:
+                    for row in range(max(y0 + 1, 0), min(y1 - 1, height - 1) + 1):
+                        ranges.append((row * width + column, row * width + column))
+        parts = [self.cell_nodes[self.cell_indptr[start]:self.cell_indptr[end + 1]] for start, end in ranges if start <= end]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+
+    def nearest_nodes(self, longitude, latitude):
+        """
+        Vector of nearest_node ids and distances for many points.
+        """
+        result = [self.nearest_node(lon, lat) for lon, lat in zip(np.asarray(longitude).tolist(), np.asarray(latitude).tolist())]
+        return np.array([node for node, _ in result], dtype=np.int64), np.array([distance for _, distance in result])
+
+    def route_nodes(self, arc_ids) -> np.ndarray:
+        """
+        Node ids along a route of consecutive arcs, the first source then every target.
+        """
+        arc_ids = np.asarray(arc_ids, dtype=np.int64)
+        if not len(arc_ids):
+            return np.empty(0, dtype=np.int32)
+        if (self.arc_source[arc_ids] == MISSING).any():
+            raise ValueError('route uses a skipped arc')
+        return np.concatenate([self.arc_source[arc_ids[:1]], self.arc_target[arc_ids]])
+
+    def route_trajectory(self, arc_ids) -> TrajectoryArray:
+        nodes = self.route_nodes(arc_ids)
+        return TrajectoryArray(self.longitude[nodes], self.latitude[nodes])
+
+    def save(self, path: str):
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, version=np.array(NETWORK_VERSION), cell_size=np.array(self.cell_size),
+                     **{name: getattr(self, name) for name in self.__slots__ if name != 'cell_size'})
+            f.close()
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str, mmap=True):
+        """
+        Load a saved network, the arrays are memory-mapped unless mmap is False.
+        """
+        arrays = _map_npz(path) if mmap else dict(np.load(path))
+        if int(arrays['version']) != NETWORK_VERSION:
+            raise ValueError('%s has network version %s' % (path, int(arrays['version'])))
+        network = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(network, name, arrays[name])
+        network.cell_size = float(network.cell_size)
+        return network
+
+
+def _map_npz(path: str) -> dict:
+    """
+    Memory-map the members of an uncompressed `.npz` in place.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('%s is compressed' % path)
+            # local header: 30 bytes, then the name and the extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if not shape:
+                arrays[name] = np.frombuffer(f.read(dtype.itemsize), dtype=dtype)[0]
+            elif 0 in shape:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+def get_network_path(folder: str, network_id: str):
+    return os.path.join(folder, '%s%s' % (network_id, NETWORK_EXTENSION))
+
+
+def load_ieee_network(folder: str, network_id: str = None, rebuild=False, on_error=None) -> RoadNetwork:
+    """
+    Network of an IEEE trajectory folder, built and saved on first use or when the sources changed.
+    Lines skipped while building are reported through `on_error(path, line_number, line)`.
+    """
+    network_id = network_id or os.path.basename(os.path.normpath(folder))
+    nodes_path = os.path.join(folder, '%s.nodes' % network_id)
+    arcs_path = os.path.join(folder, '%s.arcs' % network_id)
+    network_path = get_network_path(folder, network_id)
+    if not rebuild and os.path.exists(network_path) and \
+            os.path.getmtime(network_path) >= max(os.path.getmtime(nodes_path), os.path.getmtime(arcs_path)):
+        return RoadNetwork.load(network_path)
+    network = RoadNetwork.from_ieee(nodes_path, arcs_path, on_error=on_error)
+    network.save(network_path)
+    return network
+
+
+def read_route(route_path: str, on_error=None) -> np.ndarray:
+    """
+    Arc ids of an IEEE `<id>.route` file, a skipped line is a MISSING arc.
+    """
+    return _read_table(route_path, np.int64, 1, MISSING, on_error)[:, 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the road network store of every IEEE trajectory folder.')
+    parser.add_argument('dataset', help='folder with one sub folder per trajectory id')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild even if the store is up to date')
+    args = parser.parse_args()
+    skipped = []
+
+    def on_error(path, line_number, line):
+        skipped.append(line_number)
+        print('%s:%s: skipped malformed line %r' % (path, line_number, line), file=sys.stderr)
+
+    for network_id in sorted(os.listdir(args.dataset)):
+        folder = os.path.join(args.dataset, network_id)
+        if not os.path.exists(os.path.join(folder, '%s.nodes' % network_id)):
+            continue
+        del skipped[:]
+        start = time.perf_counter()
+        network = load_ieee_network(folder, network_id, args.rebuild, on_error)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        RoadNetwork.load(get_network_path(folder, network_id))
+        print('%s: %s nodes, %s arcs, %s lines skipped, %.1f MB, built in %.3fs, loads in %.1fms' % (
+            network_id, len(network), network.arc_count, len(skipped), network.nbytes / 2**20, build_time,
+            (time.perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+'''
+Author: MondayCha
+Date: 2022-05-11 16:20:05
+Description: JSON serialization of responses and matching files
+
+dumps() encodes with orjson when it is installed and with the stdlib json
+module otherwise, the JSON_BACKEND config picks one (see configure()).
+TrajectoryArray values are written from their columns: each column is
+encoded as one JSON array by the backend, split at the commas and joined
+with the keys of the point objects, no dict is built per point.
+'''
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+import numpy as np
+from werkzeug.http import http_date
+from api.models.trajectory_array import TrajectoryArray
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ('orjson', 'json')
+# stands for a TrajectoryArray until its points are spliced in, private use code points
+PLACEHOLDER = '\ue000%d\ue001'
+
+
+def _default(value):
+    """
+    Types jsonify() knows beyond plain JSON, and numpy values.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
+
+
+class StdlibBackend:
+    name = 'json'
+
+    def dumps(self, value, default=_default) -> bytes:
+        return json.dumps(value, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def encode_column(self, column: np.ndarray) -> bytes:
+        return json.dumps(column.tolist(), separators=(',', ':')).encode('ascii')
+
+
+class OrjsonBackend:
+    name = 'orjson'
+
+    def dumps(self, value, default=_default) -> bytes:
+        # datetimes go through default, jsonify() writes them as http dates
+        return orjson.dumps(value, default=default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+                            | orjson.OPT_NON_STR_KEYS)
+
+    def encode_column(self, column: np.ndarray) -> bytes:
+        return orjson.dumps(np.ascontiguousarray(column), option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+_backend = None
+
+
+def get_backend(name: str = None):
+    """
+    Backend by name, 'auto' or None for orjson when it is installed.
+    """
+    if name in (None, 'auto'):
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson':
+        if orjson is None:
+            raise RuntimeError('the orjson JSON backend needs the orjson package (pip install orjson)')
+        return OrjsonBackend()
+    if name == 'json':
+        return StdlibBackend()
+    raise ValueError('unknown JSON backend %r' % name)
+
+
+def configure(name: str = None):
+    """
+    Backend used by dumps() and points_json() when none is given.
+    """
+    global _backend
+    _backend = get_backend(name)
+    return _backend
+
+
+def current_backend():
+    return _backend if _backend is not None else configure()
+
+
+def points_json(trajectory: TrajectoryArray, backend=None, spaced: bool = False) -> bytes:
+    """
+    Same JSON as `trajectory.to_list()`, built from the columns.
+    spaced: the separators of json.dumps() defaults, compact otherwise.
+    """
+    backend = backend or current_backend()
+    count = len(trajectory)
+    if count == 0:
+        return b'[]'
+    item, key = (b', ', b': ') if spaced else (b',', b':')
+    columns = [trajectory.longitude, trajectory.latitude]
+    keys = [item + b'"latitude"' + key]
+    if trajectory.timestamp is not None:
+        columns.append(trajectory.timestamp)
+        keys.append(item + b'"timestamp"' + key)
+    # numbers have no commas, so a column array splits into its values
+    values = [backend.encode_column(column)[1:-1].split(b',') for column in columns]
+    width = 2 * len(columns)
+    parts = [b'}' + item + b'{"longitude"' + key] * (width * count)
+    parts[0] = b'[{"longitude"' + key
+    parts[1::width] = values[0]
+    for index, separator in enumerate(keys, 1):
+        parts[2 * index::width] = [separator] * count
+        parts[2 * index + 1::width] = values[index]
+    parts.append(b'}]')
+    return b''.join(parts)
+
+
+def dumps(value, backend=None) -> bytes:
+    """
+    UTF-8 JSON of value, TrajectoryArray values anywhere in it are written as their points.
+    """
+    backend = backend or current_backend()
+    trajectories: list[TrajectoryArray] = []
+
+    def default(item):
+        if isinstance(item, TrajectoryArray):
+            trajectories.append(item)
+            return PLACEHOLDER % (len(trajectories) - 1)
+        return _default(item)
+
+    encoded = backend.dumps(value, default)
+    for index, trajectory in enumerate(trajectories):
+        placeholder = ('"%s"' % (PLACEHOLDER % index)).encode('utf-8')
+        encoded = encoded.replace(placeholder, points_json(trajectory, backend), 1)
+    return encoded
+
+
+def dump(value, f, backend=None):
+    """
+    dumps() into a file opened in binary mode.
+    """
+    f.write(dumps(value, backend))
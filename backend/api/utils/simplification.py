@@ -0,0 +1,136 @@
+'''
+Author: MondayCha
+Date: 2022-05-10 09:14:26
+Description: Simplification of matcher outputs
+
+Matcher outputs repeat every vertex of the road network, most of them on a
+straight line. Two modes return the indexes of the points to keep, so the
+simplified trajectory always maps back to the original:
+- collinear: `get_simplified_traj` of the WASM pre-annotation crate, a point is
+  dropped when the cross product of (point - anchor) and (next - anchor) is
+  below the threshold and both point the same way. The anchor is the last kept
+  point, the points after it are tested a window at a time with numpy.
+- douglas_peucker: Douglas-Peucker with a tolerance in meters, distances to the
+  segment in a local equirectangular projection, one numpy pass per segment.
+'''
+import math
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
+
+SIMPLIFY_MODES = ('none', 'collinear', 'douglas_peucker')
+# first window of points tested against one anchor, doubled while nothing is kept
+COLLINEAR_WINDOW = 64
+EARTH_RADIUS = 6371008.8
+
+
+def collinear_indexes(longitude, latitude, threshold: float) -> np.ndarray:
+    """
+    Same indexes as `get_simplified_traj` (which keeps only the first of two points).
+    """
+    lon = np.asarray(longitude, dtype=np.float64)
+    lat = np.asarray(latitude, dtype=np.float64)
+    count = len(lon)
+    if count < 3:
+        return np.zeros(min(count, 1), dtype=np.int64)
+    last = count - 2
+    points = np.stack([lon, lat], axis=1)
+    lon_list, lat_list = lon.tolist(), lat.tolist()
+    kept = [0]
+    i, j = 0, 1
+    while j <= last:
+        # the next point usually decides on its own, test it without numpy
+        x1, y1 = lon_list[j] - lon_list[i], lat_list[j] - lat_list[i]
+        x2, y2 = lon_list[j + 1] - lon_list[i], lat_list[j + 1] - lat_list[i]
+        if not (abs(x1 * y2 - y1 * x2) < threshold and x1 * x2 > 0 and y1 * y2 > 0):
+            failed = j
+        else:
+            failed, start, window = None, j + 1, COLLINEAR_WINDOW
+            while failed is None and start <= last:
+                stop = min(last, start + window - 1)
+                # vectors from the anchor to the points start..stop + 1
+                vectors = points[start:stop + 2] - points[i]
+                first, second = vectors[:-1], vectors[1:]
+                cross = first[:, 0] * second[:, 1] - first[:, 1] * second[:, 0]
+                dropped = (np.abs(cross) < threshold) & ((first * second) > 0).all(axis=1)
+                if not dropped.all():
+                    failed = start + int(dropped.argmin())
+                start, window = stop + 1, window * 2
+            if failed is None:
+                kept.append(count - 1)
+                break
+        if failed == last:
+            kept.extend((last, count - 1))
+            break
+        kept.append(failed)
+        i, j = failed, failed + 1
+    return np.array(kept, dtype=np.int64)
+
+
+def project(longitude, latitude):
+    """
+    Local equirectangular projection in meters, good enough for one trajectory.
+    """
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    scale = math.cos(float(lat.mean())) if len(lat) else 1.0
+    return lon * scale * EARTH_RADIUS, lat * EARTH_RADIUS
+
+
+def douglas_peucker_indexes(longitude, latitude, tolerance: float) -> np.ndarray:
+    """
+    Indexes kept by Douglas-Peucker, `tolerance` in meters.
+    """
+    x, y = project(longitude, latitude)
+    count = len(x)
+    if count < 3:
+        return np.arange(count, dtype=np.int64)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length = dx * dx + dy * dy
+        # distance to the segment, a u-turn back to the start is not on it
+        t = np.clip((px * dx + py * dy) / length, 0, 1) if length > 0 else 0
+        distance = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((split, last))
+            stack.append((first, split))
+    return np.flatnonzero(keep).astype(np.int64)
+
+
+def simplified_indexes(trajectory: TrajectoryArray, mode: str, tolerance: float) -> np.ndarray:
+    """
+    Indexes of the points to keep, the first and last point always are.
+    - collinear: tolerance is the cross product threshold in square degrees.
+    - douglas_peucker: tolerance in meters.
+    """
+    count = len(trajectory)
+    if mode == 'collinear':
+        indexes = collinear_indexes(trajectory.longitude, trajectory.latitude, tolerance)
+        if count > 1 and indexes[-1] != count - 1:
+            indexes = np.append(indexes, count - 1)
+        return indexes
+    if mode == 'douglas_peucker':
+        return douglas_peucker_indexes(trajectory.longitude, trajectory.latitude, tolerance)
+    if mode in (None, 'none'):
+        return np.arange(count, dtype=np.int64)
+    raise ValueError('unknown simplification mode %r' % mode)
+
+
+def simplify_matching_result(matching_result: list[tuple[str, TrajectoryArray]], mode: str, tolerance: float):
+    """
+    Index map of every method, None when nothing would be dropped.
+    """
+    simplified = []
+    for _, trajectory in matching_result:
+        indexes = simplified_indexes(trajectory, mode, tolerance)
+        simplified.append(None if len(indexes) == len(trajectory) else indexes)
+    return simplified
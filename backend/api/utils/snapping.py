@@ -0,0 +1,94 @@
+'''
+Author: MondayCha
+Date: 2022-05-09 10:05:31
+Description: Tolerance-aware coordinate keys for comparing matcher outputs
+
+`Coordinate.__eq__` compares strings, so the same road vertex printed as
+`116.3` and `116.300000` by two matchers never matches. Rounding inside
+`__eq__` fixes that but runs on every comparison of the LCS. Here every
+distinct point is snapped once to a square grid of `epsilon` degrees and gets
+an int key, lcs()/mlcs() then only compare ints:
+- a point takes the key of the first point seen in its cell, the cell is at
+  most `epsilon` wide so both are within `epsilon` on each axis.
+- a point in a cell nobody has used yet checks the 8 neighbor cells, a point
+  on the other side of a cell boundary within `epsilon` gives its key too.
+- otherwise the point starts a new key for its cell.
+A point keeps the key it got the first time, so the key of a coordinate does
+not depend on what is snapped after it. Keys are only comparable when they come from the same SnapGrid.
+'''
+import math
+import numpy as np
+
+SNAP_EPSILON = 1e-6
+NEIGHBOR_CELLS = tuple((dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy)
+
+
+class SnapGrid:
+    def __init__(self, epsilon: float = SNAP_EPSILON):
+        if not epsilon > 0:
+            raise ValueError('epsilon must be positive, got %r' % epsilon)
+        self.epsilon = float(epsilon)
+        # cell -> (key, longitude, latitude) of the first point snapped into it
+        self.cells = {}
+        # (longitude, latitude) -> key, a point matched to a neighbor cell does not own its cell
+        self.points = {}
+        self.size = 0
+
+    def snap(self, longitude: float, latitude: float) -> int:
+        key = self.points.get((longitude, latitude))
+        if key is None:
+            key = self.points[(longitude, latitude)] = self._snap(longitude, latitude)
+        return key
+
+    def _snap(self, longitude: float, latitude: float) -> int:
+        cell = (math.floor(longitude / self.epsilon), math.floor(latitude / self.epsilon))
+        found = self.cells.get(cell)
+        if found is not None:
+            return found[0]
+        best, best_distance = None, None
+        for dx, dy in NEIGHBOR_CELLS:
+            found = self.cells.get((cell[0] + dx, cell[1] + dy))
+            if found is None:
+                continue
+            distance = max(abs(found[1] - longitude), abs(found[2] - latitude))
+            if distance <= self.epsilon and (best is None or distance < best_distance):
+                best, best_distance = found[0], distance
+        if best is not None:
+            return best
+        self.cells[cell] = (self.size, longitude, latitude)
+        self.size += 1
+        return self.size - 1
+
+    def keys(self, longitude, latitude) -> np.ndarray:
+        """
+        int64 keys of the points, every distinct point is snapped once.
+        """
+        points = np.stack([np.asarray(longitude, dtype=np.float64), np.asarray(latitude, dtype=np.float64)], axis=1)
+        if not len(points):
+            return np.empty(0, dtype=np.int64)
+        distinct, first, inverse = np.unique(points, axis=0, return_index=True, return_inverse=True)
+        # snap in order of appearance so the first point seen owns its cell
+        order = np.argsort(first, kind='stable')
+        keys = np.empty(len(distinct), dtype=np.int64)
+        for index, (lon, lat) in zip(order.tolist(), distinct[order].tolist()):
+            keys[index] = self.snap(lon, lat)
+        return keys[inverse.reshape(-1)]
+
+
+def sequence_coordinates(sequence):
+    """
+    (longitude, latitude) arrays of a TrajectoryArray, Coordinates or (lon, lat) pairs.
+    """
+    if hasattr(sequence, 'longitude') and isinstance(sequence.longitude, np.ndarray):
+        return sequence.longitude, sequence.latitude
+    if len(sequence) and hasattr(sequence[0], 'longitude'):
+        return [float(c.longitude) for c in sequence], [float(c.latitude) for c in sequence]
+    return [float(p[0]) for p in sequence], [float(p[1]) for p in sequence]
+
+
+def snap_sequences(sequences, epsilon: float = SNAP_EPSILON) -> list[list[int]]:
+    """
+    Key lists for lcs()/mlcs(), all sequences share one grid.
+    """
+    grid = SnapGrid(epsilon)
+    return [grid.keys(*sequence_coordinates(sequence)).tolist() for sequence in sequences]
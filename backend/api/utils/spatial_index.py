@@ -0,0 +1,280 @@
+'''
+Author: MondayCha
+Date: 2022-05-11 10:37:52
+Description: Spatial index of a data group, SQLite R*Tree on disk
+
+One `spatial.sqlite` per data group, next to its json detail. It holds the
+trajectories ingested into the group, the re-matches of POST /api/matching
+stay in the scratch folder of their annotator and are not indexed:
+- trajectory: name, sources and the range of its segment row ids
+- trajectory_bbox: R*Tree of the bbox of every trajectory (all sources)
+- segment: R*Tree of the envelopes of the segments of the raw trajectory and
+  of every matcher output, CHUNK_SEGMENTS consecutive segments per row (an
+  R*Tree insert costs far more than the row). The points of the run are an
+  auxiliary float64 blob, so a query is refined exactly against every segment
+  without loading any trajectory.
+
+The R*Tree stores 32-bit bounds rounded outwards, it only selects candidates.
+Row ids of a trajectory are contiguous, replacing a trajectory deletes them
+by id. Every replace or remove is its own transaction, so the write lock is
+never held between two trajectories, readers see the last commit (WAL).
+'''
+import math
+import os
+import sqlite3
+from contextlib import contextmanager
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import with_appcontext
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.matching_store import SIDECAR_EXTENSION, MatchingSidecar
+from api.utils.os_helper import get_data_group_path, get_matching_path
+
+SPATIAL_INDEX_FILE = 'spatial.sqlite'
+RAW_SOURCE = 'raw'
+CHUNK_SEGMENTS = 8
+EARTH_RADIUS = 6371008.8
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS trajectory ('
+    'id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, sources TEXT NOT NULL, '
+    'first_segment INTEGER NOT NULL, segment_count INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_trajectory_first_segment ON trajectory (first_segment)',
+    'CREATE VIRTUAL TABLE IF NOT EXISTS trajectory_bbox USING rtree(id, min_lon, max_lon, min_lat, max_lat)',
+    'CREATE VIRTUAL TABLE IF NOT EXISTS segment USING rtree('
+    'id, min_lon, max_lon, min_lat, max_lat, +trajectory_id, +source, +points)',
+)
+
+
+def get_spatial_index_path(group_id):
+    return os.path.join(get_data_group_path(group_id), SPATIAL_INDEX_FILE)
+
+
+def segment_rows(trajectory: TrajectoryArray) -> list[tuple]:
+    """
+    (min_lon, max_lon, min_lat, max_lat, points) per run of CHUNK_SEGMENTS segments,
+    a single point is a segment of length 0.
+    """
+    lon, lat = trajectory.longitude, trajectory.latitude
+    if len(lon) == 1:
+        lon, lat = np.repeat(lon, 2), np.repeat(lat, 2)
+    points = np.column_stack([lon, lat])
+    starts = np.arange(0, len(lon) - 1, CHUNK_SEGMENTS)
+    envelopes = np.column_stack([np.minimum.reduceat(np.minimum(lon[:-1], lon[1:]), starts),
+                                 np.maximum.reduceat(np.maximum(lon[:-1], lon[1:]), starts),
+                                 np.minimum.reduceat(np.minimum(lat[:-1], lat[1:]), starts),
+                                 np.maximum.reduceat(np.maximum(lat[:-1], lat[1:]), starts)]).tolist()
+    return [(*envelope, points[start:start + CHUNK_SEGMENTS + 1].tobytes())
+            for envelope, start in zip(envelopes, starts.tolist())]
+
+
+def unpack_segments(blobs: list[bytes]):
+    """
+    (lon1, lat1, lon2, lat2) of the segments of the runs, and the run of every segment.
+    """
+    runs = [np.frombuffer(blob, dtype=np.float64).reshape(-1, 2) for blob in blobs]
+    segments = np.concatenate([np.hstack([points[:-1], points[1:]]) for points in runs])
+    owners = np.repeat(np.arange(len(runs)), [len(points) - 1 for points in runs])
+    return segments, owners
+
+
+def segments_in_bbox(segments: np.ndarray, bbox) -> np.ndarray:
+    """
+    Mask of the segments (lon1, lat1, lon2, lat2 columns) crossing the bbox, Liang-Barsky clipping.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    x1, y1, x2, y2 = segments.T
+    dx, dy = x2 - x1, y2 - y1
+    enter, leave = np.zeros(len(x1)), np.ones(len(x1))
+    inside = np.ones(len(x1), dtype=bool)
+    for p, q in ((-dx, x1 - min_lon), (dx, max_lon - x1), (-dy, y1 - min_lat), (dy, max_lat - y1)):
+        parallel = p == 0
+        inside &= ~(parallel & (q < 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(parallel, 0.0, q / np.where(parallel, 1.0, p))
+        enter = np.where(~parallel & (p < 0), np.maximum(enter, t), enter)
+        leave = np.where(~parallel & (p > 0), np.minimum(leave, t), leave)
+    return inside & (enter <= leave)
+
+
+def segment_distances(segments: np.ndarray, longitude: float, latitude: float) -> np.ndarray:
+    """
+    Meters from the point to the segments, in a local equirectangular projection.
+    """
+    scale = math.cos(math.radians(latitude))
+    x1, y1, x2, y2 = segments.T
+    x1, x2 = (x1 - longitude) * scale, (x2 - longitude) * scale
+    y1, y2 = y1 - latitude, y2 - latitude
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(np.where(length > 0, -(x1 * dx + y1 * dy) / length, 0.0), 0, 1)
+    return np.radians(np.hypot(x1 + t * dx, y1 + t * dy)) * EARTH_RADIUS
+
+
+class SpatialIndex:
+    """
+    Spatial index of one data group, use it as a context manager.
+    """
+    def __init__(self, path: str):
+        # autocommit, only replace() and remove() open a transaction
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.connection.commit()
+        self.connection.close()
+
+    def replace(self, name: str, trajectories: list[tuple[str, TrajectoryArray]]):
+        """
+        Index the trajectories (source, points) of a data, in place of the previous ones.
+        """
+        with self._transaction() as cursor:
+            self._delete(cursor, name)
+            trajectories = [(source, trajectory) for source, trajectory in trajectories if len(trajectory)]
+            if trajectories:
+                self._insert(cursor, name, trajectories)
+
+    def remove(self, name: str):
+        with self._transaction() as cursor:
+            self._delete(cursor, name)
+
+    @contextmanager
+    def _transaction(self):
+        # take the write lock before reading the next segment id
+        cursor = self.connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def _insert(self, cursor, name: str, trajectories: list[tuple[str, TrajectoryArray]]):
+        last = cursor.execute('SELECT first_segment + segment_count FROM trajectory '
+                              'ORDER BY first_segment DESC LIMIT 1').fetchone()
+        first_segment = last[0] if last else 1
+        rows, next_id = [], first_segment
+        for source, trajectory in trajectories:
+            for row in segment_rows(trajectory):
+                rows.append((next_id, *row[:4], source, row[4]))
+                next_id += 1
+        cursor.execute('INSERT INTO trajectory (name, sources, first_segment, segment_count) VALUES (?, ?, ?, ?)',
+                       (name, ','.join(source for source, _ in trajectories), first_segment, next_id - first_segment))
+        trajectory_id = cursor.lastrowid
+        cursor.executemany('INSERT INTO segment VALUES (?, ?, ?, ?, ?, %d, ?, ?)' % trajectory_id, rows)
+        bounds = TrajectoryArray.concatenate([trajectory for _, trajectory in trajectories], with_timestamp=False).bounds()
+        cursor.execute('INSERT INTO trajectory_bbox VALUES (?, ?, ?, ?, ?)',
+                       (trajectory_id, bounds[0][0], bounds[1][0], bounds[0][1], bounds[1][1]))
+
+    def _delete(self, cursor, name: str):
+        found = cursor.execute('SELECT id, first_segment, segment_count FROM trajectory WHERE name = ?', (name,)).fetchone()
+        if found is None:
+            return
+        trajectory_id, first_segment, segment_count = found
+        cursor.executemany('DELETE FROM segment WHERE id = ?', ((segment_id,) for segment_id in
+                                                                range(first_segment, first_segment + segment_count)))
+        cursor.execute('DELETE FROM trajectory_bbox WHERE id = ?', (trajectory_id,))
+        cursor.execute('DELETE FROM trajectory WHERE id = ?', (trajectory_id,))
+
+    def __len__(self):
+        return self.connection.execute('SELECT count(*) FROM trajectory').fetchone()[0]
+
+    def _matches(self, bbox, sources, excluded=()):
+        """
+        (trajectory id, source, points) of the runs whose envelope intersects the bbox.
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        sql = ('SELECT trajectory_id, source, points FROM segment '
+               'WHERE min_lon <= ? AND max_lon >= ? AND min_lat <= ? AND max_lat >= ?')
+        parameters = [max_lon, min_lon, max_lat, min_lat]
+        if sources:
+            sql += ' AND source IN (%s)' % ','.join('?' * len(sources))
+            parameters.extend(sources)
+        if excluded:
+            self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS excluded (id INTEGER PRIMARY KEY)')
+            self.connection.execute('DELETE FROM temp.excluded')
+            self.connection.executemany('INSERT INTO temp.excluded VALUES (?)', ((i,) for i in excluded))
+            sql += ' AND trajectory_id NOT IN (SELECT id FROM temp.excluded)'
+        return self.connection.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def _refine(rows, found: dict, matched):
+        """
+        Add the sources of the runs with a segment for which `matched(segments)` holds.
+        """
+        segments, owners = unpack_segments([row[2] for row in rows])
+        for run in np.unique(owners[matched(segments)]).tolist():
+            found.setdefault(rows[run][0], set()).add(rows[run][1])
+
+    def _results(self, found: dict) -> list[dict]:
+        if not found:
+            return []
+        names = dict(self.connection.execute('SELECT id, name FROM trajectory WHERE id IN (%s)'
+                                             % ','.join(str(i) for i in found)).fetchall())
+        return sorted(({'name': names[i], 'sources': sorted(sources)} for i, sources in found.items()),
+                      key=lambda result: result['name'])
+
+    def search_bbox(self, bbox, sources=None) -> list[dict]:
+        """
+        Trajectories crossing the bbox (min_lon, min_lat, max_lon, max_lat), with the sources that do.
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        found: dict[int, set] = {}
+        # a trajectory inside the bbox matches with all its sources, none of its segments is read
+        for trajectory_id, trajectory_sources in self.connection.execute(
+                'SELECT t.id, t.sources FROM trajectory_bbox b JOIN trajectory t ON t.id = b.id '
+                'WHERE b.min_lon >= ? AND b.max_lon <= ? AND b.min_lat >= ? AND b.max_lat <= ?',
+                (min_lon, max_lon, min_lat, max_lat)):
+            matched = {source for source in trajectory_sources.split(',') if not sources or source in sources}
+            if matched:
+                found[trajectory_id] = matched
+        rows = self._matches(bbox, sources, found.keys())
+        if rows:
+            self._refine(rows, found, lambda segments: segments_in_bbox(segments, bbox))
+        return self._results(found)
+
+    def search_point(self, longitude: float, latitude: float, radius: float, sources=None) -> list[dict]:
+        """
+        Trajectories passing within `radius` meters of the point, with the sources that do.
+        """
+        degrees = math.degrees(radius / EARTH_RADIUS)
+        scale = max(math.cos(math.radians(latitude)), 1e-6)
+        bbox = (longitude - degrees / scale, latitude - degrees, longitude + degrees / scale, latitude + degrees)
+        found: dict[int, set] = {}
+        rows = self._matches(bbox, sources)
+        if rows:
+            self._refine(rows, found, lambda segments: segment_distances(segments, longitude, latitude) <= radius)
+        return self._results(found)
+
+
+def index_folder(matching_path: str, index_path: str) -> int:
+    """
+    Index every sidecar of a matching folder, returns the number of trajectories.
+    """
+    names = sorted(name for name in os.listdir(matching_path) if name.endswith(SIDECAR_EXTENSION))
+    with SpatialIndex(index_path) as index:
+        for name in names:
+            sidecar = MatchingSidecar(os.path.join(matching_path, name))
+            index.replace(name[:-len(SIDECAR_EXTENSION)], [(RAW_SOURCE, sidecar.raw_traj)] + sidecar.original_matching_result)
+        return len(index)
+
+
+@click.command('index-data-group')
+@click.argument('group_id', type=int)
+@with_appcontext
+def index_data_group_command(group_id):
+    """Build the spatial index of a data group from its matching sidecars."""
+    count = index_folder(get_matching_path(group_id), get_spatial_index_path(group_id))
+    current_app.logger.info('[SpatialIndex] group %s: %s trajectories' % (group_id, count))
+    click.echo('%s trajectories indexed' % count)
@@ -0,0 +1,102 @@
+'''
+Author: MondayCha
+Date: 2022-05-06 15:31:52
+Description: Lease-based dispatch of annotation tasks
+
+- A task is a Data row with status 1 (processed).
+- claim_tasks() leases free tasks to one annotator with a single UPDATE,
+  SQLite runs it under one write lock, so two annotators never get the same task.
+- A lease ends when the data is annotated or when it expires, expired leases are
+  claimable right away and cleared by reclaim_expired_leases().
+- Tasks are handed out by group, then by age (oldest data first).
+'''
+import threading
+import uuid
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import or_
+from app import db
+from api.models.data import Data
+
+TASK_STATUS = 1
+
+# threads of one process queue here instead of in the SQLite busy handler
+_claim_lock = threading.Lock()
+
+
+def lease_free(now: datetime):
+    return or_(Data.lease_expires.is_(None), Data.lease_expires < now)
+
+
+def visible_to(user_id, now: datetime):
+    """
+    Tasks that are free or leased by the user.
+    """
+    return or_(lease_free(now), Data.lease_owner_id == user_id)
+
+
+def claim_tasks(user_id, size: int, lease_seconds: int = None):
+    """
+    Lease up to `size` tasks to the user, tasks the user already holds come first
+    and have their lease renewed. Returns the leased Data rows in dispatch order.
+    """
+    lease_seconds = lease_seconds or current_app.config.get('TASK_LEASE_SECONDS')
+    now = datetime.now()
+    expires = now + timedelta(seconds=lease_seconds)
+    token = uuid.uuid4().hex
+
+    with _claim_lock:
+        # renew what the user holds, in the same write transaction as the claim
+        held = Data.query.filter(Data.status == TASK_STATUS, Data.lease_owner_id == user_id, Data.lease_expires >= now)\
+            .update({'lease_token': token, 'lease_expires': expires, 'updated': Data.updated}, synchronize_session=False)
+
+        if held < size:
+            candidates = db.session.query(Data.id)\
+                .filter(Data.status == TASK_STATUS, lease_free(now))\
+                .order_by(Data.group_id, Data.id)\
+                .limit(size - held)\
+                .scalar_subquery()
+            # the lease condition is checked again by the UPDATE itself
+            Data.query.filter(Data.id.in_(candidates), Data.status == TASK_STATUS, lease_free(now))\
+                .update({
+                    'lease_owner_id': user_id,
+                    'lease_expires': expires,
+                    'lease_token': token,
+                    'updated': Data.updated,
+                }, synchronize_session=False)
+        db.session.commit()
+
+    return Data.query.filter_by(lease_token=token).order_by(Data.group_id, Data.id).all()
+
+
+def release_task(data: Data):
+    """
+    End the lease of a task, the caller commits.
+    """
+    data.lease_owner_id = None
+    data.lease_expires = None
+    data.lease_token = None
+
+
+def reclaim_expired_leases():
+    now = datetime.now()
+    reclaimed = Data.query.filter(Data.lease_expires < now)\
+        .update({
+            'lease_owner_id': None,
+            'lease_expires': None,
+            'lease_token': None,
+            'updated': Data.updated,
+        }, synchronize_session=False)
+    db.session.commit()
+    if reclaimed:
+        current_app.logger.info('[Task] reclaimed %s expired leases' % reclaimed)
+    return reclaimed
+
+
+@click.command('reclaim-tasks')
+@with_appcontext
+def reclaim_tasks_command():
+    """Clear expired task leases."""
+    click.echo('%s leases reclaimed' % reclaim_expired_leases())
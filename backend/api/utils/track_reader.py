@@ -0,0 +1,111 @@
+'''
+Author: MondayCha
+Date: 2022-05-04 15:02:18
+Description: Readers for raw tracks and matching sdk outputs
+
+|-------------|-----------|------------|
+| longitude   | latitude  | timestamp  |
+|-------------|-----------|------------|
+| 116.33073   | 39.97568  | 1183524462 |
+|-------------|-----------|------------|
+- csv: uploaded files, comma separated
+- ieee: IEEE 2015 `.track` files, tab separated with float timestamps
+- matching: `Method-name` sdk outputs, space separated, no timestamp
+'''
+import warnings
+from itertools import islice
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
+
+TRACK_DELIMITERS = {
+    'csv': ',',
+    'ieee': '\t',
+    # any run of whitespace
+    'matching': None,
+}
+
+CHUNK_LINES = 1 << 16
+
+
+def _columns(track_format: str, with_timestamp):
+    if track_format not in TRACK_DELIMITERS:
+        raise ValueError('unknown track format: %s' % track_format)
+    if with_timestamp is None:
+        with_timestamp = track_format != 'matching'
+    return with_timestamp, 3 if with_timestamp else 2
+
+
+def _load(source, delimiter, columns):
+    with warnings.catch_warnings():
+        # an empty input is not an error
+        warnings.simplefilter('ignore')
+        table = np.loadtxt(source, delimiter=delimiter, dtype=np.float64, ndmin=2, comments=None)
+    if table.size and table.shape[1] != columns:
+        raise ValueError('expected %s columns' % columns)
+    return table.reshape(-1, columns)
+
+
+def parse_lines(lines, delimiter, columns, first_line_number=1, on_error=None):
+    """
+    Tokenize lines into a (n, columns) float64 table in one pass.
+    If the bulk pass fails, lines are parsed one by one and
+    `on_error(line_number, line)` is called for every skipped line.
+    """
+    try:
+        return _load(lines, delimiter, columns)
+    except ValueError:
+        rows = []
+        for line_number, line in enumerate(lines, first_line_number):
+            line = line.strip()
+            if not line:
+                continue
+            fields = line.split(delimiter)
+            try:
+                if len(fields) != columns:
+                    raise ValueError
+                rows.append([float(field) for field in fields])
+            except ValueError:
+                if on_error is not None:
+                    on_error(line_number, line)
+        return np.array(rows, dtype=np.float64).reshape(-1, columns)
+
+
+def iter_track(path: str, track_format: str = 'csv', with_timestamp=None, chunk_lines: int = CHUNK_LINES, on_error=None):
+    """
+    Yield the track as TrajectoryArray chunks of at most `chunk_lines` lines,
+    for files that should not be loaded at once.
+    """
+    with_timestamp, columns = _columns(track_format, with_timestamp)
+    delimiter = TRACK_DELIMITERS[track_format]
+    with open(path, 'r') as f:
+        line_number = 1
+        while True:
+            lines = list(islice(f, chunk_lines))
+            if not lines:
+                break
+            table = parse_lines(lines, delimiter, columns, line_number, on_error)
+            line_number += len(lines)
+            if len(table):
+                yield TrajectoryArray.from_table(table, with_timestamp)
+        f.close()
+
+
+def read_track(path: str, track_format: str = 'csv', with_timestamp=None, on_error=None) -> TrajectoryArray:
+    """
+    Read a whole track, bad lines are skipped and reported through `on_error(line_number, line)`.
+    """
+    with_timestamp, columns = _columns(track_format, with_timestamp)
+    try:
+        return TrajectoryArray.from_table(_load(path, TRACK_DELIMITERS[track_format], columns), with_timestamp)
+    except ValueError:
+        chunks = list(iter_track(path, track_format, with_timestamp, on_error=on_error))
+    return TrajectoryArray.concatenate(chunks, with_timestamp)
+
+
+def parse_track(lines, track_format: str = 'csv', with_timestamp=None, on_error=None) -> TrajectoryArray:
+    """
+    Same as read_track() for lines already in memory.
+    """
+    with_timestamp, columns = _columns(track_format, with_timestamp)
+    table = parse_lines(list(lines), TRACK_DELIMITERS[track_format], columns, 1, on_error)
+    return TrajectoryArray.from_table(table, with_timestamp)
@@ -1,12 +1,81 @@
+'''
+Author: MondayCha
+Date: 2022-05-10 15:02:47
+Description: Bounds and summaries of trajectories
+
+A summary is computed once at ingestion and stored with the Data row, list
+views and spatial filters read it without loading the trajectory:
+- bbox: [[min lon, min lat], [max lon, max lat]]
+- point_count, length (meters, haversine), duration (seconds), mean_speed (m/s)
+- geohashes: sorted geohash cells of the points
+'''
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
+
+EARTH_RADIUS = 6371008.8
+GEOHASH_PRECISION = 6
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
 def get_bounds(coordinates):
-    min_lat = min_lon = max_lat = max_lon = None
-    for coordinate in coordinates:
-        if min_lat is None or coordinate.latitude < min_lat:
-            min_lat = coordinate.latitude
-        if min_lon is None or coordinate.longitude < min_lon:
-            min_lon = coordinate.longitude
-        if max_lat is None or coordinate.latitude > max_lat:
-            max_lat = coordinate.latitude
-        if max_lon is None or coordinate.longitude > max_lon:
-            max_lon = coordinate.longitude
-    return [[float(min_lon), float(min_lat)], [float(max_lon), float(max_lat)]]
\ No newline at end of file
+    if isinstance(coordinates, TrajectoryArray):
+        return coordinates.bounds()
+    # numpy parses the coordinate strings, no float() per point
+    longitude = np.array([coordinate.longitude for coordinate in coordinates], dtype=np.float64)
+    latitude = np.array([coordinate.latitude for coordinate in coordinates], dtype=np.float64)
+    if not len(longitude):
+        return [[None, None], [None, None]]
+    return [[float(longitude.min()), float(latitude.min())], [float(longitude.max()), float(latitude.max())]]
+
+
+def parse_bbox(value: str):
+    """
+    `min_lon,min_lat,max_lon,max_lat` of a query string, ValueError when malformed.
+    """
+    bbox = [float(part) for part in value.split(',')]
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError('illegal bbox: %s' % value)
+    return bbox
+
+
+def haversine(longitude, latitude) -> np.ndarray:
+    """
+    Meters between consecutive points.
+    """
+    lon, lat = np.radians(longitude), np.radians(latitude)
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def geohash_cells(longitude, latitude, precision: int = GEOHASH_PRECISION) -> list[str]:
+    """
+    Sorted distinct geohashes of the points, the bits are interleaved with numpy.
+    """
+    if not len(longitude):
+        return []
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lon = np.clip(((np.asarray(longitude) + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    lat = np.clip(((np.asarray(latitude) + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    # even bits of the hash are longitude bits, most significant first
+    cells = np.zeros(len(lon), dtype=np.int64)
+    for bit in range(bits):
+        source, position = (lon, lon_bits - 1 - bit // 2) if bit % 2 == 0 else (lat, lat_bits - 1 - bit // 2)
+        cells |= ((source >> position) & 1) << (bits - 1 - bit)
+    return [''.join(GEOHASH_ALPHABET[(cell >> (5 * (precision - 1 - k))) & 31] for k in range(precision))
+            for cell in np.unique(cells).tolist()]
+
+
+def trajectory_summary(trajectory: TrajectoryArray, precision: int = GEOHASH_PRECISION) -> dict:
+    length = float(haversine(trajectory.longitude, trajectory.latitude).sum()) if len(trajectory) > 1 else 0.0
+    duration = None
+    if trajectory.timestamp is not None and len(trajectory):
+        duration = int(trajectory.timestamp[-1] - trajectory.timestamp[0])
+    return {
+        'bbox': trajectory.bounds(),
+        'point_count': len(trajectory),
+        'length': round(length, 3),
+        'duration': duration,
+        'mean_speed': round(length / duration, 3) if duration else None,
+        'geohashes': geohash_cells(trajectory.longitude, trajectory.latitude, precision),
+    }
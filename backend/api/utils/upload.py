@@ -0,0 +1,225 @@
+'''
+Author: MondayCha
+Date: 2022-05-07 10:26:35
+Description: Streaming upload of raw tracks
+
+- The multipart body is decoded while it arrives and each file is written
+  to the input folder in chunks, nothing is buffered whole in memory.
+- A file is validated in a process pool as soon as it is complete, while
+  the rest of the request is still being received.
+- A `.zip` / `.tar.gz` bundle is extracted member by member into the input folder.
+- Every track is limited to UPLOAD_FILE_MAX_BYTES, all tracks of a request
+  together to UPLOAD_MAX_BYTES.
+'''
+import multiprocessing
+import os
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+from api.utils.track_reader import read_track
+
+UPLOAD_CHUNK = 1024 * 1024
+BUNDLE_SUFFIXES = ('.zip', '.tar.gz', '.tgz')
+# fields other than files are small, never keep more than this in memory
+FORM_MEMORY_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def validate_track(path: str, track_format: str):
+    """
+    Parse a track, run in the upload pool. Returns the point count or the reason of the rejection.
+    """
+    invalid_lines = []
+    try:
+        trajectory = read_track(path, track_format, on_error=lambda line_number, _: invalid_lines.append(line_number))
+    except Exception as e:
+        return {'error': '%s: %s' % (type(e).__name__, e)}
+    if len(trajectory) < 2:
+        return {'error': 'less than 2 valid points'}
+    return {'points': len(trajectory), 'invalid_lines': len(invalid_lines)}
+
+
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+
+def get_upload_pool(workers: int):
+    """
+    The shared validation pool, None when validation runs inline (0 workers).
+    """
+    global _upload_pool
+    if not workers:
+        return None
+    with _upload_pool_lock:
+        if _upload_pool is None:
+            _upload_pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        return _upload_pool
+
+
+def is_bundle(filename: str):
+    return filename.lower().endswith(BUNDLE_SUFFIXES)
+
+
+class UploadSession:
+    """
+    Tracks written into `input_path` by one request and their validation.
+    """
+    def __init__(self, input_path: str, track_format: str, file_max_bytes: int, max_bytes: int, pool=None):
+        self.input_path: str = input_path
+        self.track_format: str = track_format
+        self.file_max_bytes: int = file_max_bytes
+        self.max_bytes: int = max_bytes
+        self.pool = pool
+        self.total_bytes: int = 0
+        self.pending: dict = {}
+        self.rejected: dict = {}
+
+    def count(self, size: int, written: int, name: str):
+        if written > self.file_max_bytes:
+            raise UploadTooLarge('%s is larger than %s bytes' % (name, self.file_max_bytes))
+        self.total_bytes += size
+        if self.total_bytes > self.max_bytes:
+            raise UploadTooLarge('upload is larger than %s bytes' % self.max_bytes)
+
+    def track_path(self, filename: str):
+        """
+        Path of a new track in the input folder, None if the name is unusable or taken.
+        The first file of a name is kept, later ones are rejected under `<name> (duplicate)`.
+        """
+        name = secure_filename(os.path.basename(filename))
+        if not name or name.startswith('.'):
+            return name, None
+        if name in self.pending:
+            self.rejected['%s (duplicate)' % name] = 'duplicate name'
+            return name, None
+        return name, os.path.join(self.input_path, name)
+
+    def copy(self, source, path: str, name: str):
+        """
+        Copy a readable stream into `path` chunk by chunk.
+        """
+        written = 0
+        with open(path + '.part', 'wb') as f:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                written += len(chunk)
+                self.count(len(chunk), written, name)
+                f.write(chunk)
+            f.close()
+        os.replace(path + '.part', path)
+
+    def submit(self, name: str, path: str):
+        if self.pool is None:
+            future = Future()
+            future.set_result(validate_track(path, self.track_format))
+        else:
+            future = self.pool.submit(validate_track, path, self.track_format)
+        self.pending[name] = (path, future)
+
+    def add_bundle(self, path: str, filename: str):
+        """
+        Extract the tracks of a bundle and validate each as soon as it is written.
+        """
+        if filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(path) as bundle:
+                for info in bundle.infolist():
+                    if info.is_dir() or '__MACOSX' in info.filename:
+                        continue
+                    if info.file_size > self.file_max_bytes:
+                        raise UploadTooLarge('%s is larger than %s bytes' % (info.filename, self.file_max_bytes))
+                    name, track_path = self.track_path(info.filename)
+                    if track_path is not None:
+                        with bundle.open(info) as source:
+                            self.copy(source, track_path, name)
+                        self.submit(name, track_path)
+        else:
+            # stream mode, members are read in archive order without seeking
+            with tarfile.open(path, 'r|*') as bundle:
+                for member in bundle:
+                    if not member.isfile():
+                        continue
+                    if member.size > self.file_max_bytes:
+                        raise UploadTooLarge('%s is larger than %s bytes' % (member.name, self.file_max_bytes))
+                    name, track_path = self.track_path(member.name)
+                    if track_path is not None:
+                        self.copy(bundle.extractfile(member), track_path, name)
+                        self.submit(name, track_path)
+
+    def results(self):
+        """
+        Wait for the validation, remove rejected tracks so the matching sdk skips them.
+        Returns [[name, path], ...] of the accepted tracks.
+        """
+        accepted = []
+        for name, (path, future) in self.pending.items():
+            result = future.result()
+            if 'error' in result:
+                self.rejected[name] = result['error']
+                os.remove(path)
+            else:
+                accepted.append([name, path])
+        self.pending = {}
+        return accepted
+
+    def discard(self):
+        for path, future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+
+
+def receive_upload(stream, boundary: bytes, session: UploadSession, bundle_path: str, field='files'):
+    """
+    Decode a multipart body from `stream`, saving the files of `field`.
+    Bundles are written to `bundle_path` first and extracted once complete.
+    """
+    decoder = MultipartDecoder(boundary, FORM_MEMORY_BYTES)
+    # (file, path, name, is bundle) of the part being written
+    target, written = None, 0
+    try:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, (Field, File)):
+                    target, written = None, 0
+                    if isinstance(event, File) and event.name == field and event.filename:
+                        if is_bundle(event.filename):
+                            target = open(bundle_path + '.part', 'wb'), bundle_path, event.filename, True
+                        else:
+                            name, path = session.track_path(event.filename)
+                            if path is not None:
+                                target = open(path + '.part', 'wb'), path, name, False
+                elif isinstance(event, Data) and target is not None:
+                    f, path, name, bundle = target
+                    written += len(event.data)
+                    if not bundle:
+                        session.count(len(event.data), written, name)
+                    elif written > session.max_bytes:
+                        # the bundle itself only has to fit the request limit
+                        raise UploadTooLarge('%s is larger than %s bytes' % (name, session.max_bytes))
+                    f.write(event.data)
+                    if not event.more_data:
+                        f.close()
+                        target = None
+                        os.replace(path + '.part', path)
+                        if bundle:
+                            session.add_bundle(path, name)
+                            os.remove(path)
+                        else:
+                            session.submit(name, path)
+                event = decoder.next_event()
+            if not chunk:
+                break
+    finally:
+        if target is not None:
+            target[0].close()
+    return session
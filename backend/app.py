@@ -4,6 +4,7 @@ Date: 2022-04-06 15:44:42
 Description: Flask App Entrypoint
 '''
 import logging
+import sqlite3
 from flask import Flask
 from config import Config, SWAGGER_TEMPLATE
 from flask_cors import CORS
@@ -16,6 +17,8 @@ from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -25,12 +28,26 @@ hashids = Hashids(salt=Config.SECRET_KEY, min_length=8)
 jwt = JWTManager()
 admin = Admin()
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """
+    WAL lets the web server read while job workers and annotators write.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     app.logger.setLevel(logging.DEBUG if app.debug else logging.INFO)
 
     # set up instance
+    from api.utils.serializer import configure
+    configure(app.config.get('JSON_BACKEND'))
     db.init_app(app)
     migrate.init_app(app, db)
     ma.init_app(app)
@@ -39,13 +56,24 @@ def create_app(config_class=Config):
     admin.init_app(app)
     import api.utils.admin
     swagger = Swagger(app, template=SWAGGER_TEMPLATE)
-    CORS(app, supports_credentials=True)
+    # let the frontend read the keyset pagination cursor
+    CORS(app, supports_credentials=True, expose_headers=['X-Next-Cursor'])
 
     # routes
     from api.routes import api_router, media_router
     app.register_blueprint(api_router.bp)
     app.register_blueprint(media_router.bp)
 
+    # commands
+    from api.utils.job_queue import worker_command
+    app.cli.add_command(worker_command)
+    from api.utils.task_dispatch import reclaim_tasks_command
+    app.cli.add_command(reclaim_tasks_command)
+    from api.utils.ingestion import summarize_data_command
+    app.cli.add_command(summarize_data_command)
+    from api.utils.spatial_index import index_data_group_command
+    app.cli.add_command(index_data_group_command)
+
     return app
 
 if __name__ == '__main__':
@@ -4,6 +4,7 @@
 from os import environ, path
 from dotenv import load_dotenv
 from datetime import timedelta
+from sqlalchemy.pool import QueuePool
 
 
 basedir = path.abspath(path.dirname(__file__))
@@ -41,10 +42,74 @@ class Config(object):
     OSM_FILE_PATH = '~/documents/mmd-generator/backend/media/osm/beijing2.osm.gz'
     IEEE_2015_PATH = '/home/monday/documents/map-matching-dataset/'
     MATCHING_METHODS = ['STMatching', 'SimpleMapMatching', 'GHMapMatching']
+    MATCHING_PARALLELISM = int(environ.get('MATCHING_PARALLELISM') or 3)
+    MATCHING_TIMEOUT = 600
+
+    # Map-Matching SDK workers, keep the graph loaded between requests (0: disabled)
+    # opt-in: SDK_WORKER_CLASS must be a worker entrypoint of the SDK jar, see api/utils/matching_pool.py
+    SDK_WORKER_CLASS = environ.get('SDK_WORKER_CLASS') or 'com.example.MatchingWorker'
+    MATCHING_WORKERS = int(environ.get('MATCHING_WORKERS') or 0)
+    MATCHING_WORKER_STARTUP_TIMEOUT = 300
+    MATCHING_WORKER_HEALTH_INTERVAL = 30
+    MATCHING_WORKER_RETRY_INTERVAL = 600
+
+    # Background jobs run in `flask worker` processes. With JOB_WORKERS_IN_WEB=1 a single-process
+    # web server (`flask run`) spawns JOB_WORKERS of them, never set it with a multi-process server:
+    # every web process would spawn its own workers
+    JOB_WORKERS_IN_WEB = environ.get('JOB_WORKERS_IN_WEB') == '1'
+    JOB_WORKERS = int(environ.get('JOB_WORKERS') or 1)
+    JOB_POLL_INTERVAL = 1
+    JOB_FLUSH_INTERVAL = 1
+    # Data rows inserted per transaction during ingestion
+    INGEST_BATCH_SIZE = int(environ.get('INGEST_BATCH_SIZE') or 500)
+
+    # Geohash cells of the Data summary written at ingestion (6: about 1.2 km x 0.6 km)
+    DATA_SUMMARY_GEOHASH_PRECISION = 6
+
+    # Matcher outputs are served simplified, see api/utils/simplification.py
+    # collinear: cross product threshold in square degrees, douglas_peucker: tolerance in meters
+    MATCHING_SIMPLIFY_MODE = environ.get('MATCHING_SIMPLIFY_MODE') or 'collinear'
+    MATCHING_SIMPLIFY_TOLERANCE = float(environ.get('MATCHING_SIMPLIFY_TOLERANCE') or 1e-10)
+
+    # Pre-annotation of every trajectory at ingestion, see api/utils/pre_annotation.py
+    # (0 workers: inline in the job worker)
+    PRE_ANNOTATION_WORKERS = int(environ.get('PRE_ANNOTATION_WORKERS') or 2)
+    PRE_ANNOTATION = {
+        'auto_merge_circle': True,
+        'simplify_threshold': 1e-16,
+        'disabled_annotators': [],
+    }
+
+    # Uploads are written to disk while they arrive, limits apply to the raw tracks
+    # (bundles count with their extracted size), validation runs in UPLOAD_WORKERS processes
+    UPLOAD_FILE_MAX_BYTES = int(environ.get('UPLOAD_FILE_MAX_BYTES') or 64 * 1024 * 1024)
+    UPLOAD_MAX_BYTES = int(environ.get('UPLOAD_MAX_BYTES') or 4 * 1024 * 1024 * 1024)
+    UPLOAD_WORKERS = int(environ.get('UPLOAD_WORKERS') or 2)
+
+    # Annotation tasks are leased to one annotator at a time
+    TASK_LEASE_SECONDS = int(environ.get('TASK_LEASE_SECONDS') or 30 * 60)
+    TASK_CLAIM_SIZE = 1
+    TASK_RECLAIM_INTERVAL = 60
+
+    # Responses built from media files, see api/utils/response_cache.py
+    RESPONSE_CACHE_BYTES = int(environ.get('RESPONSE_CACHE_BYTES') or 256 * 1024 * 1024)
+    RESPONSE_CACHE_ENTRY_BYTES = 32 * 1024 * 1024
+
+    # JSON of responses and matching files: auto (orjson when installed), orjson or json
+    JSON_BACKEND = environ.get('JSON_BACKEND') or 'auto'
 
     # SQLALCHEMY
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # web server and job workers share the database, wait for locks instead of failing
+    # keep connections open between requests (NullPool is the default for sqlite files),
+    # a pooled connection is only used by one thread at a time
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'connect_args': {'timeout': 30, 'check_same_thread': False},
+        'poolclass': QueuePool,
+        'pool_size': 10,
+        'max_overflow': 40,
+    }
 
     # SWAGGER
     # - https://github.com/flasgger/flasgger/blob/master/examples/openapi3_examples.py
@@ -0,0 +1,126 @@
+"""
+Load test of the task lease engine (api/utils/task_dispatch.py).
+
+Many annotators claim and annotate tasks concurrently against one SQLite
+database until no task is left, then every assignment is checked:
+each task must have been leased to exactly one annotator.
+
+    python test/task_dispatch_load.py --tasks 5000 --processes 8 --threads 25
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_app(database_path):
+    from config import Config
+    from app import create_app
+
+    class LoadTestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database_path
+        JOB_WORKERS = 0
+        MATCHING_WORKERS = 0
+
+    return create_app(LoadTestConfig)
+
+
+def annotator(app, user_id, claim_size, claimed, errors):
+    from app import db
+    from api.models.data import Data
+    from api.utils.task_dispatch import claim_tasks, release_task
+
+    with app.app_context():
+        while True:
+            try:
+                datas = claim_tasks(user_id, claim_size)
+                if not datas:
+                    break
+                for data in datas:
+                    claimed.append((data.id, user_id))
+                    data.status = 2
+                    release_task(data)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                errors.append(type(e).__name__)
+        db.session.remove()
+
+
+def run_process(database_path, first_user_id, threads, claim_size):
+    app = make_app(database_path)
+    claimed, errors = [], []
+    workers = [threading.Thread(target=annotator, args=(app, first_user_id + i, claim_size, claimed, errors))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return claimed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=25, help='annotators per process')
+    parser.add_argument('--claim-size', type=int, default=1)
+    args = parser.parse_args()
+
+    folder = tempfile.TemporaryDirectory()
+    database_path = os.path.join(folder.name, 'load_test.db')
+    app = make_app(database_path)
+    with app.app_context():
+        from app import db
+        from api.models.data import Data
+        from api.models.data_group import DataGroup
+        db.create_all()
+        for group_index in range(args.groups):
+            group = DataGroup(name='load test %s' % group_index, osm_path='')
+            db.session.add(group)
+            db.session.commit()
+            db.session.bulk_insert_mappings(Data, [{
+                'name': '%08d.track' % i, 'path': '', 'group_id': group.id, 'status': 1
+            } for i in range(args.tasks // args.groups)])
+            db.session.commit()
+        total = Data.query.count()
+
+    annotators = args.processes * args.threads
+    print('%s tasks, %s annotators (%s processes x %s threads), claim size %s' % (
+        total, annotators, args.processes, args.threads, args.claim_size))
+    start = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(run_process, [
+            (database_path, 1 + process_index * args.threads, args.threads, args.claim_size)
+            for process_index in range(args.processes)])
+    elapsed = time.perf_counter() - start
+
+    claimed = [assignment for process_claimed, _ in results for assignment in process_claimed]
+    errors = [error for _, process_errors in results for error in process_errors]
+    counts = Counter(data_id for data_id, _ in claimed)
+    # a user whose write failed gets the same task back, that is not a double assignment
+    owners = {}
+    for data_id, user_id in claimed:
+        owners.setdefault(data_id, set()).add(user_id)
+    double_assignments = sum(1 for users in owners.values() if len(users) > 1)
+    busy_annotators = len(set(user_id for _, user_id in claimed))
+
+    print('%s assignments in %.2fs (%.0f tasks/s), %s annotators got work' % (
+        len(claimed), elapsed, len(claimed) / elapsed, busy_annotators))
+    print('tasks never assigned: %s' % (total - len(counts)))
+    print('double assignments: %s' % double_assignments)
+    print('errors: %s %s' % (len(errors), Counter(errors).most_common(3)))
+    folder.cleanup()
+    sys.exit(1 if double_assignments or total != len(counts) else 0)
+
+
+if __name__ == '__main__':
+    main()
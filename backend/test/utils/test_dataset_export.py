@@ -0,0 +1,123 @@
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from unittest import TestCase
+from config import Config
+from app import create_app, db
+from api.models.annotation import Annotation
+from api.models.data import Data
+from api.models.data_group import DataGroup
+from api.utils.dataset_export import BLOB_GRACE_SECONDS, DatasetExport
+
+
+def annotation_detail(offset):
+    return {'trajectory': [{'longitude': 116.3 + offset + i * 1e-4, 'latitude': 39.9 + i * 1e-4} for i in range(5)]}
+
+
+class TestDatasetExport(TestCase):
+    def setUp(self):
+        print("test dataset export start")
+        self.folder = tempfile.TemporaryDirectory()
+
+        class ExportTestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.folder.name, 'app.db')
+            UPLOAD_DIR = os.path.join(self.folder.name, 'media')
+            JOB_WORKERS = 0
+            MATCHING_WORKERS = 0
+
+        self.app = create_app(ExportTestConfig)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        group = DataGroup(osm_path='')
+        db.session.add(group)
+        db.session.commit()
+        self.group_id = group.id
+        # t2 is not checked, t1 has a second annotation which is not exported
+        self.paths = {}
+        for i, status in enumerate([3, 3, 2, 3]):
+            data = Data(name='t%d.txt' % i, path='', group_id=self.group_id, status=status)
+            db.session.add(data)
+            db.session.commit()
+            for suffix in ('', '-b') if i == 1 else ('',):
+                path = os.path.join(self.folder.name, 't%d%s.json' % (i, suffix))
+                self.write_annotation(path, annotation_detail(i * 0.01))
+                db.session.add(Annotation(path=path, data_id=data.id))
+                self.paths.setdefault(data.name, path)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        self.folder.cleanup()
+
+    def write_annotation(self, path, detail, mtime=None):
+        with open(path, 'w') as f:
+            json.dump(detail, f)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def read_archive(self, export):
+        size, chunks = export.archive()
+        content = b''.join(chunks)
+        self.assertEqual(size, len(content))
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            return {name: archive.read(name) for name in archive.namelist()}
+
+    def test_archive(self):
+        members = self.read_archive(DatasetExport(self.group_id, 'json').build())
+        self.assertEqual(['t0.txt.json', 't1.txt.json', 't3.txt.json'], sorted(members))
+        with open(self.paths['t1.txt'], 'rb') as f:
+            self.assertEqual(f.read(), members['t1.txt.json'])
+
+        members = self.read_archive(DatasetExport(self.group_id, 'txt').build())
+        lines = members['t3.txt.txt'].decode('utf-8').splitlines()
+        self.assertEqual(5, len(lines))
+        self.assertEqual([116.33, 39.9], [float(value) for value in lines[0].split()])
+        with self.assertRaises(ValueError):
+            DatasetExport(self.group_id, 'csv')
+
+    def test_reuse(self):
+        first = DatasetExport(self.group_id, 'json').build()
+        self.assertEqual((0, 3), (first.reused, first.compressed))
+
+        # t0 changes, t3 is saved again with the same content
+        now = time.time()
+        self.write_annotation(self.paths['t0.txt'], annotation_detail(0.5), now + 10)
+        self.write_annotation(self.paths['t3.txt'], annotation_detail(0.03), now + 10)
+        second = DatasetExport(self.group_id, 'json').build()
+        self.assertEqual((2, 1), (second.reused, second.compressed))
+        self.assertNotEqual(first.etag, second.etag)
+        self.assertEqual(116.8, json.loads(self.read_archive(second)['t0.txt.json'])['trajectory'][0]['longitude'])
+
+        third = DatasetExport(self.group_id, 'json').build()
+        self.assertEqual((3, 0), (third.reused, third.compressed))
+        self.assertEqual(second.etag, third.etag)
+        self.assertEqual([], [name for name in os.listdir(third.path) if name.endswith('.tmp')])
+
+    def test_prune(self):
+        first = DatasetExport(self.group_id, 'json').build()
+        old_blob = first.blob(first.members[0]['sha256'])
+        self.write_annotation(self.paths['t0.txt'], annotation_detail(0.5), time.time() + 10)
+        second = DatasetExport(self.group_id, 'json').build()
+
+        # every blob is old enough, only the one of the previous t0 is not referenced
+        expired = time.time() - BLOB_GRACE_SECONDS - 60
+        for entry in os.scandir(second.blob_path):
+            os.utime(entry.path, (expired, expired))
+        second.prune()
+        self.assertFalse(os.path.exists(old_blob))
+        self.assertEqual(sorted(second.blob(member['sha256']) for member in second.members),
+                         sorted(entry.path for entry in os.scandir(second.blob_path)))
+        self.assertEqual(3, len(self.read_archive(second)))
+
+        # a recent unreferenced blob may still be read by a download
+        self.write_annotation(self.paths['t3.txt'], annotation_detail(0.7), time.time() + 20)
+        third = DatasetExport(self.group_id, 'json').build()
+        second.prune()
+        self.assertTrue(os.path.exists(third.blob(third.members[2]['sha256'])))
+        self.assertEqual(4, len(os.listdir(second.blob_path)))
@@ -0,0 +1,109 @@
+import json
+import os
+import random
+import tempfile
+import time
+from unittest import TestCase
+from api.utils.evaluation import coordinate_keys, evaluate, find_tracks, hit_rates, read_report, write_csv, write_json
+
+
+def classic_hit_rates(output, truth):
+    """
+    The quadratic DP of scripts/ieee_test.py with its round(x, 6) comparison.
+    """
+    equal = lambda x, y: round(float(x[0]), 6) == round(float(y[0]), 6) and round(float(x[1]), 6) == round(float(y[1]), 6)
+    lengths = [[0] * (len(truth) + 1) for _ in range(len(output) + 1)]
+    for i, x in enumerate(output):
+        for j, y in enumerate(truth):
+            lengths[i + 1][j + 1] = lengths[i][j] + 1 if equal(x, y) else max(lengths[i + 1][j], lengths[i][j + 1])
+    truth_index = []
+    i, j = len(output), len(truth)
+    while i > 0 and j > 0:
+        if lengths[i][j] == lengths[i][j - 1]:
+            j -= 1
+        elif lengths[i][j] == lengths[i - 1][j]:
+            i -= 1
+        else:
+            truth_index.append(j - 1)
+            i -= 1
+            j -= 1
+    truth_index.reverse()
+    if not truth_index:
+        return 0, 0
+    return len(truth_index), len(truth_index) + truth_index[0] + len(truth) - 1 - truth_index[-1]
+
+
+def route(size, seed):
+    rand = random.Random(seed)
+    nodes = ['%.6f' % (11 + i * 1e-3) for i in range(40)]
+    return [(rand.choice(nodes), '47.%06d' % rand.randrange(3)) for _ in range(size)]
+
+
+class TestEvaluation(TestCase):
+    def setUp(self):
+        print("test evaluation start")
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def keys(self, points):
+        return coordinate_keys([float(lon) for lon, _ in points], [float(lat) for _, lat in points]).tolist()
+
+    def test_keys(self):
+        keys = coordinate_keys([11.0000004, 11.0000006, -179.999999, 180.0], [47.0, 47.0, -90.0, 90.0])
+        self.assertEqual(keys[0], coordinate_keys([11.0], [47.0])[0])
+        self.assertNotEqual(keys[0], keys[1])
+        self.assertEqual(4, len(set(keys.tolist())))
+
+    def test_same_as_classic(self):
+        for seed in range(20):
+            output, truth = route(60, seed), route(50, seed + 100)
+            self.assertEqual(classic_hit_rates(output, truth), hit_rates(self.keys(output), self.keys(truth)))
+        self.assertEqual((0, 0), hit_rates([], self.keys(route(5, 1))))
+
+    def test_benchmark(self):
+        output, truth = route(500, 1), route(500, 2)
+        start = time.perf_counter()
+        expected = classic_hit_rates(output, truth)
+        classic_time = time.perf_counter() - start
+        start = time.perf_counter()
+        self.assertEqual(expected, hit_rates(self.keys(output), self.keys(truth)))
+        keys_time = time.perf_counter() - start
+        print("500 x 500 points: classic %.3fs, int keys + bit-parallel lcs %.4fs" % (classic_time, keys_time))
+        # wall-clock, depends on the machine
+        if os.environ.get('MMD_BENCHMARK'):
+            self.assertLess(keys_time * 10, classic_time)
+
+    def test_run(self):
+        outputs = os.path.join(self.folder.name, 'simple')
+        truths = os.path.join(self.folder.name, 'osm')
+        os.makedirs(outputs)
+        os.makedirs(truths)
+        for index in range(5):
+            with open(os.path.join(outputs, 'MMDGMatching-%08d.txt' % index), 'w') as f:
+                f.writelines('%s %s\n' % point for point in route(30, index))
+            if index != 3:
+                with open(os.path.join(truths, '%08d.out.txt' % index), 'w') as f:
+                    # the ground truth of 4 is elsewhere, not a single hit
+                    f.writelines('%s %s\n' % ((lon, '48' + lat[2:]) if index == 4 else (lon, lat)) for lon, lat in route(20, index + 10))
+        self.assertEqual(['00000001', '00000002'], [pair[0] for pair in find_tracks(outputs, truths, [(1, 2)])[0]])
+
+        report = evaluate(outputs, truths, workers=0)
+        self.assertEqual(['00000003'], report['missing'])
+        self.assertEqual((4, 1), (report['summary']['tracks'], report['summary']['tracks_without_hits']))
+        self.assertEqual(0, report['tracks'][3]['hits'])
+        track = report['tracks'][0]
+        hits, strip_hits = classic_hit_rates(route(30, 0), route(20, 10))
+        self.assertEqual((hits, hits / 20, strip_hits / 20), (track['hits'], track['hit_rate'], track['strip_hit_rate']))
+        # the track without hits is left out of the total, as in scripts/ieee_test.py
+        self.assertEqual(sum(track['hits'] for track in report['tracks']) / 60, report['summary']['hit_rate'])
+        self.assertEqual(4, report['summary']['per_track_hit_rate']['count'])
+        snapped = evaluate(outputs, truths, workers=0, epsilon=1e-7)
+        self.assertEqual(report['summary']['hit_rate'], snapped['summary']['hit_rate'])
+
+        json_path, csv_path = os.path.join(self.folder.name, 'report.json'), os.path.join(self.folder.name, 'report.csv')
+        write_json(report, json_path)
+        write_csv(report, csv_path)
+        self.assertEqual(json.loads(json.dumps(report['summary'])), read_report(json_path)['summary'])
+        self.assertEqual(report['summary'], read_report(csv_path)['summary'])
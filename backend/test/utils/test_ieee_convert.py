@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+import numpy as np
+from api.utils.ieee_convert import convert_dataset, list_ids, parse_ids
+
+
+class TestIeeeConvert(TestCase):
+    def setUp(self):
+        print("test ieee convert start")
+        self.folder = tempfile.TemporaryDirectory()
+        self.dataset = os.path.join(self.folder.name, 'dataset')
+        self.output = os.path.join(self.folder.name, 'osm')
+        for index in range(5):
+            trajectory_id = '%08d' % index
+            folder = os.path.join(self.dataset, trajectory_id)
+            os.makedirs(folder)
+            path = lambda extension: os.path.join(folder, '%s.%s' % (trajectory_id, extension))
+            nodes = np.array([[11.0 + i * 1e-3, 47.0 + index * 1e-3] for i in range(10)])
+            np.savetxt(path('nodes'), nodes, fmt='%.6f', delimiter='\t')
+            np.savetxt(path('arcs'), [[i, i + 1] for i in range(9)], fmt='%d', delimiter='\t')
+            np.savetxt(path('route'), [0, 1, 2], fmt='%d')
+            np.savetxt(path('track'), [[11.0001, 47.0001, 0.4], [11.0021, 47.0002, 1.9]], fmt='%.6f', delimiter='\t')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_ids(self):
+        self.assertEqual([(0, 2), (4, 4)], parse_ids('0-2, 4'))
+        self.assertEqual(['00000003', '00000004'], list_ids(self.dataset, parse_ids('3-')))
+        self.assertEqual(5, len(list_ids(self.dataset)))
+        with self.assertRaises(ValueError):
+            parse_ids('5-1')
+
+    def test_convert(self):
+        manifest = convert_dataset(self.dataset, self.output, parse_ids('1-3'), workers=0)
+        self.assertEqual({'converted': 9}, manifest['summary'])
+        self.assertEqual(['00000001', '00000002', '00000003'], [item['id'] for item in manifest['items']])
+        with open(os.path.join(self.output, 'manifest.json'), 'r') as f:
+            self.assertEqual(manifest['items'], json.load(f)['items'])
+        with open(os.path.join(self.output, '00000001.txt'), 'r') as f:
+            self.assertEqual(['11.000100,47.000100,1600000000', '11.002100,47.000200,1600000001'], f.read().split())
+        with open(os.path.join(self.output, '00000001.out.txt'), 'r') as f:
+            self.assertEqual(['11.0 47.001', '11.001 47.001', '11.002 47.001', '11.003 47.001'], f.read().splitlines())
+        self.assertTrue(os.path.exists(os.path.join(self.output, '00000001.osm')))
+
+        # only the outputs of a changed input are converted again, in the pool this time
+        track_path = os.path.join(self.dataset, '00000002', '00000002.track')
+        os.utime(track_path, (os.path.getmtime(track_path) + 10,) * 2)
+        manifest = convert_dataset(self.dataset, self.output, parse_ids('1-3'), osm_format='osm', workers=1)
+        self.assertEqual({'skipped': 8, 'converted': 1}, manifest['summary'])
+        self.assertEqual('converted', manifest['items'][1]['steps']['track']['status'])
+
+        os.remove(os.path.join(self.dataset, '00000000', '00000000.route'))
+        manifest = convert_dataset(self.dataset, self.output, parse_ids('0'), steps=('route',), workers=0)
+        self.assertEqual({'missing input': 1}, manifest['summary'])
+
+    def test_malformed_lines(self):
+        arcs_path = os.path.join(self.dataset, '00000004', '00000004.arcs')
+        with open(arcs_path, 'r') as f:
+            lines = f.readlines()
+        lines[5] = '5\n'
+        with open(arcs_path, 'w') as f:
+            f.writelines(lines)
+        manifest = convert_dataset(self.dataset, self.output, parse_ids('4'), steps=('osm', 'route'), workers=0)
+        self.assertEqual({'converted': 2}, manifest['summary'])
+        steps = manifest['items'][0]['steps']
+        self.assertEqual((1, 1), (steps['osm']['skipped_lines'], steps['route']['skipped_lines']))
+        with open(os.path.join(self.output, '00000004.out.txt'), 'r') as f:
+            self.assertEqual(4, len(f.read().splitlines()))
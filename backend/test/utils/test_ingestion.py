@@ -0,0 +1,131 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import TestCase, mock
+from config import Config
+from app import create_app, db
+from api.models.data import Data
+from api.models.data_group import DataGroup
+from api.utils.job_queue import JOB_FAILED, JOB_FINISHED, enqueue_job, run_job
+from api.utils.os_helper import create_data_group_folder, get_data_group_path, get_input_path, get_output_path
+from api.utils.pre_annotation import RANKING_FILE, get_pre_annotation_pool
+from api.utils.spatial_index import SpatialIndex, get_spatial_index_path
+
+
+def write_track(path, size, offset, with_timestamp=True):
+    with open(path, 'w') as f:
+        for i in range(size):
+            point = (116.3 + offset + i * 1e-4, 39.9 + i * 1e-4)
+            f.write('%.6f,%.6f,%d\n' % (point + (1183524462 + i * 5,)) if with_timestamp else '%.6f %.6f\n' % point)
+
+
+class TestIngestion(TestCase):
+    def setUp(self):
+        print("test ingestion start")
+        self.folder = tempfile.TemporaryDirectory()
+
+        class IngestionTestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.folder.name, 'app.db')
+            UPLOAD_DIR = os.path.join(self.folder.name, 'media')
+            JOB_WORKERS = 0
+            MATCHING_WORKERS = 0
+            PRE_ANNOTATION_WORKERS = 0
+            JOB_FLUSH_INTERVAL = 0
+            INGEST_BATCH_SIZE = 2
+
+        self.app = create_app(IngestionTestConfig)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        self.folder.cleanup()
+
+    def make_group(self, size=7, failed=(2, 5)):
+        group = DataGroup(osm_path='')
+        db.session.add(group)
+        db.session.commit()
+        create_data_group_folder(group.id)
+        # matcher outputs are already there, trajectories with a single method fail
+        trajectories = []
+        for i in range(size):
+            name = 't%d.txt' % i
+            path = os.path.join(get_input_path(group.id), name)
+            write_track(path, 20, i * 0.01)
+            for method in self.app.config['MATCHING_METHODS'][:1 if i in failed else 3]:
+                write_track(os.path.join(get_output_path(group.id), '%s-%s' % (method, name)), 20, i * 0.01, False)
+            trajectories.append([name, path])
+        return group, trajectories
+
+    def read_detail(self, group):
+        with open(os.path.join(get_data_group_path(group.id), '%s.json' % group.id)) as f:
+            return json.load(f)
+
+    def test_ingest(self):
+        group, trajectories = self.make_group()
+        job = enqueue_job('data_group', group.id, {'trajectories': trajectories, 'matching': False})
+        run_job(job)
+        self.assertEqual(JOB_FINISHED, job.status, job.error)
+        self.assertEqual(7, job.progress['done'])
+
+        datas = Data.query.filter_by(group_id=group.id).order_by(Data.name).all()
+        self.assertEqual(['t%d.txt' % i for i in range(7)], [data.name for data in datas])
+        self.assertEqual([1, 1, 0, 1, 1, 0, 1], [data.status for data in datas])
+        self.assertEqual(20, datas[0].summary['point_count'])
+        self.assertIsNone(datas[2].summary)
+
+        detail = self.read_detail(group)
+        self.assertEqual((True, False), (detail['finished'], detail['failed']))
+        self.assertEqual(['t0.txt', 't1.txt', 't3.txt', 't4.txt', 't6.txt'], sorted(detail['matching_result']['success']))
+        self.assertEqual(['t2.txt', 't5.txt'], sorted(detail['matching_result']['failed']))
+        with SpatialIndex(get_spatial_index_path(group.id)) as index:
+            self.assertEqual(5, len(index))
+
+    def test_requeue(self):
+        group, trajectories = self.make_group()
+        payload = {'trajectories': trajectories, 'matching': False}
+        run_job(enqueue_job('data_group', group.id, payload))
+        annotated = Data.query.filter_by(group_id=group.id, name='t3.txt').first()
+        annotated.status = 2
+        db.session.commit()
+        ids = dict(db.session.query(Data.name, Data.id).filter(Data.group_id == group.id))
+
+        # the same job again, as after a worker crash
+        job = enqueue_job('data_group', group.id, payload)
+        run_job(job)
+        self.assertEqual(JOB_FINISHED, job.status, job.error)
+        self.assertEqual(ids, dict(db.session.query(Data.name, Data.id).filter(Data.group_id == group.id)))
+        self.assertEqual(2, Data.query.get(ids['t3.txt']).status)
+        self.assertEqual(5, len(self.read_detail(group)['matching_result']['success']))
+
+    def test_failure(self):
+        group, trajectories = self.make_group(size=5, failed=())
+        os.remove(trajectories[3][1])
+        job = enqueue_job('data_group', group.id, {'trajectories': trajectories, 'matching': False})
+        run_job(job)
+        self.assertEqual(JOB_FAILED, job.status)
+        detail = self.read_detail(group)
+        self.assertEqual((True, True), (detail['finished'], detail['failed']))
+        # the first batch was committed
+        self.assertEqual(['t0.txt', 't1.txt'], sorted(detail['matching_result']['success']))
+
+    def test_pre_annotation_pool(self):
+        self.app.config['PRE_ANNOTATION_WORKERS'] = 2
+        group, trajectories = self.make_group()
+        pools = []
+
+        def get_pool(workers):
+            pools.append(get_pre_annotation_pool(workers))
+            return pools[-1]
+
+        job = enqueue_job('data_group', group.id, {'trajectories': trajectories, 'matching': False})
+        with mock.patch('api.utils.ingestion.get_pre_annotation_pool', get_pool):
+            run_job(job)
+        self.assertEqual(JOB_FINISHED, job.status, job.error)
+        self.assertIsInstance(pools[0], ProcessPoolExecutor)
+        with open(os.path.join(get_data_group_path(group.id), RANKING_FILE)) as f:
+            ranking = json.load(f)['ranking']
+        self.assertEqual(['t0.txt', 't1.txt', 't3.txt', 't4.txt', 't6.txt'], sorted(item['name'] for item in ranking))
@@ -1,8 +1,55 @@
+import random
+import time
+import tracemalloc
 from unittest import TestCase
 from api.utils.lcs import lcs
 from api.models.coordinate import Coordinate
 
 
+def dp_lcs(a, b):
+    """
+    The full-table DP lcs() replaced, kept as reference.
+    """
+    len_a, len_b = len(a), len(b)
+    lengths = [[0] * (len_b+1) for _ in range(len_a+1)]
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            if x == y:
+                lengths[i+1][j+1] = lengths[i][j] + 1
+            else:
+                lengths[i+1][j+1] = max(lengths[i+1][j], lengths[i][j+1])
+    result = []
+    index_a = []
+    index_b = []
+    i, j = len_a, len_b
+    while i > 0 and j > 0:
+        if lengths[i][j] == lengths[i][j-1]:
+            j -= 1
+        elif lengths[i][j] == lengths[i-1][j]:
+            i -= 1
+        else:
+            result.append(a[i-1])
+            index_a.append(i-1)
+            index_b.append(j-1)
+            i -= 1
+            j -= 1
+    return list(reversed(result)), list(reversed(index_a)), list(reversed(index_b))
+
+
+def random_track(size, seed):
+    """
+    A matcher-like output: a shared path with dropped and inserted vertices.
+    """
+    rand = random.Random(seed)
+    track = []
+    for i in range(size):
+        if rand.random() < 0.1:
+            track.append(Coordinate('%.6f' % rand.uniform(116, 117), '%.6f' % rand.uniform(39, 40)))
+        if rand.random() < 0.9:
+            track.append(Coordinate('%.6f' % (116 + i * 1e-5), '39.900000'))
+    return track
+
+
 class TestLCS(TestCase):
     def setUp(self):
         self.maxDiff = None
@@ -344,4 +391,34 @@ class TestLCS(TestCase):
             Coordinate('116.40426404187673', '39.9479679379158'),
             Coordinate('116.40402748593749', '39.94799736770982'),
             Coordinate('116.40278435653711', '39.94798991712905')
-            ],rv)
\ No newline at end of file
+            ],rv)
+
+    def test_lcs_same_as_dp(self):
+        """
+        same triple as the full-table DP, ties included
+        """
+        rand = random.Random(2022)
+        for _ in range(500):
+            alphabet = rand.randint(1, 8)
+            a = [rand.randint(0, alphabet) for _ in range(rand.randint(0, 60))]
+            b = [rand.randint(0, alphabet) for _ in range(rand.randint(0, 60))]
+            self.assertEqual(dp_lcs(a, b), lcs(a, b))
+        a, b = random_track(400, 1), random_track(400, 2)
+        self.assertEqual(dp_lcs(a, b), lcs(a, b))
+
+    def test_lcs_benchmark(self):
+        """
+        10k x 10k points, the full-table DP needs 10^8 cells (gigabytes)
+        """
+        a, b = random_track(10000, 3), random_track(10000, 4)
+        tracemalloc.start()
+        start = time.perf_counter()
+        rv, index_a, index_b = lcs(a, b)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("lcs 10k x 10k: %.3fs, peak %.1f MB" % (elapsed, peak / 2**20))
+        self.assertEqual(len(rv), len(index_a))
+        self.assertEqual([a[i] for i in index_a], [b[j] for j in index_b])
+        self.assertGreater(len(rv), 7000)
+        self.assertLess(peak, 32 * 2**20)
@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import textwrap
+from unittest import TestCase, mock
+from config import Config
+from app import create_app
+from api.utils import matching_pool
+from api.utils.matching_pool import MatchingWorker, MatchingWorkerError, MatchingWorkerPool, get_matching_pool
+from api.utils.matching_sdk import run_matching_method
+
+# speaks the line-JSON protocol of the SDK worker, the matcher name picks the behavior
+STUB_WORKER = textwrap.dedent('''
+    import json, sys, time
+    print('loading graph', flush=True)
+    for line in sys.stdin:
+        job = json.loads(line)
+        if job['op'] == 'match' and job['matcher'] == 'Crash':
+            print('graph corrupted', file=sys.stderr, flush=True)
+            sys.exit(1)
+        if job['op'] == 'match' and job['matcher'] == 'Slow':
+            time.sleep(5)
+        reply = {'id': job['id'], 'code': 0}
+        if job['op'] == 'match':
+            reply['stdout'] = '%s %s -> %s' % (job['matcher'], job['input'], job['output'])
+        # SDK log output in between replies
+        print('matching done', flush=True)
+        print(json.dumps(reply), flush=True)
+''')
+
+
+class TestMatchingPool(TestCase):
+    def setUp(self):
+        print("test matching pool start")
+        self.folder = tempfile.TemporaryDirectory()
+        self.stub = os.path.join(self.folder.name, 'worker.py')
+        with open(self.stub, 'w') as f:
+            f.write(STUB_WORKER)
+        self.args = [sys.executable, self.stub]
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.shutdown()
+        self.folder.cleanup()
+
+    def make_pool(self, args, size=1):
+        self.pools.append(MatchingWorkerPool(args, size, 10))
+        return self.pools[-1]
+
+    def test_protocol(self):
+        pool = self.make_pool(self.args, 2)
+        reply = pool.run('STMatching', 'in.txt', 'out', 10)
+        self.assertEqual(0, reply['code'])
+        self.assertEqual('STMatching in.txt -> out', reply['stdout'])
+        # warm-up ping, match, ping: replies are matched by id
+        worker = pool.workers[0]
+        self.assertEqual(3, worker.request({'op': 'ping'}, 10)['id'])
+        self.assertFalse(pool.workers[1].alive())
+
+    def test_errors(self):
+        pool = self.make_pool(self.args)
+        with self.assertRaisesRegex(MatchingWorkerError, 'graph corrupted'):
+            pool.run('Crash', 'in.txt', 'out', 10)
+        self.assertFalse(pool.workers[0].alive())
+        with self.assertRaisesRegex(MatchingWorkerError, 'timeout'):
+            pool.run('Slow', 'in.txt', 'out', 0.5)
+        self.assertFalse(pool.workers[0].alive())
+        # restarted on the next job
+        self.assertEqual(0, pool.run('STMatching', 'in.txt', 'out', 10)['code'])
+        with self.assertRaises(MatchingWorkerError):
+            MatchingWorker([os.path.join(self.folder.name, 'missing')], 10).start()
+
+    def test_health_check(self):
+        pool = self.make_pool(self.args, 2)
+        pool.health_check(10)
+        self.assertTrue(all(worker.alive() for worker in pool.workers))
+        pool.workers[0].process.kill()
+        pool.workers[0].process.wait()
+        pool.health_check(10)
+        self.assertTrue(all(worker.alive() for worker in pool.workers))
+        # a worker that does not answer the ping is stopped
+        with mock.patch.object(MatchingWorker, 'request', side_effect=MatchingWorkerError('worker timeout')):
+            pool.health_check(10)
+        self.assertFalse(any(worker.alive() for worker in pool.workers))
+
+    def test_fallback(self):
+        folder = self.folder.name
+
+        class PoolTestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(folder, 'app.db')
+            JOB_WORKERS = 0
+            MATCHING_WORKERS = 1
+
+        app = create_app(PoolTestConfig)
+        osm_path = os.path.join(folder, 'map.osm')
+        with app.app_context(), \
+                mock.patch('api.utils.matching_sdk.cmd', return_value=(0, {'stdout': 'cmd', 'stderr': ''})) as run_cmd:
+            # a worker that exits at once, as with a jar without worker entrypoint
+            pool = self.make_pool([sys.executable, '-c', 'pass'])
+            with mock.patch('api.utils.matching_sdk.get_matching_pool', return_value=pool):
+                self.assertEqual((0, {'stdout': 'cmd', 'stderr': ''}),
+                                 run_matching_method(osm_path, 'STMatching', 'in.txt', 'out'))
+            self.assertIn('com.example.MatchingMain', run_cmd.call_args[0][0])
+            # no new pool until the retry interval is over
+            self.assertIsNone(get_matching_pool(osm_path))
+            matching_pool._unavailable_until.pop(osm_path)
+
+            app.config['MATCHING_WORKERS'] = 0
+            self.assertIsNone(get_matching_pool(osm_path))
@@ -0,0 +1,173 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import TestCase
+import numpy as np
+from config import Config
+from app import create_app, db, hashids
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.os_helper import create_data_group_folder, get_matching_path
+from api.utils.matching_store import MatchingSidecar, export_json, sidecar_from_json, write_sidecar
+
+
+def random_trajectory(size, seed, with_timestamp=True):
+    rand = random.Random(seed)
+    return TrajectoryArray(
+        [rand.uniform(116, 117) for _ in range(size)],
+        [rand.uniform(39, 40) for _ in range(size)],
+        [1183524462 + i for i in range(size)] if with_timestamp else None)
+
+
+class TestMatchingStore(TestCase):
+    def setUp(self):
+        print("test matching store start")
+        self.folder = tempfile.TemporaryDirectory()
+        self.sidecar_path = os.path.join(self.folder.name, 'a.txt.mmd')
+        self.raw_traj = random_trajectory(10000, 1)
+        self.matching_result = [
+            ('STMatching', random_trajectory(9000, 2, False)),
+            ('GHMapMatching', random_trajectory(0, 3, False)),
+        ]
+        write_sidecar(self.sidecar_path, 'abc', 'a.txt', self.raw_traj, self.matching_result)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def expected(self):
+        return {
+            'group_id': 'abc',
+            'traj_name': 'a.txt',
+            'bounds': self.raw_traj.bounds(),
+            'raw_traj': self.raw_traj.to_list(),
+            'matching_result': [{
+                'method_name': name,
+                'trajectory': trajectory.to_list()
+            } for name, trajectory in self.matching_result]
+        }
+
+    def test_roundtrip(self):
+        sidecar = MatchingSidecar(self.sidecar_path)
+        self.assertIsInstance(sidecar.raw_traj.longitude.base, np.memmap)
+        self.assertEqual(self.expected(), sidecar.to_dict())
+        self.assertEqual(self.expected(), json.loads(''.join(sidecar.iter_json())))
+        self.assertEqual({'status_code': 20000, 'detail': self.expected()}, json.loads(''.join(sidecar.iter_json(20000))))
+
+    def test_json_export(self):
+        json_path = os.path.join(self.folder.name, 'a.txt.json')
+        export_json(self.sidecar_path, json_path)
+        with open(json_path, 'r') as f:
+            self.assertEqual(self.expected(), json.load(f))
+        converted_path = os.path.join(self.folder.name, 'b.txt.mmd')
+        sidecar_from_json(json_path, converted_path)
+        self.assertEqual(self.expected(), MatchingSidecar(converted_path).to_dict())
+        self.assertLess(os.path.getsize(self.sidecar_path) * 3, os.path.getsize(json_path))
+
+    def test_concurrent_writes(self):
+        json_path = os.path.join(self.folder.name, 'a.txt.json')
+        export_json(self.sidecar_path, json_path)
+        converted_path = os.path.join(self.folder.name, 'b.txt.mmd')
+        errors = []
+
+        def convert():
+            try:
+                sidecar_from_json(json_path, converted_path)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=convert) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(self.expected(), MatchingSidecar(converted_path).to_dict())
+        self.assertEqual([], [name for name in os.listdir(self.folder.name) if name.endswith('.tmp')])
+
+    def test_benchmark(self):
+        """
+        50k raw points and 3 methods, json.load + json.dumps vs streaming the sidecar
+        """
+        self.raw_traj = random_trajectory(50000, 4)
+        self.matching_result = [(name, random_trajectory(50000, seed, False)) for seed, name in enumerate(('STMatching', 'SimpleMapMatching', 'GHMapMatching'))]
+        write_sidecar(self.sidecar_path, 'abc', 'a.txt', self.raw_traj, self.matching_result)
+        json_path = os.path.join(self.folder.name, 'a.txt.json')
+        export_json(self.sidecar_path, json_path)
+        self.raw_traj = self.matching_result = None
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        with open(json_path, 'r') as f:
+            json_size = len(json.dumps({'status_code': 20000, 'detail': json.load(f)}))
+        json_time = time.perf_counter() - start
+        _, json_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        sidecar_size = sum(len(chunk) for chunk in MatchingSidecar(self.sidecar_path).iter_json(20000))
+        sidecar_time = time.perf_counter() - start
+        _, sidecar_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print("200k points: json %.1f MB peak in %.3fs, sidecar %.1f MB peak in %.3fs" % (
+            json_peak / 2**20, json_time, sidecar_peak / 2**20, sidecar_time))
+        self.assertEqual(json_size, sidecar_size)
+        self.assertLess(sidecar_peak * 10, json_peak)
+
+
+class TestMatchingRoute(TestCase):
+    def setUp(self):
+        print("test matching route start")
+        self.folder = tempfile.TemporaryDirectory()
+
+        class MatchingRouteTestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.folder.name, 'app.db')
+            UPLOAD_DIR = os.path.join(self.folder.name, 'media')
+            JOB_WORKERS = 0
+            MATCHING_WORKERS = 0
+
+        self.app = create_app(MatchingRouteTestConfig)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        create_data_group_folder(1)
+        self.matching_path = get_matching_path(1)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        self.folder.cleanup()
+
+    def get(self, name):
+        return self.client.get('/api/matchings/%s/%s' % (hashids.encode(1), name))
+
+    def test_legacy_json(self):
+        raw_traj = random_trajectory(5, 1)
+        detail = {
+            'group_id': hashids.encode(1),
+            'traj_name': 'a.txt',
+            'bounds': raw_traj.bounds(),
+            'raw_traj': raw_traj.to_list(),
+            'matching_result': [{'method_name': 'STMatching', 'trajectory': random_trajectory(4, 2, False).to_list()}],
+        }
+        with open(os.path.join(self.matching_path, 'a.txt.json'), 'w') as f:
+            json.dump(detail, f)
+        response = self.get('a.txt')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(detail, response.get_json()['detail'])
+        self.assertTrue(os.path.exists(os.path.join(self.matching_path, 'a.txt.mmd')))
+
+        # a json the conversion does not understand is served as it is
+        broken = dict(detail, traj_name='b.txt', raw_traj=[{'longitude': 116.3}])
+        with open(os.path.join(self.matching_path, 'b.txt.json'), 'w') as f:
+            json.dump(broken, f)
+        response = self.get('b.txt')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(broken, response.get_json()['detail'])
+        self.assertEqual(['a.txt.json', 'a.txt.mmd', 'b.txt.json'], sorted(os.listdir(self.matching_path)))
+        self.assertEqual(404, self.get('c.txt').status_code)
@@ -0,0 +1,91 @@
+import functools
+import os
+import random
+import time
+from unittest import TestCase
+from api.utils.lcs import lcs
+from api.utils.mlcs import mlcs, greedy_mlcs
+from api.models.coordinate import Coordinate
+
+
+def matcher_outputs(size, count, seed):
+    """
+    `count` outputs of the same path with dropped and inserted vertices.
+    """
+    rand = random.Random(seed)
+    path = [Coordinate('%.6f' % (116 + i * 1e-5), '39.900000') for i in range(size)]
+    outputs = []
+    for _ in range(count):
+        output = []
+        for coordinate in path:
+            if rand.random() < 0.05:
+                output.append(Coordinate('%.6f' % rand.uniform(116, 117), '%.6f' % rand.uniform(39, 40)))
+            if rand.random() < 0.93:
+                output.append(coordinate)
+        outputs.append(output)
+    return outputs
+
+
+def exact_length(arrays):
+    @functools.lru_cache(maxsize=None)
+    def length(*pos):
+        if any(p == len(array) for p, array in zip(pos, arrays)):
+            return 0
+        best = 0
+        if all(array[p] == arrays[0][pos[0]] for p, array in zip(pos, arrays)):
+            best = 1 + length(*[p + 1 for p in pos])
+        for k in range(len(pos)):
+            best = max(best, length(*[p + (i == k) for i, p in enumerate(pos)]))
+        return best
+    return length(*[0] * len(arrays))
+
+
+class TestMLCS(TestCase):
+    def setUp(self):
+        print("test mlcs start")
+
+    def assertCommonSubsequence(self, arrays, result, indexes):
+        for array, index in zip(arrays, indexes):
+            self.assertEqual(result, [array[i] for i in index])
+            self.assertEqual(sorted(set(index)), index)
+
+    def test_mlcs_exact(self):
+        rand = random.Random(2022)
+        for _ in range(200):
+            arrays = [[rand.randint(0, 4) for _ in range(rand.randint(0, 10))] for _ in range(rand.randint(2, 3))]
+            result, indexes = mlcs(arrays, beam_width=None, window=None)
+            self.assertCommonSubsequence(arrays, result, indexes)
+            self.assertEqual(exact_length(arrays), len(result))
+            if len(arrays) == 2:
+                self.assertEqual(len(lcs(*arrays)[0]), len(result))
+
+    def test_mlcs_beam(self):
+        arrays = matcher_outputs(300, 3, 1)
+        result, indexes = mlcs(arrays)
+        self.assertCommonSubsequence(arrays, result, indexes)
+        self.assertEqual(len(mlcs(arrays, beam_width=None, window=None)[0]), len(result))
+
+    def test_mlcs_benchmark(self):
+        """
+        beam search vs the previous greedy algorithm, 3-5 methods
+        """
+        for count in (3, 5):
+            arrays = matcher_outputs(2000, count, count)
+            start = time.perf_counter()
+            greedy_result, _ = greedy_mlcs(arrays)
+            greedy_time = time.perf_counter() - start
+            start = time.perf_counter()
+            result, indexes = mlcs(arrays)
+            beam_time = time.perf_counter() - start
+            print("mlcs %s x 2k: greedy %s in %.3fs, beam %s in %.3fs" % (count, len(greedy_result), greedy_time, len(result), beam_time))
+            self.assertCommonSubsequence(arrays, result, indexes)
+            self.assertGreaterEqual(len(result), len(greedy_result))
+
+            arrays = matcher_outputs(10000, count, count)
+            start = time.perf_counter()
+            result, indexes = mlcs(arrays)
+            beam_time = time.perf_counter() - start
+            print("mlcs %s x 10k: beam %s in %.3fs" % (count, len(result), beam_time))
+            self.assertCommonSubsequence(arrays, result, indexes)
+            if os.environ.get('MMD_BENCHMARK'):
+                self.assertLess(beam_time, 30)
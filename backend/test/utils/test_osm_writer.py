@@ -0,0 +1,108 @@
+import gzip
+import os
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from unittest import TestCase
+import numpy as np
+from api.utils.osm_writer import write_ieee_osm
+
+
+def element_tree_osm(nodes_path, arcs_path, output_path):
+    """
+    The in-memory ElementTree build the writer replaces.
+    """
+    root = ET.Element('osm', version='0.6', generator='buaa_mdc')
+    meta = dict(version='0', timestamp='2000-01-01T00:00:00Z', changeset='1', uid='1', user='buaa_mdc')
+    with open(nodes_path, 'r') as f:
+        for line_count, line in enumerate(f):
+            lon, lat = line.strip().split('\t')
+            root.append(ET.Element('node', id=str(line_count), lat=lat, lon=lon, **meta))
+    with open(arcs_path, 'r') as f:
+        for line_count, line in enumerate(f):
+            start_node, end_node = line.strip().split('\t')
+            way = ET.SubElement(root, 'way', id=str(line_count), **meta)
+            ET.SubElement(way, 'nd', ref=start_node)
+            ET.SubElement(way, 'nd', ref=end_node)
+            ET.SubElement(way, 'tag', k='highway', v='tertiary')
+            ET.SubElement(way, 'tag', k='name', v=str(line_count))
+            ET.SubElement(way, 'tag', k='oneway', v='yes')
+    ET.ElementTree(root).write(output_path, encoding='utf-8', xml_declaration=True)
+
+
+class TestOsmWriter(TestCase):
+    def setUp(self):
+        print("test osm writer start")
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def network(self, size):
+        rand = np.random.default_rng(size)
+        nodes_path = os.path.join(self.folder.name, 'a.nodes')
+        arcs_path = os.path.join(self.folder.name, 'a.arcs')
+        np.savetxt(nodes_path, np.stack([rand.uniform(10, 11, size), rand.uniform(51, 52, size)], axis=1), fmt='%.6f', delimiter='\t')
+        np.savetxt(arcs_path, rand.integers(0, size, (size * 2, 2)), fmt='%d', delimiter='\t')
+        return nodes_path, arcs_path
+
+    def test_same_document(self):
+        nodes_path, arcs_path = self.network(500)
+        expected_path = os.path.join(self.folder.name, 'expected.osm')
+        element_tree_osm(nodes_path, arcs_path, expected_path)
+        nodes = np.loadtxt(nodes_path, delimiter='\t')
+        expected = [(element.tag, element.attrib) for element in ET.parse(expected_path).iter()]
+
+        for name, opener in (('a.osm', open), ('a.osm.gz', gzip.open)):
+            output_path = os.path.join(self.folder.name, name)
+            node_count, way_count, bounds = write_ieee_osm(nodes_path, arcs_path, output_path)
+            self.assertEqual((500, 1000), (node_count, way_count))
+            with opener(output_path, 'rb') as f:
+                written = [(element.tag, element.attrib) for _, element in ET.iterparse(f)]
+            # iterparse reports children first, compare as multisets without the bounds
+            self.assertEqual(sorted(map(repr, expected)), sorted(repr(item) for item in written if item[0] != 'bounds'))
+            written_bounds = [attrib for tag, attrib in written if tag == 'bounds'][0]
+            self.assertEqual(nodes[:, 0].min(), float(written_bounds['minlon']))
+            self.assertEqual(nodes[:, 1].max(), float(written_bounds['maxlat']))
+            self.assertEqual((nodes[:, 0].min(), nodes[:, 1].min(), nodes[:, 0].max(), nodes[:, 1].max()), bounds)
+
+    def test_malformed_lines(self):
+        nodes_path = os.path.join(self.folder.name, 'a.nodes')
+        arcs_path = os.path.join(self.folder.name, 'a.arcs')
+        with open(nodes_path, 'w') as f:
+            f.write('10.0\t51.0\n10.1\n\n10.2\t51.2\nabc\t51.3\n10.4\t51.4\n10.5\t51.5\t1\n')
+        with open(arcs_path, 'w') as f:
+            f.write('0\t2\n2\n2\t4\n')
+        errors = []
+        output_path = os.path.join(self.folder.name, 'a.osm')
+        node_count, way_count, _ = write_ieee_osm(nodes_path, arcs_path, output_path,
+                                                  lambda path, line_number, line: errors.append((path, line_number, line)))
+        self.assertEqual((3, 2), (node_count, way_count))
+        self.assertEqual([(nodes_path, 2, '10.1'), (nodes_path, 5, 'abc\t51.3'), (nodes_path, 7, '10.5\t51.5\t1'),
+                          (arcs_path, 2, '2')], errors)
+        # skipped lines keep their id, the arcs still refer to the right nodes
+        elements = ET.parse(output_path).getroot()
+        self.assertEqual({'0': '10.0', '2': '10.2', '4': '10.4'},
+                         {node.get('id'): node.get('lon') for node in elements.iter('node')})
+        self.assertEqual({'0': ['0', '2'], '2': ['2', '4']},
+                         {way.get('id'): [nd.get('ref') for nd in way.iter('nd')] for way in elements.iter('way')})
+
+    def test_benchmark(self):
+        nodes_path, arcs_path = self.network(5000)
+        tracemalloc.start()
+        start = time.perf_counter()
+        element_tree_osm(nodes_path, arcs_path, os.path.join(self.folder.name, 'expected.osm'))
+        tree_time = time.perf_counter() - start
+        _, tree_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        write_ieee_osm(nodes_path, arcs_path, os.path.join(self.folder.name, 'a.osm'))
+        stream_time = time.perf_counter() - start
+        _, stream_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("5k nodes, 10k ways: ElementTree %.1f MB peak in %.2fs, streaming %.1f MB peak in %.2fs" % (
+            tree_peak / 2**20, tree_time, stream_peak / 2**20, stream_time))
+        self.assertLess(stream_peak * 5, tree_peak)
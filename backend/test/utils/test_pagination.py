@@ -0,0 +1,54 @@
+import os
+import tempfile
+from unittest import TestCase
+from config import Config
+from app import create_app, db, hashids
+from api.models.data import Data
+from api.models.data_group import DataGroup
+from api.utils.pagination import decode_cursor, keyset_page
+
+
+class TestPagination(TestCase):
+    def setUp(self):
+        print("test pagination start")
+        self.folder = tempfile.TemporaryDirectory()
+
+        class PaginationTestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.folder.name, 'app.db')
+            JOB_WORKERS = 0
+            MATCHING_WORKERS = 0
+
+        self.app = create_app(PaginationTestConfig)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        group = DataGroup(osm_path='')
+        db.session.add(group)
+        db.session.commit()
+        db.session.bulk_insert_mappings(Data, [{'name': 't%d.txt' % i, 'path': '', 'group_id': group.id, 'status': i % 2}
+                                               for i in range(7)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        self.folder.cleanup()
+
+    def test_pages(self):
+        query = db.session.query(Data.id, Data.name).filter(Data.status == 0)
+        names, cursor = [], None
+        while True:
+            page, cursor = keyset_page(query, Data.id, cursor, '2')
+            names.append([data.name for data in page])
+            if cursor is None:
+                break
+        # the extra row tells that the second page is the last one
+        self.assertEqual([['t0.txt', 't2.txt'], ['t4.txt', 't6.txt']], names)
+        self.assertEqual(7, len(keyset_page(Data.query, Data.id)[0]))
+        self.assertEqual(0, decode_cursor(None))
+        self.assertEqual(3, decode_cursor(hashids.encode(3)))
+
+    def test_illegal(self):
+        for cursor, size in ((None, '0'), (None, -1), (None, 'a'), ('not a cursor', 2)):
+            with self.assertRaises(ValueError):
+                keyset_page(Data.query, Data.id, cursor, size)
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from api.models.trajectory import MatchingMethod
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.matching_store import write_sidecar
+from api.utils.pre_annotation import pre_annotate, pre_annotate_folder, rank
+
+# named vertices, no three of them are collinear
+VERTICES = {name: (116 + i * 1e-3, 39.9 + (i * i % 7) * 1e-3) for i, name in enumerate('ABCDEFXY')}
+
+
+def method(name, path):
+    matching_method = MatchingMethod(name, '')
+    matching_method.raw_traj = TrajectoryArray([VERTICES[v][0] for v in path], [VERTICES[v][1] for v in path])
+    return matching_method
+
+
+class TestPreAnnotation(TestCase):
+    def setUp(self):
+        print("test pre annotation start")
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_same_outputs(self):
+        areas = pre_annotate([method('STMatching', 'ABCDEF'), method('GHMapMatching', 'ABCDEF')])
+        self.assertEqual([(0, 5)], [(area['sub_traj']['owner']['start_index'], area['sub_traj']['owner']['end_index'])
+                                    for area in areas['matched_areas']])
+        self.assertEqual([], areas['mismatched_areas'])
+        self.assertEqual({'longitude': VERTICES['A'][0], 'latitude': VERTICES['A'][1]},
+                         areas['matched_areas'][0]['sub_traj']['traj'][0])
+        self.assertIsNone(pre_annotate([method('STMatching', 'ABC'), method('GHMapMatching', 'ABC')],
+                                       {'disabled_annotators': ['STMatching']}))
+
+    def test_detour(self):
+        areas = pre_annotate([method('STMatching', 'ABCDEF'), method('SimpleMapMatching', 'ABXYEF'),
+                              method('GHMapMatching', 'ABCDEF')])
+        self.assertEqual([(1, 0, 1), (3, 4, 5)], [(area['id'], area['sub_traj']['owner']['start_index'],
+                                                   area['sub_traj']['owner']['end_index']) for area in areas['matched_areas']])
+        self.assertEqual([], areas['prematched_areas'])
+        self.assertEqual(1, len(areas['mismatched_areas']))
+        mismatched = areas['mismatched_areas'][0]
+        self.assertEqual(2, mismatched['id'])
+        groups = {sub_traj['base_owner_type']: [owner['owner_type'] for owner in sub_traj['owners']]
+                  for sub_traj in mismatched['sub_trajs']}
+        self.assertEqual({'STMatching': ['STMatching', 'GHMapMatching'], 'SimpleMapMatching': ['SimpleMapMatching']}, groups)
+        self.assertEqual(1, areas['metric_simplified_traj_count'])
+
+        # an extra vertex is continuous for auto_merge_circle, otherwise a prematched area
+        areas = pre_annotate([method('STMatching', 'ABCDEF'), method('GHMapMatching', 'ABCXDEF')])
+        self.assertEqual(1, len(areas['matched_areas']))
+        areas = pre_annotate([method('STMatching', 'ABCDEF'), method('GHMapMatching', 'ABCXDEF')], {'auto_merge_circle': False})
+        self.assertEqual(2, len(areas['matched_areas']))
+        self.assertEqual(1, len(areas['prematched_areas']))
+        self.assertEqual([], areas['mismatched_areas'])
+
+    def test_folder(self):
+        paths = {'a.txt': ('ABCDEF', 'ABCDEF'), 'b.txt': ('ABCDEF', 'ABXYEF'), 'c.txt': ('ABCDEF', 'ACXDEF')}
+        for name, (first, second) in paths.items():
+            results = [(matching.name, matching.raw_traj) for matching in
+                       (method('STMatching', first), method('GHMapMatching', second))]
+            raw_traj = TrajectoryArray([116.0], [39.9], [1])
+            write_sidecar(os.path.join(self.folder.name, '%s.mmd' % name), 'abc', name, raw_traj, results)
+        summaries = pre_annotate_folder(self.folder.name, workers=0)
+        without_seconds = lambda items: [{k: v for k, v in item.items() if k != 'seconds'} for item in items]
+        self.assertEqual(without_seconds(summaries), without_seconds(pre_annotate_folder(self.folder.name, workers=1)))
+        self.assertEqual(['b.txt', 'a.txt', 'c.txt'], [summary['name'] for summary in rank(summaries)])
+        self.assertEqual(1.0, summaries[0]['matched_ratio'])
+        with open(os.path.join(self.folder.name, 'b.txt.pre.json'), 'r') as f:
+            document = json.load(f)
+        self.assertEqual(1, document['summary']['mismatched_areas'])
+        self.assertEqual(1, len(document['pre_annotation']['mismatched_areas']))
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from flask import Flask
+from werkzeug.http import http_date
+from api.utils.response_cache import ResponseCache, cached_file_response
+
+
+class TestResponseCache(TestCase):
+    def setUp(self):
+        print("test response cache start")
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'detail.json')
+        self.write('{"a": 1}', time.time() - 100)
+        self.builds = 0
+        self.app = Flask(__name__)
+        self.app.config.update(RESPONSE_CACHE_BYTES=1024 * 1024, RESPONSE_CACHE_ENTRY_BYTES=1024)
+
+        @self.app.route('/detail')
+        def detail():
+            def build():
+                self.builds += 1
+                with open(self.path, 'r') as f:
+                    return f.read()
+            return cached_file_response(self.path, build)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, content, mtime):
+        with open(self.path, 'w') as f:
+            f.write(content)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_bytes=30, max_entry_bytes=20)
+        cache.put('a', b'a' * 10)
+        cache.put('b', b'b' * 10)
+        cache.put('c', b'c' * 25)
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(b'a' * 10, cache.get('a'))
+        cache.put('d', b'd' * 15)
+        # b is the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(b'a' * 10, cache.get('a'))
+        self.assertEqual(b'd' * 15, cache.get('d'))
+        stats = cache.stats()
+        self.assertEqual({'entries': 2, 'bytes': 25, 'hits': 3, 'misses': 2, 'evictions': 1},
+                         {key: stats[key] for key in ('entries', 'bytes', 'hits', 'misses', 'evictions')})
+
+    def test_collect(self):
+        cache = ResponseCache(max_bytes=100, max_entry_bytes=10)
+        self.assertEqual([b'ab', b'cd'], list(cache.collect('small', ['ab', b'cd'])))
+        self.assertEqual(b'abcd', cache.get('small'))
+        self.assertEqual([b'abcdef', b'ghijkl'], list(cache.collect('large', ['abcdef', 'ghijkl'])))
+        self.assertIsNone(cache.get('large'))
+        # an abandoned stream is not cached
+        chunks = cache.collect('partial', ['ab', 'cd'])
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(cache.get('partial'))
+
+    def test_conditional_requests(self):
+        response = self.client.get('/detail')
+        self.assertEqual((200, b'{"a": 1}', 'MISS'), (response.status_code, response.data, response.headers['X-Cache']))
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        self.assertTrue(etag)
+        self.assertEqual('no-cache', response.headers['Cache-Control'])
+        response = self.client.get('/detail')
+        self.assertEqual((b'{"a": 1}', 'HIT', etag), (response.data, response.headers['X-Cache'], response.headers['ETag']))
+
+        response = self.client.get('/detail', headers={'If-None-Match': etag})
+        self.assertEqual((304, b'', etag), (response.status_code, response.data, response.headers['ETag']))
+        self.assertEqual(200, self.client.get('/detail', headers={'If-None-Match': '"other"'}).status_code)
+        response = self.client.get('/detail', headers={'If-Modified-Since': last_modified})
+        self.assertEqual((304, b''), (response.status_code, response.data))
+        response = self.client.get('/detail', headers={'If-Modified-Since': http_date(time.time() - 1000)})
+        self.assertEqual((200, b'{"a": 1}'), (response.status_code, response.data))
+        # If-None-Match wins over If-Modified-Since
+        response = self.client.get('/detail', headers={'If-None-Match': '"other"', 'If-Modified-Since': last_modified})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, self.builds)
+
+        # the file is replaced: new ETag, the old one no longer matches
+        self.write('{"a": 2}', time.time())
+        response = self.client.get('/detail', headers={'If-None-Match': etag, 'If-Modified-Since': last_modified})
+        self.assertEqual((200, b'{"a": 2}', 'MISS'), (response.status_code, response.data, response.headers['X-Cache']))
+        self.assertNotEqual(etag, response.headers['ETag'])
+        response = self.client.get('/detail', headers={'If-Modified-Since': last_modified})
+        self.assertEqual((200, b'{"a": 2}'), (response.status_code, response.data))
+        self.assertEqual(2, self.builds)
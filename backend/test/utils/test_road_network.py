@@ -0,0 +1,121 @@
+import math
+import os
+import tempfile
+import time
+from unittest import TestCase
+import numpy as np
+from api.utils.road_network import MISSING, RoadNetwork, load_ieee_network, read_route
+
+
+def grid_network(size, seed=0):
+    """
+    A size x size street grid with jittered nodes and arcs in both directions.
+    """
+    rand = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.arange(size), np.arange(size))
+    longitude = 11.0 + x.ravel() * 1e-3 + rand.uniform(-3e-4, 3e-4, size * size)
+    latitude = 47.0 + y.ravel() * 1e-3 + rand.uniform(-3e-4, 3e-4, size * size)
+    ids = np.arange(size * size).reshape(size, size)
+    pairs = np.concatenate([
+        np.stack([ids[:, :-1].ravel(), ids[:, 1:].ravel()], axis=1),
+        np.stack([ids[:-1, :].ravel(), ids[1:, :].ravel()], axis=1),
+    ])
+    arcs = np.concatenate([pairs, pairs[:, ::-1]])
+    return longitude, latitude, arcs
+
+
+class TestRoadNetwork(TestCase):
+    def setUp(self):
+        print("test road network start")
+        self.folder = tempfile.TemporaryDirectory()
+        self.longitude, self.latitude, self.arcs = grid_network(60)
+        self.network = RoadNetwork(self.longitude, self.latitude, self.arcs[:, 0], self.arcs[:, 1])
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_adjacency(self):
+        for node in (0, 61, 3599):
+            expected = sorted(int(arc) for arc in np.nonzero(self.arcs[:, 0] == node)[0])
+            self.assertEqual(expected, sorted(self.network.out_arcs(node).tolist()))
+            self.assertEqual(sorted(self.arcs[expected, 1].tolist()), sorted(self.network.neighbors(node).tolist()))
+        self.assertEqual(2, len(self.network.out_arcs(0)))
+        arc_id = self.network.find_arc(61, 62)
+        self.assertEqual((61, 62), self.network.arc(arc_id))
+        self.assertIsNone(self.network.find_arc(0, 3599))
+
+    def test_nearest_node(self):
+        rand = np.random.default_rng(1)
+        # inside, on the border and far outside the network
+        points = np.concatenate([
+            np.stack([rand.uniform(10.99, 11.07, 300), rand.uniform(46.99, 47.07, 300)], axis=1),
+            [[10.5, 47.03], [11.03, 48.0], [12.0, 46.0]],
+        ])
+        scale = np.cos(np.radians(points[:, 1]))
+        for (longitude, latitude), point_scale in zip(points, scale):
+            distances = ((self.longitude - longitude) * point_scale) ** 2 + (self.latitude - latitude) ** 2
+            node, distance = self.network.nearest_node(longitude, latitude)
+            self.assertAlmostEqual(math.sqrt(distances.min()), distance / 111319.49079327357, places=12)
+            self.assertEqual(int(np.argmin(distances)), node)
+        nodes, _ = self.network.nearest_nodes(points[:10, 0], points[:10, 1])
+        self.assertEqual([self.network.nearest_node(*point)[0] for point in points[:10]], nodes.tolist())
+
+    def test_nodes_within(self):
+        box = (11.01, 47.02, 11.015, 47.031)
+        inside = (self.longitude >= box[0]) & (self.longitude <= box[2]) & (self.latitude >= box[1]) & (self.latitude <= box[3])
+        self.assertEqual(np.nonzero(inside)[0].tolist(), self.network.nodes_within(*box).tolist())
+        self.assertEqual(0, len(self.network.nodes_within(0, 0, 1, 1)))
+
+    def test_ieee_store(self):
+        network_folder = os.path.join(self.folder.name, '00000000')
+        os.makedirs(network_folder)
+        np.savetxt(os.path.join(network_folder, '00000000.nodes'), np.stack([self.longitude, self.latitude], axis=1), fmt='%.6f', delimiter='\t')
+        np.savetxt(os.path.join(network_folder, '00000000.arcs'), self.arcs, fmt='%d', delimiter='\t')
+        route = [self.network.find_arc(0, 1), self.network.find_arc(1, 2), self.network.find_arc(2, 62)]
+        np.savetxt(os.path.join(network_folder, '00000000.route'), route, fmt='%d')
+
+        built = load_ieee_network(network_folder)
+        self.assertTrue(os.path.exists(os.path.join(network_folder, '00000000.network.npz')))
+        start = time.perf_counter()
+        loaded = load_ieee_network(network_folder)
+        load_time = time.perf_counter() - start
+        print("3600 nodes, 14160 arcs: store loads in %.1fms" % (load_time * 1000))
+        for name in RoadNetwork.__slots__:
+            self.assertTrue(np.array_equal(getattr(built, name), getattr(loaded, name)), name)
+        self.assertEqual([0, 1, 2, 62], loaded.route_nodes(read_route(os.path.join(network_folder, '00000000.route'))).tolist())
+        trajectory = loaded.route_trajectory(route)
+        self.assertAlmostEqual(self.longitude[62], trajectory.longitude[-1], places=6)
+        self.assertEqual(loaded.nearest_node(11.03, 47.03), built.nearest_node(11.03, 47.03))
+
+    def test_ieee_tables(self):
+        nodes_path = os.path.join(self.folder.name, 'a.nodes')
+        arcs_path = os.path.join(self.folder.name, 'a.arcs')
+        with open(nodes_path, 'w') as f:
+            f.write('11.0\t47.0\n11.001\t47.0\n\n11.002\t47.001\n')
+        with open(arcs_path, 'w') as f:
+            f.write('0\t1\n1\t2\n')
+        network = RoadNetwork.from_ieee(nodes_path, arcs_path)
+        self.assertEqual([11.0, 11.001, 11.002], network.longitude.tolist())
+        self.assertEqual([1], network.arc_target[network.arc_order[network.arc_indptr[0]:network.arc_indptr[1]]].tolist())
+
+        # malformed lines are skipped and reported, the ids after them do not shift
+        for arcs, line_number in (('0\t1\n1\tx\n1\t2\n', 2), ('0\t1\n1\n1\t2\n', 2), ('0\t1\t2\n0\t1\n1\t2\n', 1),
+                                  ('0\t1.5\n0\t1\n1\t2\n', 1)):
+            with open(arcs_path, 'w') as f:
+                f.write(arcs)
+            errors = []
+            network = RoadNetwork.from_ieee(nodes_path, arcs_path, on_error=lambda *error: errors.append(error[:2]))
+            self.assertEqual([(arcs_path, line_number)], errors)
+            self.assertEqual(3, network.arc_count)
+            self.assertEqual((MISSING, MISSING), network.arc(line_number - 1))
+            self.assertEqual(2, network.find_arc(1, 2))
+            with self.assertRaises(ValueError):
+                network.route_nodes([line_number - 1])
+        with open(nodes_path, 'w') as f:
+            f.write('11.0\t47.0\n11.001\n11.002\t47.001\n')
+        network = RoadNetwork.from_ieee(nodes_path, arcs_path)
+        self.assertTrue(math.isnan(network.longitude[1]))
+        self.assertEqual(2, network.nearest_node(11.0015, 47.0008)[0])
+        self.assertEqual(11.002, network.bounds()['max_lon'])
+        open(arcs_path, 'w').close()
+        self.assertEqual(0, len(RoadNetwork.from_ieee(nodes_path, arcs_path).arc_source))
@@ -0,0 +1,92 @@
+import json
+import os
+import time
+import unittest
+from datetime import datetime
+from unittest import TestCase
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.serializer import dumps, get_backend, orjson, points_json
+
+
+def trajectory(size, seed, with_timestamp=True):
+    rng = np.random.default_rng(seed)
+    timestamp = 1183524462 + np.arange(size) * 5 if with_timestamp else None
+    return TrajectoryArray(116 + rng.random(size), 39 + rng.random(size), timestamp)
+
+
+def best_of(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class TestSerializer(TestCase):
+    def setUp(self):
+        print("test serializer start")
+        self.backends = [get_backend('json')] + ([get_backend('orjson')] if orjson is not None else [])
+
+    def test_points(self):
+        cases = [trajectory(0, 1), trajectory(1, 1), trajectory(100, 2), trajectory(100, 3, with_timestamp=False),
+                 TrajectoryArray([-0.0, 1e-7, 180.0], [90.0, -1.5e-10, 12.25], [0, -1, 2 ** 40])]
+        for backend in self.backends:
+            for case in cases:
+                self.assertEqual(case.to_list(), json.loads(points_json(case, backend)), backend.name)
+                self.assertEqual(case.to_list(), json.loads(points_json(case, backend, spaced=True)), backend.name)
+            # orjson writes 1e-7 where json writes 1e-07
+            self.assertEqual(json.dumps(cases[2].to_list()).encode(), points_json(cases[2], backend, spaced=True), backend.name)
+        self.assertEqual(json.dumps(cases[4].to_list()).encode(), points_json(cases[4], self.backends[0], spaced=True))
+
+    def test_dumps(self):
+        document = {
+            'status_code': 20000,
+            'detail': {
+                'raw_traj': trajectory(20, 4),
+                'matching_result': [{'method_name': 'STMatching', 'trajectory': trajectory(10, 5, with_timestamp=False)},
+                                    {'method_name': 'GHMapMatching', 'trajectory': trajectory(0, 6)}],
+                'bounds': np.array([[116.0, 39.0], [117.0, 40.0]]),
+                'count': np.int64(3),
+                'created': datetime(2022, 5, 11, 16, 20, 5),
+                'name': '轨迹 "a"\n',
+                'labels': ['0', '1'],
+            }
+        }
+        expected = {
+            'status_code': 20000,
+            'detail': {
+                'raw_traj': document['detail']['raw_traj'].to_list(),
+                'matching_result': [{'method_name': 'STMatching', 'trajectory': document['detail']['matching_result'][0]['trajectory'].to_list()},
+                                    {'method_name': 'GHMapMatching', 'trajectory': []}],
+                'bounds': [[116.0, 39.0], [117.0, 40.0]],
+                'count': 3,
+                'created': 'Wed, 11 May 2022 16:20:05 GMT',
+                'name': '轨迹 "a"\n',
+                'labels': ['0', '1'],
+            }
+        }
+        for backend in self.backends:
+            self.assertEqual(expected, json.loads(dumps(document, backend)), backend.name)
+        with self.assertRaises(TypeError):
+            dumps({'a': object()}, self.backends[0])
+        with self.assertRaises(ValueError):
+            get_backend('simplejson')
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_benchmark(self):
+        document = {'raw_traj': trajectory(50000, 7), 'trajectory': trajectory(50000, 8, with_timestamp=False)}
+        dicts = lambda: {key: value.to_list() for key, value in document.items()}
+        times = {
+            'json, dicts': best_of(lambda: json.dumps(dicts())),
+            'orjson, dicts': best_of(lambda: orjson.dumps(dicts())),
+            'json, columns': best_of(lambda: dumps(document, get_backend('json'))),
+            'orjson, columns': best_of(lambda: dumps(document, get_backend('orjson'))),
+        }
+        print("2 x 50k points: " + ", ".join("%s %.1f ms" % (name, seconds * 1000) for name, seconds in times.items()))
+        self.assertEqual(json.loads(json.dumps(dicts())), json.loads(dumps(document, get_backend('orjson'))))
+        # wall-clock, depends on the machine
+        if os.environ.get('MMD_BENCHMARK'):
+            self.assertLess(times['json, columns'], times['json, dicts'])
+            self.assertLess(times['orjson, columns'] * 3, times['json, dicts'])
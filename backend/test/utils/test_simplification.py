@@ -0,0 +1,130 @@
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from unittest import TestCase
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.matching_store import MatchingSidecar, export_json, write_sidecar
+from api.utils.simplification import collinear_indexes, douglas_peucker_indexes, project, simplified_indexes
+
+
+def simplified_traj(lon, lat, threshold):
+    """
+    `get_simplified_traj` of the WASM crate, point by point.
+    """
+    if not lon:
+        return []
+    kept = [0]
+    i, j = 0, 1
+    while j + 1 < len(lon):
+        x1, y1 = lon[j] - lon[i], lat[j] - lat[i]
+        x2, y2 = lon[j + 1] - lon[i], lat[j + 1] - lat[i]
+        if abs(x1 * y2 - y1 * x2) < threshold and x1 * x2 > 0.0 and y1 * y2 > 0.0:
+            if j + 1 == len(lon) - 1:
+                kept.append(j + 1)
+        elif j + 1 == len(lon) - 1:
+            kept.extend((j, j + 1))
+        else:
+            kept.append(j)
+            i = j
+        j += 1
+    return kept
+
+
+def road(corners, seed, step=50):
+    """
+    Matcher-like output: straight edges between corners, `step` vertices per edge on average.
+    """
+    rand = random.Random(seed)
+    lon, lat = [116.3], [39.9]
+    for _ in range(corners):
+        dx, dy = rand.uniform(-1e-2, 1e-2), rand.uniform(-1e-2, 1e-2)
+        for t in range(1, rand.randrange(1, 2 * step)):
+            lon.append(lon[-1] + dx / 50)
+            lat.append(lat[-1] + dy / 50)
+    return TrajectoryArray(lon, lat)
+
+
+class TestSimplification(TestCase):
+    def setUp(self):
+        print("test simplification start")
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_collinear(self):
+        # test_get_simplified_traj of the WASM crate
+        longitude = [12.44574999315478, 12.44582263021672, 12.447169887583774, 12.44574999315478]
+        latitude = [52.70388691210494, 52.70387212360696, 52.703597829571315, 52.70388691210494]
+        self.assertEqual([0, 2, 3], collinear_indexes(longitude, latitude, 1e-4).tolist())
+        for count in range(4):
+            self.assertEqual(simplified_traj([0.0] * count, [0.0] * count, 1e-4), collinear_indexes([0.0] * count, [0.0] * count, 1e-4).tolist())
+        for seed in range(20):
+            trajectory = road(20, seed, step=1 + seed * 5)
+            lon, lat = trajectory.longitude.tolist(), trajectory.latitude.tolist()
+            for threshold in (1e-16, 1e-10, 1e-6):
+                self.assertEqual(simplified_traj(lon, lat, threshold), collinear_indexes(lon, lat, threshold).tolist())
+
+    def test_simplified_indexes(self):
+        trajectory = TrajectoryArray([116.0, 116.1], [39.0, 39.1])
+        self.assertEqual([0, 1], simplified_indexes(trajectory, 'collinear', 1e-10).tolist())
+        self.assertEqual([0, 1], simplified_indexes(trajectory, 'none', 0).tolist())
+        with self.assertRaises(ValueError):
+            simplified_indexes(trajectory, 'visvalingam', 0)
+
+    def test_douglas_peucker(self):
+        trajectory = road(50, 1)
+        x, y = project(trajectory.longitude, trajectory.latitude)
+        for tolerance in (0.5, 10.0):
+            kept = douglas_peucker_indexes(trajectory.longitude, trajectory.latitude, tolerance)
+            self.assertEqual((0, len(trajectory) - 1), (kept[0], kept[-1]))
+            self.assertLess(len(kept), len(trajectory) / 5)
+            # every dropped point is within tolerance of the segment between its kept neighbors
+            for first, last in zip(kept[:-1], kept[1:]):
+                dx, dy = x[last] - x[first], y[last] - y[first]
+                for k in range(first + 1, last):
+                    px, py = x[k] - x[first], y[k] - y[first]
+                    t = min(1, max(0, (px * dx + py * dy) / (dx * dx + dy * dy)))
+                    self.assertLessEqual(math.hypot(px - t * dx, py - t * dy), tolerance)
+        # a u-turn keeps its far end
+        u_turn = TrajectoryArray([116.0, 116.001, 116.002, 116.001, 116.0], [39.9] * 5)
+        self.assertEqual([0, 2, 4], douglas_peucker_indexes(u_turn.longitude, u_turn.latitude, 1.0).tolist())
+
+    def test_sidecar(self):
+        raw_traj = TrajectoryArray([116.3], [39.9], [1])
+        matching_result = [('STMatching', road(20, 1)), ('GHMapMatching', TrajectoryArray([116.3, 116.4], [39.9, 39.9]))]
+        simplified = [simplified_indexes(matching_result[0][1], 'collinear', 1e-10), None]
+        sidecar_path = os.path.join(self.folder.name, 'a.txt.mmd')
+        write_sidecar(sidecar_path, 'abc', 'a.txt', raw_traj, matching_result, simplified=simplified)
+        sidecar = MatchingSidecar(sidecar_path)
+        (_, served), (_, unchanged) = sidecar.matching_result
+        self.assertEqual(matching_result[0][1].take(simplified[0]).to_list(), served.to_list())
+        self.assertEqual(matching_result[1][1].to_list(), unchanged.to_list())
+        self.assertEqual(matching_result[0][1].to_list(), sidecar.original_matching_result[0][1].to_list())
+        self.assertEqual(sidecar.to_dict(), json.loads(''.join(sidecar.iter_json())))
+        json_path = os.path.join(self.folder.name, 'a.txt.json')
+        export_json(sidecar_path, json_path)
+        with open(json_path, 'r') as f:
+            self.assertEqual(sidecar.to_dict(original=True), json.load(f))
+
+    def test_benchmark(self):
+        trajectory = road(1000, 2)
+        lon, lat = trajectory.longitude.tolist(), trajectory.latitude.tolist()
+        start = time.perf_counter()
+        expected = simplified_traj(lon, lat, 1e-10)
+        loop_time = time.perf_counter() - start
+        start = time.perf_counter()
+        kept = simplified_indexes(trajectory, 'collinear', 1e-10)
+        numpy_time = time.perf_counter() - start
+        self.assertEqual(expected, kept.tolist())
+        payload = len(json.dumps(trajectory.to_list()))
+        simplified_payload = len(json.dumps(trajectory.take(kept).to_list()))
+        print("%s points: %s kept, loop %.4fs, numpy %.4fs, payload %.0f KB -> %.0f KB" % (
+            len(trajectory), len(kept), loop_time, numpy_time, payload / 1024, simplified_payload / 1024))
+        self.assertLess(simplified_payload * 5, payload)
+        # wall-clock, depends on the machine
+        if os.environ.get('MMD_BENCHMARK'):
+            self.assertLess(numpy_time, loop_time)
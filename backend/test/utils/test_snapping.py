@@ -0,0 +1,107 @@
+import os
+import random
+import time
+from unittest import TestCase
+import numpy as np
+from api.models.coordinate import Coordinate
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.lcs import lcs
+from api.utils.mlcs import mlcs
+from api.utils.snapping import SnapGrid, snap_sequences
+
+
+class RoundedCoordinate(Coordinate):
+    """
+    The round(x, 6) comparison of scripts/ieee_test.py.
+    """
+    def __eq__(self, other):
+        return round(float(self.longitude), 6) == round(float(other.longitude), 6) and \
+            round(float(self.latitude), 6) == round(float(other.latitude), 6)
+
+    def __hash__(self):
+        return hash((round(float(self.longitude), 6), round(float(self.latitude), 6)))
+
+
+def classic_lcs_length(a, b):
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            lengths[i + 1][j + 1] = lengths[i][j] + 1 if x == y else max(lengths[i + 1][j], lengths[i][j + 1])
+    return lengths[-1][-1]
+
+
+def matcher_output(vertices, seed, formatting):
+    rand = random.Random(seed)
+    output = []
+    for lon, lat in vertices:
+        if rand.random() < 0.9:
+            # same vertex, printed differently and with float noise far below epsilon
+            output.append(Coordinate(formatting % (lon + rand.uniform(-1e-8, 1e-8)), formatting % lat))
+    return output
+
+
+class TestSnapping(TestCase):
+    def setUp(self):
+        print("test snapping start")
+        rand = random.Random(0)
+        self.vertices = [(116 + rand.randrange(200) * 1e-4, 39.9 + rand.randrange(3) * 1e-4) for _ in range(400)]
+
+    def test_keys(self):
+        grid = SnapGrid(1e-6)
+        keys = grid.keys([116.3, 116.300000, 116.3000004, 116.300002], [39.9, 39.90000000001, 39.9, 39.9])
+        self.assertEqual([0, 0, 0, 1], keys.tolist())
+        # across a cell boundary: the neighbor check gives the key of the point in the other cell
+        left, right = 2e-6 - 1e-9, 2e-6 + 1e-9
+        self.assertEqual(grid.keys([left], [0.0])[0], grid.keys([right], [0.0])[0])
+        self.assertNotEqual(grid.keys([0.0], [0.0])[0], grid.keys([3e-6], [0.0])[0])
+        self.assertEqual(0, len(grid.keys([], [])))
+        with self.assertRaises(ValueError):
+            SnapGrid(0)
+
+    def test_sequences(self):
+        coordinates = [Coordinate('116.3', '39.9'), Coordinate('116.3000001', '39.9')]
+        trajectory = TrajectoryArray(np.array([116.3, 116.31]), np.array([39.9, 39.9]))
+        a, b, c = snap_sequences([coordinates, trajectory, [(116.31, 39.9)]])
+        self.assertEqual([0, 0], a)
+        self.assertEqual([0, 1], b)
+        self.assertEqual([1], c)
+
+    def test_order(self):
+        # the second point takes the key of the first one from the neighbor cell, the third one
+        # starts its cell: the second point must keep its key in the next sequence
+        first, second = snap_sequences([[(116.0000009, 39.9), (116.0000011, 39.9), (116.00000195, 39.9)],
+                                        [(116.0000011, 39.9)]], epsilon=1e-6)
+        self.assertEqual(first[1], second[0])
+        self.assertEqual([0, 0, 1], first)
+
+    def test_lcs_and_mlcs(self):
+        a = matcher_output(self.vertices, 1, '%.6f')
+        b = matcher_output(self.vertices, 2, '%.9f')
+        c = matcher_output(self.vertices, 3, '%r')
+        # the string comparison hardly matches anything
+        self.assertLess(len(lcs(a, b)[0]), 10)
+        keys = snap_sequences([a, b, c])
+        expected = classic_lcs_length([RoundedCoordinate(p.longitude, p.latitude) for p in a],
+                                      [RoundedCoordinate(p.longitude, p.latitude) for p in b])
+        self.assertEqual(expected, len(lcs(keys[0], keys[1])[0]))
+        result, indexes = mlcs(keys)
+        self.assertGreater(len(result), len(self.vertices) * 0.6)
+        for k, index in enumerate(indexes):
+            self.assertEqual(result, [keys[k][i] for i in index])
+
+    def test_benchmark(self):
+        a = matcher_output(self.vertices * 2, 1, '%.6f')
+        b = matcher_output(self.vertices * 2, 2, '%.9f')
+        start = time.perf_counter()
+        expected = classic_lcs_length([RoundedCoordinate(p.longitude, p.latitude) for p in a],
+                                      [RoundedCoordinate(p.longitude, p.latitude) for p in b])
+        classic_time = time.perf_counter() - start
+        start = time.perf_counter()
+        keys = snap_sequences([a, b])
+        self.assertEqual(expected, len(lcs(keys[0], keys[1])[0]))
+        snap_time = time.perf_counter() - start
+        print("%s x %s points: round() in __eq__ %.3fs, snapped keys + bit-parallel lcs %.4fs" % (
+            len(a), len(b), classic_time, snap_time))
+        # wall-clock, depends on the machine
+        if os.environ.get('MMD_BENCHMARK'):
+            self.assertLess(snap_time * 10, classic_time)
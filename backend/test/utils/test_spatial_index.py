@@ -0,0 +1,129 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from unittest import TestCase, mock
+import numpy as np
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.matching_store import write_sidecar
+from api.utils.spatial_index import SpatialIndex, index_folder, segment_distances, segments_in_bbox
+
+
+def walk(rand, size, step=1e-3):
+    lon, lat = [rand.uniform(116.0, 116.5)], [rand.uniform(39.7, 40.2)]
+    for _ in range(size - 1):
+        lon.append(lon[-1] + rand.uniform(-step, step))
+        lat.append(lat[-1] + rand.uniform(-step, step))
+    return TrajectoryArray(lon, lat)
+
+
+def crosses(trajectory, bbox):
+    """
+    Brute force, sampled along every segment.
+    """
+    t = np.linspace(0, 1, 201)
+    lon, lat = trajectory.longitude, trajectory.latitude
+    if len(lon) == 1:
+        lon, lat = np.repeat(lon, 2), np.repeat(lat, 2)
+    for k in range(len(lon) - 1):
+        x = lon[k] + t * (lon[k + 1] - lon[k])
+        y = lat[k] + t * (lat[k + 1] - lat[k])
+        if ((x >= bbox[0]) & (x <= bbox[2]) & (y >= bbox[1]) & (y <= bbox[3])).any():
+            return True
+    return False
+
+
+class TestSpatialIndex(TestCase):
+    def setUp(self):
+        print("test spatial index start")
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'spatial.sqlite')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_segments(self):
+        segments = np.array([[0, 0, 2, 2], [0, 2, 2, 0], [3, 0, 3, 3], [0, 3, 3, 3], [1.5, 1.5, 1.5, 1.5], [-1, 1, 1.5, 1], [-1, 1, 0.5, 1]], dtype=float)
+        self.assertEqual([True, True, False, False, True, True, False], segments_in_bbox(segments, (1, 1, 2, 2)).tolist())
+        # 0.001 degree of latitude is about 111 m
+        distances = segment_distances(np.array([[116.0, 39.9, 116.0, 39.9], [115.99, 39.901, 116.01, 39.901]]), 116.0, 39.9)
+        self.assertAlmostEqual(0, distances[0])
+        self.assertAlmostEqual(111.2, distances[1], delta=0.1)
+
+    def test_search(self):
+        rand = random.Random(1)
+        trajectories = {}
+        with SpatialIndex(self.path) as index:
+            for i in range(60):
+                trajectories['t%d.txt' % i] = [('raw', walk(rand, rand.randrange(1, 40))), ('STMatching', walk(rand, 20))]
+                index.replace('t%d.txt' % i, trajectories['t%d.txt' % i])
+            # replacing keeps one entry per name
+            trajectories['t0.txt'] = [('raw', walk(rand, 10))]
+            index.replace('t0.txt', trajectories['t0.txt'])
+            index.remove('t1.txt')
+            del trajectories['t1.txt']
+        with SpatialIndex(self.path) as index:
+            self.assertEqual(59, len(index))
+            for _ in range(30):
+                min_lon, min_lat = rand.uniform(116.0, 116.5), rand.uniform(39.7, 40.2)
+                bbox = (min_lon, min_lat, min_lon + rand.uniform(0, 0.05), min_lat + rand.uniform(0, 0.05))
+                expected = [{'name': name, 'sources': sorted(source for source, trajectory in sources if crosses(trajectory, bbox))}
+                            for name, sources in sorted(trajectories.items())]
+                self.assertEqual([result for result in expected if result['sources']], index.search_bbox(bbox))
+                raw = [{'name': result['name'], 'sources': ['raw']} for result in expected if 'raw' in result['sources']]
+                self.assertEqual(raw, index.search_bbox(bbox, ['raw']))
+            # everything is inside the whole area
+            self.assertEqual(59, len(index.search_bbox((115, 39, 118, 41))))
+            name, sources = 't5.txt', trajectories['t5.txt']
+            point = sources[1][1][3]
+            self.assertIn({'name': name, 'sources': ['STMatching']},
+                          index.search_point(point.longitude, point.latitude, 1.0, ['STMatching']))
+            self.assertEqual([], index.search_point(0, 0, 1000))
+
+    def test_transactions(self):
+        rand = random.Random(3)
+        with SpatialIndex(self.path) as index:
+            index.replace('a.txt', [('raw', walk(rand, 30))])
+            # the write lock is released after every trajectory
+            other = sqlite3.connect(self.path, timeout=0)
+            other.execute('BEGIN IMMEDIATE')
+            other.rollback()
+            # a failed replace is rolled back, the previous entry stays
+            with mock.patch('api.utils.spatial_index.segment_rows', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+                index.replace('a.txt', [('raw', walk(rand, 30))])
+            self.assertFalse(index.connection.in_transaction)
+            self.assertEqual([{'name': 'a.txt', 'sources': ['raw']}], index.search_bbox((115, 39, 118, 41)))
+            index.remove('a.txt')
+            self.assertFalse(index.connection.in_transaction)
+            self.assertEqual(0, len(index))
+            self.assertEqual(0, other.execute('SELECT count(*) FROM segment').fetchone()[0])
+            other.close()
+
+    def test_folder(self):
+        raw_traj = TrajectoryArray([116.0, 116.001], [39.9, 39.9], [1, 2])
+        matching_result = [('STMatching', TrajectoryArray([116.0, 116.001], [39.9, 39.9]))]
+        write_sidecar(os.path.join(self.folder.name, 'a.txt.mmd'), 'abc', 'a.txt', raw_traj, matching_result)
+        self.assertEqual(1, index_folder(self.folder.name, self.path))
+        with SpatialIndex(self.path) as index:
+            self.assertEqual([{'name': 'a.txt', 'sources': ['STMatching', 'raw']}],
+                             index.search_bbox((116.0005, 39.8, 116.0006, 40.0)))
+
+    def test_benchmark(self):
+        rand = random.Random(2)
+        start = time.perf_counter()
+        with SpatialIndex(self.path) as index:
+            for i in range(500):
+                index.replace('t%d.txt' % i, [('raw', walk(rand, 400, 1e-4)), ('STMatching', walk(rand, 400, 1e-4))])
+        build_time = time.perf_counter() - start
+        with SpatialIndex(self.path) as index:
+            start = time.perf_counter()
+            for _ in range(100):
+                min_lon, min_lat = rand.uniform(116.0, 116.5), rand.uniform(39.7, 40.2)
+                index.search_bbox((min_lon, min_lat, min_lon + 0.01, min_lat + 0.01))
+            query_time = (time.perf_counter() - start) / 100
+            self.assertEqual(500, len(index))
+        print("500 trajectories, %s segments: build %.2fs, bbox query %.2f ms" % (500 * 2 * 399, build_time, query_time * 1000))
+        # wall-clock, depends on the machine
+        if os.environ.get('MMD_BENCHMARK'):
+            self.assertLess(query_time, 0.05)
@@ -0,0 +1,60 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+import numpy as np
+from api.utils.track_reader import iter_track, parse_track, read_track
+
+
+class TestTrackReader(TestCase):
+    def setUp(self):
+        print("test track reader start")
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, name, lines):
+        path = os.path.join(self.folder.name, name)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_formats(self):
+        csv_path = self.write('a.txt', ['116.1,39.9,1183524462', ' 116.2 , 39.8 ,1183524467'])
+        ieee_path = self.write('a.track', ['11.04\t47.65\t1183524462.7', '11.05\t47.66\t1183524463.2'])
+        matching_path = self.write('STMatching-a.txt', ['116.1 39.9', '116.2  39.8 '])
+        self.assertEqual([1183524462, 1183524467], read_track(csv_path, 'csv').timestamp.tolist())
+        self.assertEqual([1183524462, 1183524463], read_track(ieee_path, 'ieee').timestamp.tolist())
+        matched = read_track(matching_path, 'matching')
+        self.assertIsNone(matched.timestamp)
+        self.assertEqual([{'longitude': 116.1, 'latitude': 39.9}, {'longitude': 116.2, 'latitude': 39.8}], matched.to_list())
+        self.assertEqual(0, len(read_track(self.write('empty.txt', []), 'csv')))
+        with self.assertRaises(ValueError):
+            read_track(csv_path, 'gpx')
+
+    def test_bad_lines(self):
+        lines = ['116.%d,39.9,%d' % (i, i) for i in range(10)]
+        lines.insert(4, 'not,a,point')
+        lines.insert(7, '116.1,39.9')
+        lines.insert(8, '')
+        errors = []
+        trajectory = read_track(self.write('a.txt', lines), 'csv', on_error=lambda number, line: errors.append(number))
+        self.assertEqual(list(range(10)), trajectory.timestamp.tolist())
+        self.assertEqual([5, 8], errors)
+        errors.clear()
+        self.assertEqual(10, len(parse_track(lines, 'csv', on_error=lambda number, line: errors.append(number))))
+        self.assertEqual([5, 8], errors)
+
+    def test_iter_track(self):
+        rand = random.Random(1)
+        lines = ['%.6f\t%.6f\t%d' % (rand.uniform(116, 117), rand.uniform(39, 40), i) for i in range(1000)]
+        lines[500] = '116.1\tbad\t500'
+        path = self.write('a.track', lines)
+        errors = []
+        chunks = list(iter_track(path, 'ieee', chunk_lines=128, on_error=lambda number, line: errors.append(number)))
+        self.assertEqual(8, len(chunks))
+        self.assertTrue(all(len(chunk) <= 128 for chunk in chunks))
+        self.assertEqual([501], errors)
+        timestamps = np.concatenate([chunk.timestamp for chunk in chunks])
+        self.assertEqual([i for i in range(1000) if i != 500], timestamps.tolist())
@@ -0,0 +1,62 @@
+import random
+import time
+import tracemalloc
+from unittest import TestCase
+import numpy as np
+from api.models.coordinate import TimestampCoordinate
+from api.models.trajectory import SubTrajectory
+from api.utils.track_reader import parse_track
+
+
+def raw_lines(size, seed):
+    rand = random.Random(seed)
+    return ['%.6f,%.6f,%d' % (rand.uniform(116, 117), rand.uniform(39, 40), 1183524462 + i) for i in range(size)]
+
+
+class TestTrajectoryArray(TestCase):
+    def setUp(self):
+        print("test trajectory array start")
+
+    def test_parse(self):
+        lines = raw_lines(100, 1)
+        trajectory = parse_track(lines, 'csv')
+        self.assertEqual(100, len(trajectory))
+        for line, point in zip(lines, trajectory.to_list()):
+            longitude, latitude, timestamp = line.split(',')
+            self.assertEqual({'longitude': float(longitude), 'latitude': float(latitude), 'timestamp': int(timestamp)}, point)
+        self.assertEqual(trajectory[3].to_dict(), trajectory.to_list()[3])
+        self.assertEqual(trajectory[-1], trajectory[99])
+
+    def test_sub_trajectory_is_view(self):
+        trajectory = parse_track(raw_lines(50, 3), 'csv')
+        sub_trajectory = SubTrajectory(0, trajectory, 10, 19)
+        self.assertEqual(10, len(sub_trajectory.trajectory))
+        self.assertTrue(np.shares_memory(sub_trajectory.trajectory.longitude, trajectory.longitude))
+        self.assertTrue(np.shares_memory(sub_trajectory.trajectory.timestamp, trajectory.timestamp))
+        self.assertEqual(trajectory.to_list()[10:20], sub_trajectory.to_dict()['trajectory'])
+
+    def test_memory(self):
+        """
+        100k points, TrajectoryArray vs TimestampCoordinate objects
+        """
+        lines = raw_lines(100000, 4)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        coordinates = [TimestampCoordinate(*line.split(',')) for line in lines]
+        object_time = time.perf_counter() - start
+        object_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        trajectory = parse_track(lines, 'csv')
+        array_time = time.perf_counter() - start
+        array_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print("100k points: objects %.1f MB in %.3fs, array %.1f MB in %.3fs" % (
+            object_size / 2**20, object_time, array_size / 2**20, array_time))
+        self.assertEqual(len(coordinates), len(trajectory))
+        self.assertEqual(2400000, trajectory.nbytes)
+        self.assertLess(array_size * 10, object_size)
@@ -0,0 +1,79 @@
+import math
+import random
+from unittest import TestCase
+from api.models.coordinate import Coordinate
+from api.models.trajectory import SubTrajectory, Trajectory
+from api.models.trajectory_array import TrajectoryArray
+from api.utils.trajectory import GEOHASH_ALPHABET, geohash_cells, get_bounds, parse_bbox, trajectory_summary
+
+
+def geohash(longitude, latitude, precision):
+    """
+    Textbook geohash, one bit at a time.
+    """
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    code, bits, even = '', 0, True
+    for bit in range(5 * precision):
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            interval[0] = middle
+        else:
+            bits = bits * 2
+            interval[1] = middle
+        even = not even
+        if bit % 5 == 4:
+            code += GEOHASH_ALPHABET[bits]
+            bits = 0
+    return code
+
+
+class TestTrajectorySummary(TestCase):
+    def setUp(self):
+        print("test trajectory summary start")
+
+    def test_geohash(self):
+        self.assertEqual(['wx4g09'], geohash_cells([116.3974], [39.9087], 6))
+        self.assertEqual(['u4pruydqqvj'], geohash_cells([10.40744], [57.64911], 11))
+        rand = random.Random(1)
+        longitude = [rand.uniform(-180, 180) for _ in range(200)]
+        latitude = [rand.uniform(-90, 90) for _ in range(200)]
+        for precision in (1, 6, 9):
+            expected = sorted({geohash(lon, lat, precision) for lon, lat in zip(longitude, latitude)})
+            self.assertEqual(expected, geohash_cells(longitude, latitude, precision))
+        self.assertEqual([], geohash_cells([], [], 6))
+
+    def test_summary(self):
+        # 0.01 degree of latitude is about 1112 m
+        trajectory = TrajectoryArray([116.0, 116.0, 116.0], [39.90, 39.91, 39.92], [100, 160, 220])
+        summary = trajectory_summary(trajectory)
+        self.assertEqual([[116.0, 39.9], [116.0, 39.92]], summary['bbox'])
+        self.assertEqual(3, summary['point_count'])
+        self.assertAlmostEqual(2 * 1111.95, summary['length'], delta=0.5)
+        self.assertEqual(120, summary['duration'])
+        self.assertAlmostEqual(summary['length'] / 120, summary['mean_speed'], places=3)
+        self.assertEqual(sorted({geohash(116.0, lat, 6) for lat in (39.90, 39.91, 39.92)}), summary['geohashes'])
+
+        single = trajectory_summary(TrajectoryArray([116.0], [39.9], [100]))
+        self.assertEqual((0.0, 0, None), (single['length'], single['duration'], single['mean_speed']))
+        empty = trajectory_summary(TrajectoryArray.empty())
+        self.assertEqual((None, 0, []), (empty['bbox'], empty['point_count'], empty['geohashes']))
+
+    def test_bounds(self):
+        coordinates = [Coordinate('116.5', '39.1'), Coordinate('116.25', '39.75'), Coordinate('116.75', '39.5')]
+        self.assertEqual([[116.25, 39.1], [116.75, 39.75]], get_bounds(coordinates))
+        self.assertEqual([[None, None], [None, None]], get_bounds([]))
+        self.assertEqual([116.0, 39.0, 117.0, 40.0], parse_bbox('116,39,117,40'))
+        for value in ('116,39,117', '117,39,116,40', 'a,b,c,d'):
+            with self.assertRaises(ValueError):
+                parse_bbox(value)
+
+        trajectory = Trajectory('a.txt', '')
+        self.assertEqual({'longitude': 180, 'latitude': -90}, trajectory.to_dict()['bounds']['left_top'])
+        matched = TrajectoryArray([116.0, 116.2, 116.1, 116.4], [39.5, 39.1, 39.9, 39.3])
+        trajectory.common_trajs = [SubTrajectory(0, matched, 0, 1), SubTrajectory(1, matched, 2, 2)]
+        bounds = trajectory.to_dict()['bounds']
+        self.assertEqual({'longitude': 116.0, 'latitude': 39.9}, bounds['left_top'])
+        self.assertEqual({'longitude': 116.2, 'latitude': 39.1}, bounds['right_bottom'])
+        self.assertTrue(math.isfinite(bounds['right_bottom']['longitude']))
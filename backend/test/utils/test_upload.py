@@ -0,0 +1,77 @@
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+from unittest import TestCase
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.test import encode_multipart
+from api.utils.upload import UploadSession, UploadTooLarge, receive_upload
+
+
+def track(size, seed=0):
+    return ''.join('%.6f,%.6f,%d\n' % (116.3 + i * 1e-4, 39.9 + seed * 1e-3, 1183524462 + i * 5) for i in range(size)).encode()
+
+
+class TestUpload(TestCase):
+    def setUp(self):
+        print("test upload start")
+        self.folder = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.folder.name, 'input')
+        os.makedirs(self.input_path)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def upload(self, files, file_max_bytes=10**6, max_bytes=10**8):
+        boundary, body = encode_multipart(MultiDict([
+            ('files', FileStorage(io.BytesIO(content), filename)) for filename, content in files
+        ] + [('comment', 'ignored')]))
+        session = UploadSession(self.input_path, 'csv', file_max_bytes, max_bytes)
+        receive_upload(io.BytesIO(body), boundary.encode(), session, os.path.join(self.folder.name, 'bundle'))
+        return session
+
+    def test_files(self):
+        session = self.upload([('a.txt', track(100)), ('../b.txt', track(3)), ('bad.txt', b'x,y\n'), ('a.txt', track(5))])
+        accepted = session.results()
+        self.assertEqual(['a.txt', 'b.txt'], [name for name, _ in accepted])
+        # the first a.txt is accepted, the second one is rejected under its own key
+        self.assertEqual({'bad.txt', 'a.txt (duplicate)'}, set(session.rejected))
+        self.assertEqual(['a.txt', 'b.txt'], sorted(os.listdir(self.input_path)))
+        with open(os.path.join(self.input_path, 'a.txt'), 'rb') as f:
+            self.assertEqual(track(100), f.read())
+
+        # both reasons are kept when the first file of the name is invalid
+        session = self.upload([('c.txt', b'x,y\n'), ('c.txt', track(5))])
+        self.assertEqual([], session.results())
+        self.assertEqual(['c.txt', 'c.txt (duplicate)'], sorted(session.rejected))
+        self.assertEqual('duplicate name', session.rejected['c.txt (duplicate)'])
+
+    def test_bundles(self):
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for i in range(500):
+                bundle.writestr('tracks/t%03d.txt' % i, track(20, i))
+        tar_buffer = io.BytesIO()
+        with tarfile.open(fileobj=tar_buffer, mode='w:gz') as bundle:
+            for i in range(20):
+                content = track(20, i)
+                info = tarfile.TarInfo('tracks/s%02d.txt' % i)
+                info.size = len(content)
+                bundle.addfile(info, io.BytesIO(content))
+        session = self.upload([('tracks.zip', zip_buffer.getvalue()), ('tracks.tar.gz', tar_buffer.getvalue())])
+        self.assertEqual(520, len(session.results()))
+        self.assertEqual({}, session.rejected)
+        self.assertEqual(520, len(os.listdir(self.input_path)))
+        self.assertFalse(os.path.exists(os.path.join(self.folder.name, 'bundle')))
+
+    def test_limits(self):
+        with self.assertRaises(UploadTooLarge):
+            self.upload([('a.txt', track(100))], file_max_bytes=1000)
+        with self.assertRaises(UploadTooLarge):
+            self.upload([('a%d.txt' % i, track(100, i)) for i in range(5)], max_bytes=10000)
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            bundle.writestr('zeros.txt', b'0' * 10**6)
+        with self.assertRaises(UploadTooLarge):
+            self.upload([('bomb.zip', zip_buffer.getvalue())], file_max_bytes=10**5)
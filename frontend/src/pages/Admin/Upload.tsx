@@ -24,9 +24,13 @@ enum MatchingStatus {
   uploading,
   waiting,
   downloading,
+  processing,
   working,
 }
 
+// the upload only queues a job, its results are polled from the data group
+const POLL_INTERVAL = 2000;
+
 const Upload = () => {
   // hooks (theme, i18n)
   const { t } = useTranslation();
@@ -40,15 +44,40 @@ const Upload = () => {
   const [hasSaved, setHasSaved] = useState<boolean>(true);
 
   useEffect(() => {
-    if (groupHashid && successTrajNames.length == 0 && failedTrajNames.length == 0) {
-      api.group.getDataGroup(groupHashid).then(({ detail }) => {
-        let { group_id: task_id, matching_result } = detail as GroupDetail;
-        setSuccessTrajNames(matching_result.success);
-        setFailedTrajNames(matching_result.failed);
-        setMatchingStatus(MatchingStatus.working);
-        setTask(task_id);
-      });
+    if (!groupHashid) {
+      return;
     }
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    let cancelled = false;
+    const poll = () => {
+      api.group
+        .getDataGroup(groupHashid)
+        .then(({ detail }) => {
+          if (cancelled) {
+            return;
+          }
+          let { group_id: task_id, finished, failed, matching_result } = detail as GroupDetail;
+          setSuccessTrajNames(matching_result.success);
+          setFailedTrajNames(matching_result.failed);
+          setTask(task_id);
+          // group JSON written before background jobs has no finished key
+          if (finished !== false) {
+            failed && toast.error(`Matching task ${task_id} failed`, { id: 'matchingJob' });
+            setMatchingStatus(MatchingStatus.working);
+          } else {
+            setMatchingStatus(MatchingStatus.processing);
+            timer = setTimeout(poll, POLL_INTERVAL);
+          }
+        })
+        .catch(() => {
+          !cancelled && setMatchingStatus(MatchingStatus.idling);
+        });
+    };
+    poll();
+    return () => {
+      cancelled = true;
+      timer && clearTimeout(timer);
+    };
   }, [groupHashid]);
 
   /**
@@ -94,11 +123,11 @@ const Upload = () => {
    * @see {@link https://react-dropzone.js.org/#section-previews}
    */
   const { getRootProps, getInputProps } = useDropzone({
-    accept: 'text/*',
+    accept: ['text/*', '.zip', '.tar.gz', '.tgz'],
     onDrop: (acceptedFiles, fileRejections) => {
       setMatchingStatus(MatchingStatus.uploading);
       if (fileRejections.length > 0) {
-        toast('Only text/* will be accepted', { id: 'dropZone' });
+        toast('Only text/* or .zip / .tar.gz bundles will be accepted', { id: 'dropZone' });
       }
       if (acceptedFiles.length > 0) {
         let formData = new FormData();
@@ -106,12 +135,12 @@ const Upload = () => {
         api.group
           .uploadDataGroup(formData, matchingConfig)
           .then(({ detail }) => {
-            let { group_id: task_id, matching_result } = detail as GroupDetail;
+            let { group_id: task_id } = detail as GroupDetail;
             toast(`Matching task ${task_id} is submitted`, { id: 'dropZone' });
             setTask(task_id);
-            setSuccessTrajNames(matching_result.success);
-            setFailedTrajNames(matching_result.failed);
-            setMatchingStatus(MatchingStatus.working);
+            setSuccessTrajNames([]);
+            setFailedTrajNames([]);
+            setMatchingStatus(MatchingStatus.processing);
             setHasSaved(false);
             navigate(`/admin/upload/${task_id}`);
           })
@@ -171,6 +200,8 @@ const Upload = () => {
                       ? 'Uploading'
                       : matchingStatus === MatchingStatus.waiting
                       ? 'Waiting Server'
+                      : matchingStatus === MatchingStatus.processing
+                      ? `Processing (${successTrajNames.length + failedTrajNames.length} done)`
                       : 'Downloading'}
                   </p>
                 </div>
@@ -178,7 +209,8 @@ const Upload = () => {
             )}
           </div>
 
-          {matchingStatus === MatchingStatus.working &&
+          {(matchingStatus === MatchingStatus.working ||
+            matchingStatus === MatchingStatus.processing) &&
             successTrajNames
               .sort((a, b) => a.localeCompare(b))
               .map((successTrajName) => (
@@ -200,7 +232,8 @@ const Upload = () => {
                   </div>
                 </div>
               ))}
-          {matchingStatus === MatchingStatus.working &&
+          {(matchingStatus === MatchingStatus.working ||
+            matchingStatus === MatchingStatus.processing) &&
             failedTrajNames
               .sort((a, b) => a.localeCompare(b))
               .map((failedTrajName) => (
@@ -1223,7 +1223,7 @@ export default function Annotation() {
                     className="btn btn-primary btn-sm"
                     onClick={() => {
                       setShowModal(false);
-                      api.task.getTasks(1, 1).then(({ detail }) => {
+                      api.task.claimTasks(1).then(({ detail }) => {
                         const tasks = detail as TaskDetail[];
                         if (tasks.length > 0) {
                           setIsLoading(true);
@@ -9,7 +9,7 @@ export const getDataGroup = (groupHashid: string | undefined) =>
  * Map matching (run LCSS in wasm)
  * @param formData files
  * @param config show axios process
- * @returns success and failed list
+ * @returns group detail with the queued job_id, poll getDataGroup until it is finished
  */
 export const uploadDataGroup = (formData: FormData, config: AxiosRequestConfig) =>
   axiosInstance.post<unknown, AxiosResponseData<GroupDetail>>('data_groups', formData, config);
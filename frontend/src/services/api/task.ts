@@ -5,3 +5,8 @@ export const getTasks = (type: TaskType, size?: number) =>
   axiosInstance.get<unknown, AxiosResponseData<TaskDetail[]>>('tasks', {
     params: size ? { type: type, size: size } : { type: type },
   });
+
+export const claimTasks = (size?: number) =>
+  axiosInstance.post<unknown, AxiosResponseData<TaskDetail[]>>('tasks/claim', null, {
+    params: size ? { size: size } : {},
+  });
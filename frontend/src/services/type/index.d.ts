@@ -45,6 +45,9 @@ export interface MatchingResultDetail {
 
 export interface GroupDetail {
   group_id: string;
+  finished?: boolean;
+  failed?: boolean;
+  job_id?: string;
   matching_result: {
     success: string[];
     failed: string[];